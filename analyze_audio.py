@@ -7,13 +7,8 @@ import os
 import yaml
 from pathlib import Path
 
-try:
-    import librosa
-    import numpy as np
-    HAS_LIBROSA = True
-except ImportError:
-    HAS_LIBROSA = False
-    print("警告: librosa 未安装，将使用 mutagen 获取基本信息")
+from audio_features import format_duration
+from feature_store import get_feature_store
 
 try:
     from mutagen.mp3 import MP3
@@ -466,24 +461,21 @@ def get_volume_level(db: float) -> str:
         return "weak"
 
 
-def analyze_audio_librosa(filepath: str) -> dict:
-    """使用 librosa 分析音频文件"""
+def analyze_audio_features(filepath: str) -> dict:
+    """从特征库读取时长、音量、响度等特征，缺失时解码一次计算"""
     try:
-        y, sr = librosa.load(filepath, sr=None)
-        duration = len(y) / sr
-        rms = librosa.feature.rms(y=y)[0]
-        avg_rms = np.mean(rms)
-        db = librosa.amplitude_to_db(np.array([avg_rms]))[0]
-        volume_level = get_volume_level(db)
-        return {
-            "duration_seconds": round(duration, 2),
-            "duration_formatted": f"{int(duration // 60)}:{int(duration % 60):02d}",
-            "volume_db": round(float(db), 2),
-            "volume_level": volume_level,
-        }
+        features = get_feature_store().features(filepath)
     except Exception as e:
-        print(f"librosa 分析失败 {filepath}: {e}")
+        print(f"特征分析失败 {filepath}: {e}")
         return None
+    return {
+        "duration_seconds": features["duration_seconds"],
+        "duration_formatted": format_duration(features["duration_seconds"]),
+        "volume_db": features["mean_db"],
+        "volume_level": get_volume_level(features["mean_db"]),
+        "peak_db": features["peak_db"],
+        "loudness_lufs": features["loudness_lufs"],
+    }
 
 
 def analyze_audio_mutagen(filepath: str) -> dict:
@@ -493,7 +485,7 @@ def analyze_audio_mutagen(filepath: str) -> dict:
         duration = audio.info.length
         return {
             "duration_seconds": round(duration, 2),
-            "duration_formatted": f"{int(duration // 60)}:{int(duration % 60):02d}",
+            "duration_formatted": format_duration(duration),
             "volume_db": None,
             "volume_level": "unknown",
         }
@@ -503,11 +495,10 @@ def analyze_audio_mutagen(filepath: str) -> dict:
 
 
 def analyze_audio(filepath: str) -> dict:
-    """分析音频文件，优先使用 librosa"""
-    if HAS_LIBROSA:
-        result = analyze_audio_librosa(filepath)
-        if result:
-            return result
+    """分析音频文件，解码失败（如缺少 ffmpeg）时退回 mutagen 只读取时长"""
+    result = analyze_audio_features(filepath)
+    if result:
+        return result
     if HAS_MUTAGEN:
         return analyze_audio_mutagen(filepath)
     return None
@@ -546,6 +537,9 @@ def generate_yaml(audio_dir: str, output_file: str):
                 entry["volume_level"] = audio_info["volume_level"]
                 if audio_info["volume_db"] is not None:
                     entry["volume_db"] = audio_info["volume_db"]
+                if audio_info.get("loudness_lufs") is not None:
+                    entry["loudness_lufs"] = audio_info["loudness_lufs"]
+                    entry["peak_db"] = audio_info["peak_db"]
             
             categorized_data[desc["category"]].append(entry)
         else:
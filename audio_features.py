@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+Audio Features - 单次解码的音频特征分析
+
+每个文件只用 ffmpeg 解码一次，所有特征都从同一份 PCM 缓冲区用 NumPy 计算：
+
+- 时长
+- 平均音量 / 峰值（dBFS，平均音量与 ffmpeg volumedetect 的 mean_volume 口径一致）
+- 综合响度（ITU-R BS.1770 K 加权 + 400ms 门限块，LUFS）
+- RMS 随时间变化曲线
+- 频谱质心
+- 各频带能量占比
+- 频谱嵌入向量（各对数频带相对能量的均值与标准差），用于相似音效检索
+- 逐秒的频带能量与 K 加权功率（band_profile），用于不渲染音频预测混音响度（mix_predict）
+
+按 100ms 帧做一次 FFT，K 加权在频域按滤波器幅频响应计算，
+RMS、响度、质心、频带能量共用这次 FFT 的结果。
+
+解码输出按块流式读取并累积（FeatureAccumulator），内存只与块大小有关，
+小时级的长录音也可以分析。
+
+长文件可以用抽样快速分析（analyze_file_sampled），只解码几个均匀分布的窗口并给出误差范围。
+
+用法:
+    python audio_features.py pixabay/heavy-rain-114710.mp3
+    python audio_features.py --fast pixabay/heavy-rain-114710.mp3
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_io import (SAMPLE_RATE, CHANNELS, open_decoder, read_frames, close_process,
+                      decode_file, probe_duration)
+
+# 分析器版本：计算方式变化时递增，用于判断已保存的特征是否过期
+ANALYZER_VERSION = 3
+
+# 抽样快速分析：版本、窗口数和每个窗口的时长（秒）
+FAST_ANALYZER_VERSION = 3
+SAMPLE_WINDOWS = 8
+SAMPLE_WINDOW_SECONDS = 5.0
+# 误差范围的置信水平（95% 对应的 z 值）
+CONFIDENCE_Z = 1.96
+
+# 分析帧长（秒），也是响度门限块的步长
+FRAME_SECONDS = 0.1
+# 响度门限块 = 连续 4 帧（400ms，75% 重叠）
+LOUDNESS_BLOCK_FRAMES = 4
+# RMS 曲线的时间分辨率（秒）
+RMS_CURVE_SECONDS = 1.0
+# 每次 FFT 的帧数，限制临时数组的大小
+FFT_CHUNK_FRAMES = 100
+# 流式分析每次从解码器读取的时长（秒）
+READ_BLOCK_SECONDS = 10.0
+# 响度直方图的范围与分辨率（LUFS）
+LOUDNESS_HIST_RANGE = (-70.0, 10.0)
+LOUDNESS_HIST_STEP = 0.01
+
+# 频带划分（Hz）
+BANDS = (
+    ('sub', 20, 60),
+    ('bass', 60, 250),
+    ('low_mid', 250, 500),
+    ('mid', 500, 2000),
+    ('high_mid', 2000, 6000),
+    ('high', 6000, 20000),
+)
+
+# 嵌入向量：对数间隔频带数与频率范围（Hz）
+EMBEDDING_BANDS = 24
+EMBEDDING_RANGE = (40.0, 16000.0)
+# 低于此均方值（约 -100 dBFS）的静音帧不计入嵌入向量
+EMBEDDING_SILENCE = 1e-10
+
+# BS.1770 的绝对门限与相对门限
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# 静音的 dB 下限，避免 -inf
+DB_FLOOR = -120.0
+
+# BS.1770 K 加权滤波器（48kHz 系数）：高频搁架 + RLB 高通
+_K_STAGES = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285),
+     (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0),
+     (1.0, -1.99004745483398, 0.99007225036621)),
+)
+_K_REFERENCE_RATE = 48000
+
+
+def k_weighting_gain(freqs: np.ndarray) -> np.ndarray:
+    """K 加权在各频率上的功率增益 |H(f)|²（按 48kHz 系数在实际频率处求值，适用于任意采样率）"""
+    z = np.exp(-2j * np.pi * np.asarray(freqs) / _K_REFERENCE_RATE)
+    gain = np.ones(len(z))
+    for b, a in _K_STAGES:
+        h = (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+        gain *= np.abs(h) ** 2
+    return gain
+
+
+def to_db(power, floor: float = DB_FLOOR) -> float:
+    """功率（均方值）转 dB"""
+    if power <= 0:
+        return floor
+    return max(floor, float(10 * np.log10(power)))
+
+
+def format_duration(seconds: float) -> str:
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+
+class LoudnessGate:
+    """
+    BS.1770 门限响度的直方图累积
+
+    400ms 块按响度落入 LOUDNESS_HIST_STEP 宽的直方图（同时累积功率），
+    相对门限在结束时由直方图计算，内存与时长无关。
+    """
+
+    def __init__(self):
+        low, high = LOUDNESS_HIST_RANGE
+        self.bins = int(round((high - low) / LOUDNESS_HIST_STEP))
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.power = np.zeros(self.bins)
+
+    def _bin(self, loudness):
+        index = np.floor((loudness - LOUDNESS_HIST_RANGE[0]) / LOUDNESS_HIST_STEP).astype(int)
+        return np.clip(index, 0, self.bins - 1)
+
+    def add(self, block_power: np.ndarray):
+        """加入若干 400ms 块的 K 加权声道功率和"""
+        block_power = np.asarray(block_power, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(block_power)
+        keep = loudness > ABSOLUTE_GATE_LUFS
+        index = self._bin(loudness[keep])
+        np.add.at(self.counts, index, 1)
+        np.add.at(self.power, index, block_power[keep])
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def integrated(self) -> Optional[float]:
+        """综合响度（LUFS），没有超过绝对门限的块时返回 None"""
+        total = self.counts.sum()
+        if total == 0:
+            return None
+
+        relative_gate = -0.691 + 10 * np.log10(self.power.sum() / total) + RELATIVE_GATE_LU
+        start = int(self._bin(np.array([relative_gate]))[0])
+        count = self.counts[start:].sum()
+        return -0.691 + 10 * np.log10(self.power[start:].sum() / count)
+
+
+def gated_loudness(block_power: np.ndarray) -> Optional[float]:
+    """
+    按 BS.1770 门限计算综合响度
+
+    Args:
+        block_power: 每个 400ms 块的 K 加权声道功率和
+
+    Returns:
+        LUFS，没有超过绝对门限的块时返回 None
+    """
+    gate = LoudnessGate()
+    gate.add(block_power)
+    return gate.integrated()
+
+
+def band_edges(freqs: np.ndarray) -> List[np.ndarray]:
+    """各频带在 rfft 频点上的掩码"""
+    return [(freqs >= low) & (freqs < high) for _, low, high in BANDS]
+
+
+def embedding_matrix(freqs: np.ndarray) -> np.ndarray:
+    """rfft 频点到嵌入频带的汇总矩阵，形状 (频点数, EMBEDDING_BANDS)"""
+    edges = np.geomspace(EMBEDDING_RANGE[0], EMBEDDING_RANGE[1], EMBEDDING_BANDS + 1)
+    index = np.searchsorted(edges, freqs, side='right') - 1
+    matrix = np.zeros((len(freqs), EMBEDDING_BANDS))
+    valid = (index >= 0) & (index < EMBEDDING_BANDS)
+    matrix[np.flatnonzero(valid), index[valid]] = 1.0
+    return matrix
+
+
+def band_matrix(freqs: np.ndarray) -> np.ndarray:
+    """rfft 频点到 BANDS 的汇总矩阵，形状 (频点数, len(BANDS))"""
+    return np.stack(band_edges(freqs), axis=1).astype(np.float64)
+
+
+def _significant(value: float, digits: int = 4) -> float:
+    return float(f"{value:.{digits}g}")
+
+
+def summarize(duration: float, total_ms: float, peak: float, loudness: Optional[float],
+              rms_curve: List[float], spectrum: np.ndarray, freqs: np.ndarray,
+              embedding: Optional[List[float]] = None,
+              band_profile: Optional[Dict] = None) -> Dict:
+    """
+    由累积量得到特征 dict
+
+    Args:
+        total_ms: 全部采样的均方值（各声道平均）
+        peak: 最大采样绝对值
+        loudness: 综合响度（LUFS）
+        rms_curve: RMS 曲线（dBFS）
+        spectrum: 所有帧累加的功率谱
+        freqs: spectrum 对应的频率
+        embedding: 频谱嵌入向量
+        band_profile: 逐秒的频带能量与 K 加权功率
+    """
+    spectrum_total = float(spectrum.sum())
+
+    if spectrum_total > 0:
+        centroid = float((freqs * spectrum).sum() / spectrum_total)
+        bands = {
+            name: round(float(spectrum[mask].sum() / spectrum_total), 4)
+            for (name, _, _), mask in zip(BANDS, band_edges(freqs))
+        }
+    else:
+        centroid = 0.0
+        bands = {name: 0.0 for name, _, _ in BANDS}
+
+    return {
+        'duration_seconds': round(duration, 2),
+        'mean_db': round(to_db(total_ms), 2),
+        'peak_db': round(to_db(peak * peak), 2),
+        'loudness_lufs': round(float(loudness), 2) if loudness is not None else None,
+        'rms_curve': rms_curve,
+        'spectral_centroid_hz': round(centroid, 1),
+        'band_energies': bands,
+        'embedding': embedding,
+        'band_profile': band_profile,
+        'analyzer_version': ANALYZER_VERSION,
+    }
+
+
+class FeatureAccumulator:
+    """
+    逐块累积特征：feed 任意长度的采样块，最后用 result 得到特征
+
+    只保留不足一帧的尾部、最近 3 帧的 K 加权功率（拼成 400ms 块）、
+    累加的功率谱和响度直方图，内存只与块大小有关，与文件长度无关。
+    """
+
+    def __init__(self, rate: int = SAMPLE_RATE):
+        self.rate = rate
+        self.hop = int(rate * FRAME_SECONDS)
+        self.freqs = np.fft.rfftfreq(self.hop, 1 / rate)
+        self._k_gain = k_weighting_gain(self.freqs)
+        # rfft 单边谱的 Parseval 权重：除直流和奈奎斯特外计两次
+        self._parseval = np.full(len(self.freqs), 2.0)
+        self._parseval[0] = 1.0
+        if self.hop % 2 == 0:
+            self._parseval[-1] = 1.0
+
+        self.total_frames = 0
+        self.sum_squares = 0.0
+        self.peak = 0.0
+        self.spectrum = np.zeros(len(self.freqs))
+        self.gate = LoudnessGate()
+        self._embedding_matrix = embedding_matrix(self.freqs)
+        self.embedding_sum = np.zeros(EMBEDDING_BANDS)
+        self.embedding_sumsq = np.zeros(EMBEDDING_BANDS)
+        self.embedding_frames = 0
+
+        self._carry: Optional[np.ndarray] = None
+        self._recent: List[float] = []
+        self._run_frames = 0
+        self._points_per_curve = max(1, int(round(RMS_CURVE_SECONDS / FRAME_SECONDS)))
+        self._curve: List[float] = []
+        self._curve_sum = 0.0
+        self._curve_frames = 0
+        self._band_matrix = band_matrix(self.freqs)
+        self._bands: List[List[float]] = []
+        self._band_sum = np.zeros(len(BANDS))
+        self._k_curve: List[float] = []
+        self._k_sum = 0.0
+
+    def feed(self, samples: np.ndarray):
+        """加入连续的采样，形状 (frames, channels)"""
+        if not len(samples):
+            return
+        self.total_frames += len(samples)
+        self.sum_squares += float(np.square(samples, dtype=np.float64).mean(axis=1).sum())
+        self.peak = max(self.peak, float(np.max(np.abs(samples))))
+
+        if self._carry is not None:
+            samples = np.concatenate([self._carry, samples])
+        n_frames = len(samples) // self.hop
+        for start in range(0, n_frames, FFT_CHUNK_FRAMES):
+            stop = min(n_frames, start + FFT_CHUNK_FRAMES)
+            # (帧, 采样, 声道)
+            self._process(samples[start * self.hop:stop * self.hop].reshape(stop - start, self.hop, -1))
+        rest = samples[n_frames * self.hop:]
+        self._carry = rest.copy() if len(rest) else None
+
+    def _process(self, frames: np.ndarray):
+        hop = self.hop
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2 * self._parseval[None, :, None] / (hop * hop)
+
+        frame_ms = power.sum(axis=1).mean(axis=1)
+        # BS.1770：左右声道权重均为 1，K 加权功率按声道相加
+        frame_k_power = (power * self._k_gain[None, :, None]).sum(axis=(1, 2))
+        mono_power = power.mean(axis=2)
+        self.spectrum += mono_power.sum(axis=0)
+
+        # 嵌入：各频带相对于整帧能量的对数比（与音量无关，只描述频谱形状）
+        audible = frame_ms > EMBEDDING_SILENCE
+        if audible.any():
+            band_power = mono_power[audible] @ self._embedding_matrix
+            shape = np.log10(band_power + EMBEDDING_SILENCE) - np.log10(frame_ms[audible, None])
+            self.embedding_sum += shape.sum(axis=0)
+            self.embedding_sumsq += np.square(shape).sum(axis=0)
+            self.embedding_frames += int(audible.sum())
+
+        # 与之前保留的帧拼成 400ms 块（步长 100ms）
+        history = np.concatenate([self._recent, frame_k_power])
+        n_blocks = len(history) - LOUDNESS_BLOCK_FRAMES + 1
+        if n_blocks > 0:
+            cumsum = np.concatenate([[0.0], np.cumsum(history)])
+            self.gate.add((cumsum[LOUDNESS_BLOCK_FRAMES:] - cumsum[:n_blocks]) / LOUDNESS_BLOCK_FRAMES)
+        self._recent = list(history[-(LOUDNESS_BLOCK_FRAMES - 1):])
+        self._run_frames += len(frames)
+
+        frame_bands = mono_power @ self._band_matrix
+        for ms, bands, k_power in zip(frame_ms, frame_bands, frame_k_power):
+            self._curve_sum += ms
+            self._band_sum += bands
+            self._k_sum += k_power
+            self._curve_frames += 1
+            if self._curve_frames == self._points_per_curve:
+                self._flush_curve()
+
+    def _flush_curve(self):
+        if self._curve_frames:
+            n = self._curve_frames
+            self._curve.append(round(to_db(self._curve_sum / n), 1))
+            self._bands.append([_significant(v / n) for v in self._band_sum])
+            self._k_curve.append(_significant(self._k_sum / n))
+        self._curve_sum = 0.0
+        self._band_sum = np.zeros(len(BANDS))
+        self._k_sum = 0.0
+        self._curve_frames = 0
+
+    def gap(self):
+        """
+        采样在此处不连续（例如跳到下一个分析窗口）
+
+        丢弃不足一帧的尾部，400ms 块不跨越间断；整段不足 400ms 时按整段算一个块。
+        """
+        if 0 < self._run_frames < LOUDNESS_BLOCK_FRAMES:
+            self.gate.add([float(np.mean(self._recent))])
+        self._carry = None
+        self._recent = []
+        self._run_frames = 0
+
+    def merge(self, other: 'FeatureAccumulator'):
+        """合并另一段（与当前不连续的）采样的统计量，RMS 曲线接在后面"""
+        self.gap()
+        other.gap()
+        self._flush_curve()
+        other._flush_curve()
+        self.total_frames += other.total_frames
+        self.sum_squares += other.sum_squares
+        self.peak = max(self.peak, other.peak)
+        self.spectrum += other.spectrum
+        self.gate.counts += other.gate.counts
+        self.gate.power += other.gate.power
+        self.embedding_sum += other.embedding_sum
+        self.embedding_sumsq += other.embedding_sumsq
+        self.embedding_frames += other.embedding_frames
+        self._curve.extend(other._curve)
+        self._bands.extend(other._bands)
+        self._k_curve.extend(other._k_curve)
+
+    def embedding(self) -> Optional[List[float]]:
+        """各嵌入频带对数相对能量的均值与标准差，全部静音时返回 None"""
+        if not self.embedding_frames:
+            return None
+        mean = self.embedding_sum / self.embedding_frames
+        std = np.sqrt(np.maximum(0.0, self.embedding_sumsq / self.embedding_frames - mean * mean))
+        return [round(float(v), 4) for v in np.concatenate([mean, std])]
+
+    def band_profile(self) -> Optional[Dict]:
+        """
+        逐 RMS_CURVE_SECONDS 的频带能量（各声道平均的均方值，与 BANDS 同序）和 K 加权功率（各声道之和）
+
+        线性功率可以直接按音轨增益的平方相加，mix_predict 用它预测混音结果。
+        """
+        if not self._bands:
+            return None
+        return {
+            'seconds': RMS_CURVE_SECONDS,
+            'bands': [name for name, _, _ in BANDS],
+            'power': self._bands,
+            'k_power': self._k_curve,
+        }
+
+    def result(self) -> Dict:
+        self.gap()
+        self._flush_curve()
+        return summarize(
+            duration=self.total_frames / self.rate,
+            total_ms=self.sum_squares / self.total_frames if self.total_frames else 0.0,
+            peak=self.peak,
+            loudness=self.gate.integrated(),
+            rms_curve=self._curve,
+            spectrum=self.spectrum,
+            freqs=self.freqs,
+            embedding=self.embedding(),
+            band_profile=self.band_profile(),
+        )
+
+
+def analyze_samples(samples: np.ndarray, rate: int = SAMPLE_RATE) -> Dict:
+    """
+    计算全部特征
+
+    Args:
+        samples: float32 数组，形状 (frames, channels)，取值范围 [-1, 1]
+        rate: 采样率
+    """
+    accumulator = FeatureAccumulator(rate)
+    accumulator.feed(samples)
+    return accumulator.result()
+
+
+def analyze_stream(proc, rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                   block_seconds: float = READ_BLOCK_SECONDS) -> FeatureAccumulator:
+    """从解码子进程（f32le 输出）逐块读取并累积特征"""
+    accumulator = FeatureAccumulator(rate)
+    block_frames = int(rate * block_seconds)
+    while True:
+        block = read_frames(proc, block_frames, channels, dtype=np.float32)
+        if block is None:
+            break
+        accumulator.feed(block)
+    return accumulator
+
+
+def analyze_file(path: str, rate: int = SAMPLE_RATE, channels: int = CHANNELS) -> Dict:
+    """
+    解码一次并计算全部特征
+
+    逐块读取 ffmpeg 的输出，内存只与 READ_BLOCK_SECONDS 有关，小时级的长录音也不会整体载入。
+
+    Raises:
+        RuntimeError: ffmpeg 解码失败
+    """
+    proc = open_decoder(path, sample_rate=rate, channels=channels, sample_format='f32le')
+    try:
+        accumulator = analyze_stream(proc, rate, channels)
+        returncode = proc.wait()
+    finally:
+        close_process(proc)
+    if returncode != 0 or not accumulator.total_frames:
+        raise RuntimeError(f"ffmpeg 解码失败 {path} (exit {returncode})")
+    return accumulator.result()
+
+
+def _error_db(values: np.ndarray, coverage: float) -> Optional[float]:
+    """窗口均值的置信区间半宽（按有限总体修正）"""
+    if len(values) < 2:
+        return None
+    return float(CONFIDENCE_Z * np.std(values, ddof=1) / np.sqrt(len(values))
+                 * np.sqrt(max(0.0, 1.0 - coverage)))
+
+
+def analyze_file_sampled(path: str, windows: int = SAMPLE_WINDOWS,
+                         window_seconds: float = SAMPLE_WINDOW_SECONDS,
+                         rate: int = SAMPLE_RATE, channels: int = CHANNELS) -> Dict:
+    """
+    抽样快速分析：只解码均匀分布的 windows 个窗口，估计平均音量、峰值和响度
+
+    每个窗口单独 seek 解码，耗时只与 windows × window_seconds 有关，与文件长度无关。
+    短于两倍抽样总时长的文件直接完整分析。
+
+    结果与 analyze_file 的字段相同，另外包含：
+        sampled: {windows, window_seconds, coverage}
+        error_db: 平均音量（dB）和响度（LU）估计的 95% 置信区间半宽，完整分析时为 0
+        window_db: 各窗口的平均音量
+
+    peak_db 是抽样窗口中的最大值，只是真实峰值的下限；rms_curve 为空，band_profile 为 None。
+
+    Raises:
+        RuntimeError: 读取时长或解码失败
+    """
+    duration = probe_duration(path)
+    if duration <= windows * window_seconds * 2:
+        result = analyze_file(path, rate, channels)
+        result['sampled'] = {'windows': 0, 'window_seconds': 0.0, 'coverage': 1.0}
+        result['error_db'] = {'mean_db': 0.0, 'loudness_lufs': 0.0}
+        result['window_db'] = []
+        return result
+
+    total = FeatureAccumulator(rate)
+    window_ms = []
+    window_loudness = []
+    span = duration - window_seconds
+    for k in range(windows):
+        start = span * (k + 0.5) / windows
+        samples = decode_file(path, sample_rate=rate, channels=channels,
+                              start=start, duration=window_seconds)
+        if not len(samples):
+            continue
+        window = FeatureAccumulator(rate)
+        window.feed(samples)
+        window.gap()
+        window_ms.append(window.sum_squares / window.total_frames)
+        loudness = window.gate.integrated()
+        if loudness is not None:
+            window_loudness.append(loudness)
+        total.merge(window)
+
+    if not total.total_frames:
+        raise RuntimeError(f"抽样解码失败 {path}")
+
+    coverage = min(1.0, total.total_frames / rate / duration)
+    result = total.result()
+    mean_ms = float(np.mean(window_ms))
+    ms_error = _error_db(np.array(window_ms), coverage)
+    loudness_error = _error_db(np.array(window_loudness), coverage)
+
+    result.update({
+        'duration_seconds': round(duration, 2),
+        'mean_db': round(to_db(mean_ms), 2),
+        'rms_curve': [],
+        'band_profile': None,
+        'analyzer_version': FAST_ANALYZER_VERSION,
+        'sampled': {'windows': len(window_ms), 'window_seconds': window_seconds,
+                    'coverage': round(coverage, 4)},
+        'error_db': {
+            'mean_db': round(to_db(mean_ms + ms_error) - to_db(mean_ms), 2)
+            if ms_error is not None and mean_ms > 0 else None,
+            'loudness_lufs': round(loudness_error, 2) if loudness_error is not None else None,
+        },
+        'window_db': [round(to_db(ms), 2) for ms in window_ms],
+    })
+    return result
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    fast = '--fast' in sys.argv
+    for path in [arg for arg in sys.argv[1:] if not arg.startswith('--')]:
+        started = time.perf_counter()
+        features = analyze_file_sampled(path) if fast else analyze_file(path)
+        curve = features.pop('rms_curve')
+        features.pop('embedding', None)
+        profile = features.pop('band_profile', None)
+        print(f"🎵 {path}  ({time.perf_counter() - started:.2f}s)")
+        for key, value in features.items():
+            print(f"   {key}: {value}")
+        print(f"   rms_curve: {len(curve)} 点，{min(curve, default=0)} ~ {max(curve, default=0)} dB")
+        if profile:
+            print(f"   band_profile: {len(profile['power'])} 点 × {len(profile['bands'])} 频带")
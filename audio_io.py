@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Audio IO - 基于 ffmpeg 子进程的 PCM 解码/编码工具
+
+统一解码为固定采样率、交错排列的 PCM，供实时混音、分析等模块逐块读取，
+内存占用只与块大小有关，与文件长度无关。
+"""
+
+import subprocess
+from typing import List, Optional
+
+import numpy as np
+
+# 统一的内部采样格式
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+FFMPEG = 'ffmpeg'
+FFPROBE = 'ffprobe'
+
+
+def decode_command(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                   sample_format: str = 's16le', loop: bool = False,
+                   start: Optional[float] = None, duration: Optional[float] = None) -> List[str]:
+    """构建把音频文件解码为原始 PCM 并输出到 stdout 的 ffmpeg 命令"""
+    cmd = [FFMPEG, '-v', 'error', '-nostdin']
+    if loop:
+        cmd += ['-stream_loop', '-1']
+    if start:
+        cmd += ['-ss', f'{start:.3f}']
+    if duration is not None:
+        cmd += ['-t', f'{duration:.3f}']
+    cmd += [
+        '-i', path,
+        '-f', sample_format,
+        '-ac', str(channels),
+        '-ar', str(sample_rate),
+        '-',
+    ]
+    return cmd
+
+
+def encode_command(output_format: str = 'mp3', bitrate: str = '128k',
+                   sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                   output: str = '-') -> List[str]:
+    """构建从 stdin 读取 s16le PCM 并编码输出的 ffmpeg 命令"""
+    cmd = [
+        FFMPEG, '-v', 'error', '-nostdin',
+        '-f', 's16le', '-ac', str(channels), '-ar', str(sample_rate),
+        '-i', '-',
+    ]
+    if output_format == 'mp3':
+        cmd += ['-b:a', bitrate]
+    cmd += ['-f', output_format]
+    if output != '-':
+        cmd.append('-y')
+    cmd.append(output)
+    return cmd
+
+
+def open_decoder(path: str, **kwargs) -> subprocess.Popen:
+    """启动解码子进程，通过 read_frames 逐块读取"""
+    return subprocess.Popen(
+        decode_command(path, **kwargs),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def read_frames(proc: subprocess.Popen, frames: int, channels: int = CHANNELS,
+                dtype=np.int16) -> Optional[np.ndarray]:
+    """
+    从解码子进程读取最多 frames 帧
+
+    Returns:
+        形状为 (n, channels) 的数组，已到达结尾时返回 None
+    """
+    frame_bytes = np.dtype(dtype).itemsize * channels
+    data = proc.stdout.read(frames * frame_bytes)
+    if not data:
+        return None
+    usable = len(data) - len(data) % frame_bytes
+    return np.frombuffer(data[:usable], dtype=dtype).reshape(-1, channels)
+
+
+def close_process(proc: Optional[subprocess.Popen]):
+    """结束子进程并回收管道"""
+    if proc is None:
+        return
+    for stream in (proc.stdin, proc.stdout):
+        try:
+            if stream:
+                stream.close()
+        except OSError:
+            pass
+    if proc.poll() is None:
+        proc.kill()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+def decode_file(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                start: Optional[float] = None, duration: Optional[float] = None) -> np.ndarray:
+    """完整解码为 float32 数组，形状 (frames, channels)，取值范围 [-1, 1]"""
+    proc = subprocess.run(
+        decode_command(path, sample_rate=sample_rate, channels=channels,
+                       sample_format='f32le', start=start, duration=duration),
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码失败 {path}: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32).reshape(-1, channels)
+
+
+def count_frames(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                 block_frames: int = 1 << 16) -> int:
+    """流式解码并统计帧数（精确的解码长度），内存占用与文件长度无关；解码失败时为 0"""
+    proc = open_decoder(path, sample_rate=sample_rate, channels=channels)
+    frames = 0
+    try:
+        while True:
+            block = read_frames(proc, block_frames, channels)
+            if block is None:
+                break
+            frames += len(block)
+    finally:
+        close_process(proc)
+    return frames
+
+
+def probe_duration(path: str) -> float:
+    """用 ffprobe 读取容器记录的时长（秒），不解码"""
+    proc = subprocess.run(
+        [FFPROBE, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True,
+    )
+    try:
+        return float(proc.stdout.strip())
+    except ValueError:
+        raise RuntimeError(f"ffprobe 读取时长失败 {path}: {proc.stderr.strip()}")
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    """float32 [-1, 1] 转换为 int16，超出范围的部分硬限幅"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
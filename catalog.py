@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Catalog - 音效库元数据 (audio_descriptions.yaml) 的读写工具
+"""
+
+import os
+import tempfile
+import threading
+from typing import Dict, Iterator, Tuple
+
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DESC_PATH = os.path.join(BASE_DIR, 'audio_descriptions.yaml')
+
+# 只读缓存: path -> (版本, 数据)
+_cache: Dict[str, Tuple[str, Dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_catalog(path: str = AUDIO_DESC_PATH) -> Dict:
+    """读取音效库元数据"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def catalog_version(path: str = AUDIO_DESC_PATH) -> str:
+    """元数据文件的版本标识（修改时间 + 大小），文件变化后随之改变"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def load_catalog_cached(path: str = AUDIO_DESC_PATH) -> Tuple[str, Dict]:
+    """
+    读取音效库元数据，文件未变化时直接返回缓存
+
+    返回的数据在多个调用方之间共享，只能读取不能修改；需要修改时使用 load_catalog。
+
+    Returns:
+        (版本, 数据)
+    """
+    version = catalog_version(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == version:
+            return cached
+
+    data = load_catalog(path)
+    with _cache_lock:
+        _cache[path] = (version, data)
+    return version, data
+
+
+def file_mode(path: str) -> int:
+    """已有文件的权限；文件不存在时按 umask 计算的默认权限"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def save_catalog(data: Dict, path: str = AUDIO_DESC_PATH):
+    """原子写入音效库元数据（先写临时文件再替换，读者不会看到半写入的文件）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.catalog-', suffix='.yaml', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yaml.dump(data, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+        # mkstemp 创建的文件权限为 0600，沿用原文件的权限
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def iter_files(data: Dict) -> Iterator[Tuple[str, Dict]]:
+    """遍历所有音效条目，产出 (分类 ID, 文件条目)"""
+    for category_id, category in data.get('categories', {}).items():
+        for file_info in category.get('files', []):
+            yield category_id, file_info
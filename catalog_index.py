@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Catalog Index - 音效库本地检索
+
+对每个音效的文件名、中英文描述、场景标签和所属分类建立字符 n-gram TF-IDF 索引，
+按场景描述检索最相关的音效。纯本地计算，不依赖网络和额外的包。
+
+字符 n-gram 对中文（无需分词）和英文文件名都适用：
+"下雨的咖啡馆" 与 "咖啡馆环境音"、"雨声" 都能通过共同的字/词片段匹配上。
+"""
+
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from catalog import load_catalog_cached, iter_files
+
+# n-gram 长度范围
+NGRAM_RANGE = (1, 3)
+# 每个分类至少保留的兜底音效数
+DIVERSE_PER_CATEGORY = 1
+
+_WORD_SPLIT = re.compile(r'[\W_\d]+', re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """NFKC + 小写，标点、数字、下划线统一成空格"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return ' '.join(_WORD_SPLIT.sub(' ', text).split())
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    """按词切分后提取字符 n-gram（不跨越空格）"""
+    grams = Counter()
+    low, high = ngram_range
+    for word in normalize_text(text).split():
+        for n in range(low, high + 1):
+            for i in range(len(word) - n + 1):
+                grams[word[i:i + n]] += 1
+    return grams
+
+
+def document_text(category: Dict, file_info: Dict) -> str:
+    """参与检索的文本：文件名（去扩展名）、描述、场景和分类名"""
+    stem = file_info['filename'].rsplit('.', 1)[0]
+    return ' '.join(str(part) for part in (
+        stem,
+        file_info.get('description_zh', ''),
+        file_info.get('description_en', ''),
+        file_info.get('scene', ''),
+        category.get('name_zh', ''),
+        category.get('name_en', ''),
+    ) if part)
+
+
+class CatalogIndex:
+    """字符 n-gram TF-IDF 索引，向量为 L2 归一化的稀疏 dict"""
+
+    def __init__(self, data: Dict):
+        categories = data.get('categories', {})
+        self.entries: List[Tuple[str, Dict]] = list(iter_files(data))
+
+        counts = [char_ngrams(document_text(categories[c], f)) for c, f in self.entries]
+        document_frequency = Counter()
+        for grams in counts:
+            document_frequency.update(grams.keys())
+
+        n = len(counts)
+        # 平滑 idf，出现在所有文档中的 n-gram 权重接近 1
+        self.idf = {g: math.log((1 + n) / (1 + df)) + 1 for g, df in document_frequency.items()}
+        self.vectors = [self._vectorize(grams) for grams in counts]
+
+    def _vectorize(self, grams: Counter) -> Dict[str, float]:
+        # 次线性 tf；查询中不在词表里的 n-gram 对相似度没有贡献，直接丢弃
+        vector = {
+            g: (1 + math.log(tf)) * self.idf[g]
+            for g, tf in grams.items() if g in self.idf
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        if norm:
+            for g in vector:
+                vector[g] /= norm
+        return vector
+
+    def scores(self, query: str) -> List[float]:
+        """每个音效与查询的余弦相似度（与 entries 同序）"""
+        q = self._vectorize(char_ngrams(query))
+        return [
+            sum(w * v.get(g, 0.0) for g, w in q.items())
+            for v in self.vectors
+        ]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, str, Dict]]:
+        """返回最相关的 k 个音效: [(相似度, 分类 ID, 文件条目), ...]"""
+        scored = sorted(
+            zip(self.scores(query), range(len(self.entries))),
+            key=lambda item: (-item[0], item[1])
+        )
+        return [(score, *self.entries[i]) for score, i in scored[:k]]
+
+    def select(self, query: str, top_k: int,
+               diverse_per_category: int = DIVERSE_PER_CATEGORY) -> List[Tuple[str, Dict]]:
+        """
+        为场景挑选提供给 LLM 的音效子集
+
+        最相关的 top_k 个，加上每个分类中最相关的 diverse_per_category 个作为兜底，
+        让模型在检索不准时仍能从各类声音中选择。结果按音效库中的原始顺序排列。
+
+        Returns:
+            [(分类 ID, 文件条目), ...]
+        """
+        scores = self.scores(query)
+        order = sorted(range(len(self.entries)), key=lambda i: (-scores[i], i))
+
+        chosen = set(order[:top_k])
+        per_category = Counter()
+        for i in order:
+            category_id = self.entries[i][0]
+            if per_category[category_id] < diverse_per_category:
+                chosen.add(i)
+                per_category[category_id] += 1
+
+        return [self.entries[i] for i in sorted(chosen)]
+
+
+_index_cache: Tuple[Optional[str], Optional[CatalogIndex]] = (None, None)
+_index_lock = threading.Lock()
+
+
+def get_catalog_index() -> CatalogIndex:
+    """当前音效库的索引，音效库变化时重建"""
+    global _index_cache
+    version, data = load_catalog_cached()
+    with _index_lock:
+        if _index_cache[0] != version:
+            _index_cache = (version, CatalogIndex(data))
+        return _index_cache[1]
+
+
+if __name__ == '__main__':
+    import sys
+
+    query = ' '.join(sys.argv[1:]) or '下雨的咖啡馆'
+    index = get_catalog_index()
+    print(f"🔍 {query}")
+    for score, category_id, file_info in index.search(query, k=10):
+        print(f"  {score:.3f}  [{category_id}] {file_info['filename']} - {file_info.get('description_zh', '')}")
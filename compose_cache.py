@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Compose Cache - AI 作曲结果缓存
+
+很多用户输入的场景几乎相同，每次都调用 LLM 需要数秒。
+本模块按规范化后的场景描述和音效库版本缓存生成结果：
+
+- 规范化：NFKC（全角/半角统一）、转小写、去掉标点、合并空白
+- 音效库变化后版本号随之改变，旧结果自然失效
+- LRU 淘汰 + TTL 过期，持久化到 JSON 文件，重启后仍然有效
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.environ.get('AI_CACHE_PATH', os.path.join(BASE_DIR, 'composed', 'ai_cache.json'))
+# 缓存条目上限与有效期（秒）
+CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', '500'))
+CACHE_TTL = float(os.environ.get('AI_CACHE_TTL', str(7 * 24 * 3600)))
+
+_PUNCTUATION = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_scene(scene: str) -> str:
+    """规范化场景描述，使只有标点、空白、大小写或全半角差异的描述得到相同的键"""
+    text = unicodedata.normalize('NFKC', scene).lower()
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+def cache_key(scene: str, version: str) -> str:
+    return hashlib.sha1(f"{version}\n{normalize_scene(scene)}".encode('utf-8')).hexdigest()
+
+
+class CompositionCache:
+    """带 TTL 的 LRU 缓存，每次写入后原子地持久化到磁盘"""
+
+    def __init__(self, path: Optional[str] = CACHE_PATH, max_entries: int = CACHE_SIZE,
+                 ttl: float = CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        """首次使用时从磁盘读取"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取 AI 作曲缓存失败: {e}")
+            return
+
+        now = time.time()
+        for key, entry in entries:
+            if now - entry['created'] < self.ttl:
+                self._entries[key] = entry
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.ai-cache-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key: str) -> Optional[Dict]:
+        """返回缓存的结果，不存在或已过期时返回 None"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['created'] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry['result']
+
+    def put(self, key: str, result: Dict):
+        with self._lock:
+            self._load()
+            self._entries[key] = {'created': time.time(), 'result': result}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            try:
+                self._save()
+            except OSError as e:
+                print(f"写入 AI 作曲缓存失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+
+# 全局缓存
+composition_cache = CompositionCache()
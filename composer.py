@@ -5,17 +5,41 @@ WhiteNoise Composer - 音效组合合成服务
 """
 
 import os
+import json
 import math
+import time
+import hashlib
+import cProfile
+import threading
 import yaml
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 from pydub import AudioSegment
 
+from metrics import (
+    RENDER_SECONDS, RENDER_ERRORS, DECODE_SECONDS, DECODE_ERRORS, CACHE_REQUESTS
+)
+from render_trace import RenderTrace
+
 # 项目根目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
 COMPOSITIONS_DIR = os.path.join(BASE_DIR, 'compositions')
 COMPOSED_DIR = os.path.join(BASE_DIR, 'composed')
+CLIPS_DIR = os.path.join(COMPOSED_DIR, 'clips')
+
+# 单个音轨片段的最长时长（秒）
+MAX_CLIP_SECONDS = 3600
+# 音轨片段码率（仅用于试听）
+CLIP_BITRATE = '128k'
+# 音轨片段缓存目录的容量上限（MB），超出时删除最久未使用的片段
+CLIP_CACHE_MB = int(os.environ.get('CLIP_CACHE_MB', '1024'))
+# 设为 1 时改用分段并行渲染（segment_render），默认关闭
+PARALLEL_RENDER = os.environ.get('RENDER_PARALLEL', '0') == '1'
+
+# 同一片段的并发请求只渲染一次
+_clip_locks: Dict[str, threading.Lock] = {}
+_clip_locks_guard = threading.Lock()
 
 
 @dataclass
@@ -111,17 +135,241 @@ def db_from_volume(volume: float) -> float:
     return 20 * math.log10(volume)
 
 
-def compose_audio(composition: Composition, progress_callback=None) -> AudioSegment:
+def load_audio_file(audio_path: str, duration: Optional[float] = None) -> AudioSegment:
+    """
+    解码音频文件，并记录解码耗时
+    
+    Args:
+        audio_path: 音频文件路径
+        duration: 只解码开头的秒数，None 表示完整解码
+    """
+    start = time.perf_counter()
+    try:
+        audio = AudioSegment.from_file(audio_path, duration=duration)
+    except Exception:
+        DECODE_ERRORS.inc()
+        raise
+    DECODE_SECONDS.observe(time.perf_counter() - start)
+    return audio
+
+
+def render_track(track: Track, trace: Optional[RenderTrace] = None) -> AudioSegment:
+    """
+    生成单个音轨实际发声的音频：循环或裁剪到 end - start，并应用淡入淡出和音量
+    
+    Raises:
+        FileNotFoundError: 音频文件不存在
+    """
+    if trace is None:
+        trace = RenderTrace(track.audio, enabled=False)
+    
+    audio_path = os.path.join(AUDIO_DIR, track.audio)
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"音频文件不存在 {track.audio}")
+    
+    # 计算所需时长（毫秒）
+    track_duration_ms = int((track.end - track.start) * 1000)
+    
+    # 加载音频（只解码需要的部分，源文件更短时得到完整文件）
+    with trace.stage('decode'):
+        audio = load_audio_file(audio_path, duration=track_duration_ms / 1000)
+    
+    with trace.stage('loop'):
+        # 循环扩展（如果需要且音频不够长）
+        if track.loop and len(audio) < track_duration_ms:
+            loops_needed = (track_duration_ms // len(audio)) + 1
+            audio = audio * loops_needed
+        
+        # 裁剪到所需时长
+        audio = audio[:track_duration_ms]
+    
+    with trace.stage('fade'):
+        # 应用淡入
+        if track.fade_in > 0:
+            fade_in_ms = int(track.fade_in * 1000)
+            audio = audio.fade_in(min(fade_in_ms, len(audio)))
+        
+        # 应用淡出
+        if track.fade_out > 0:
+            fade_out_ms = int(track.fade_out * 1000)
+            audio = audio.fade_out(min(fade_out_ms, len(audio)))
+    
+    with trace.stage('gain'):
+        # 调整音量
+        if track.volume != 1.0:
+            db_change = db_from_volume(track.volume)
+            audio = audio + db_change
+    
+    return audio
+
+
+def track_from_params(audio: str, params: Dict) -> Track:
+    """
+    根据请求参数构建音轨（用于音轨片段接口）
+    
+    Raises:
+        ValueError: 参数无效
+    """
+    if not audio or os.path.basename(audio) != audio:
+        raise ValueError(f'无效的音频文件: {audio}')
+    if not os.path.exists(os.path.join(AUDIO_DIR, audio)):
+        raise ValueError(f'音频文件不存在: {audio}')
+    
+    try:
+        start = float(params.get('start', 0))
+        end = float(params['end'])
+        volume = float(params.get('volume', 1.0))
+        fade_in = float(params.get('fade_in', 0))
+        fade_out = float(params.get('fade_out', 0))
+    except KeyError:
+        raise ValueError('缺少参数: end')
+    except (TypeError, ValueError):
+        raise ValueError('参数必须是数字')
+    if not all(math.isfinite(v) for v in (start, end, volume, fade_in, fade_out)):
+        raise ValueError('参数必须是有限的数字')
+    
+    if not 0 < end - start <= MAX_CLIP_SECONDS:
+        raise ValueError(f'音轨时长必须在 0-{MAX_CLIP_SECONDS} 秒之间')
+    if not 0 <= volume <= 1 or fade_in < 0 or fade_out < 0:
+        raise ValueError('音量或淡入淡出参数超出范围')
+    
+    loop = str(params.get('loop', 'true')).lower() not in ('false', '0', 'no')
+    
+    return Track(audio=audio, start=start, end=end, volume=volume,
+                 fade_in=fade_in, fade_out=fade_out, loop=loop)
+
+
+def track_clip_key(track: Track) -> str:
+    """音轨片段的缓存键：由音轨参数和源文件的大小、修改时间决定"""
+    stat = os.stat(os.path.join(AUDIO_DIR, track.audio))
+    params = {
+        'audio': track.audio,
+        'duration': round(track.end - track.start, 3),
+        'volume': round(track.volume, 4),
+        'fade_in': round(track.fade_in, 3),
+        'fade_out': round(track.fade_out, 3),
+        'loop': bool(track.loop),
+        'source': [stat.st_size, int(stat.st_mtime)],
+    }
+    raw = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def render_track_clip(track: Track) -> str:
+    """
+    渲染单个音轨实际发声的片段并缓存（已循环/裁剪，已应用淡入淡出和音量）
+    
+    片段与音轨在时间轴上的位置无关，相同参数的音轨共享同一个缓存文件。
+    
+    Returns:
+        片段文件路径
+    """
+    key = track_clip_key(track)
+    clip_path = os.path.join(CLIPS_DIR, f"{key}.mp3")
+    
+    if _touch_clip(clip_path):
+        CACHE_REQUESTS.inc(cache='clip', result='hit')
+        return clip_path
+    
+    with _clip_locks_guard:
+        lock = _clip_locks.setdefault(key, threading.Lock())
+    
+    with lock:
+        # 等待期间可能已由其他请求渲染完成
+        if _touch_clip(clip_path):
+            CACHE_REQUESTS.inc(cache='clip', result='hit')
+            return clip_path
+        
+        CACHE_REQUESTS.inc(cache='clip', result='miss')
+        audio = render_track(track)
+        
+        os.makedirs(CLIPS_DIR, exist_ok=True)
+        tmp_path = f"{clip_path}.{threading.get_ident()}.tmp"
+        try:
+            audio.export(tmp_path, format='mp3', bitrate=CLIP_BITRATE)
+            os.replace(tmp_path, clip_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    with _clip_locks_guard:
+        _clip_locks.pop(key, None)
+    
+    evict_clips(keep=clip_path)
+    return clip_path
+
+
+def _touch_clip(clip_path: str) -> bool:
+    """
+    片段已缓存时把访问时间更新为当前时间（作为最近使用时间）并返回 True
+    
+    修改时间保持不变，响应的 ETag、Last-Modified 不随访问变化。
+    """
+    try:
+        stat = os.stat(clip_path)
+        os.utime(clip_path, ns=(time.time_ns(), stat.st_mtime_ns))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def evict_clips(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """
+    按最近使用时间删除音轨片段，直到缓存目录不超过容量上限
+    
+    Args:
+        max_bytes: 容量上限，默认 CLIP_CACHE_MB
+        keep: 不删除的片段（刚生成、即将发送的文件）
+    
+    Returns:
+        删除的片段数
+    """
+    if max_bytes is None:
+        max_bytes = CLIP_CACHE_MB * 1024 * 1024
+    clips = []
+    try:
+        with os.scandir(CLIPS_DIR) as it:
+            for entry in it:
+                if entry.name.endswith('.mp3') and entry.is_file():
+                    stat = entry.stat()
+                    clips.append((stat.st_atime_ns, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+    
+    total = sum(size for _, size, _ in clips)
+    removed = 0
+    for _, size, path in sorted(clips):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        print(f"清理音轨片段缓存: 删除 {removed} 个")
+    return removed
+
+
+def compose_audio(composition: Composition, progress_callback=None,
+                  trace: Optional[RenderTrace] = None) -> AudioSegment:
     """
     根据组合配置合成音频
     
     Args:
         composition: 组合配置
         progress_callback: 进度回调函数 (current, total, message)
+        trace: 渲染追踪记录，为 None 时只记录阶段指标
     
     Returns:
         合成后的 AudioSegment
     """
+    if trace is None:
+        trace = RenderTrace(composition.name, enabled=False)
+    
     duration_ms = int(composition.duration * 1000)
     
     # 创建空白主音轨
@@ -133,47 +381,28 @@ def compose_audio(composition: Composition, progress_callback=None) -> AudioSegm
         if progress_callback:
             progress_callback(i, total_tracks, f"处理音轨: {track.audio}")
         
-        audio_path = os.path.join(AUDIO_DIR, track.audio)
-        
-        if not os.path.exists(audio_path):
-            print(f"警告: 音频文件不存在 {track.audio}")
-            continue
+        trace.begin_track(i, track)
         
         try:
-            # 加载音频
-            audio = AudioSegment.from_file(audio_path)
-            
-            # 计算所需时长（毫秒）
-            track_duration_ms = int((track.end - track.start) * 1000)
-            
-            # 循环扩展（如果需要且音频不够长）
-            if track.loop and len(audio) < track_duration_ms:
-                loops_needed = (track_duration_ms // len(audio)) + 1
-                audio = audio * loops_needed
-            
-            # 裁剪到所需时长
-            audio = audio[:track_duration_ms]
-            
-            # 应用淡入
-            if track.fade_in > 0:
-                fade_in_ms = int(track.fade_in * 1000)
-                audio = audio.fade_in(min(fade_in_ms, len(audio)))
+            audio = render_track(track, trace)
             
-            # 应用淡出
-            if track.fade_out > 0:
-                fade_out_ms = int(track.fade_out * 1000)
-                audio = audio.fade_out(min(fade_out_ms, len(audio)))
+            with trace.stage('mix'):
+                # 混入主音轨
+                position_ms = int(track.start * 1000)
+                master = master.overlay(audio, position=position_ms)
             
-            # 调整音量
-            if track.volume != 1.0:
-                db_change = db_from_volume(track.volume)
-                audio = audio + db_change
-            
-            # 混入主音轨
-            position_ms = int(track.start * 1000)
-            master = master.overlay(audio, position=position_ms)
+            trace.end_track(
+                channels=audio.channels,
+                frame_rate=audio.frame_rate,
+            )
             
+        except FileNotFoundError as e:
+            print(f"警告: {e}")
+            trace.end_track(error='文件不存在')
+            continue
         except Exception as e:
+            RENDER_ERRORS.inc(scope='track')
+            trace.end_track(error=str(e))
             print(f"处理音轨失败 {track.audio}: {e}")
             continue
     
@@ -184,7 +413,8 @@ def compose_audio(composition: Composition, progress_callback=None) -> AudioSegm
 
 
 def render_composition(name: str, output_format: str = 'mp3', 
-                       bitrate: str = '192k') -> Optional[str]:
+                       bitrate: str = '192k', trace: bool = True,
+                       profile: bool = False, parallel: Optional[bool] = None) -> Optional[str]:
     """
     渲染组合配置为音频文件
     
@@ -192,10 +422,22 @@ def render_composition(name: str, output_format: str = 'mp3',
         name: 组合配置名称（不含.yaml后缀）
         output_format: 输出格式 (mp3, wav, ogg)
         bitrate: 比特率
+        trace: 是否在输出文件旁写出分阶段追踪清单 (<name>.trace.json)
+        profile: 是否采集 cProfile 数据 (<name>.prof)，仅单进程渲染
+        parallel: 是否分段并行渲染，None 时按 RENDER_PARALLEL
     
     Returns:
         输出文件路径，失败返回 None
     """
+    if parallel is None:
+        parallel = PARALLEL_RENDER
+    if parallel:
+        if profile:
+            print("警告: 分段并行渲染在子进程中混音，不采集 cProfile 数据")
+        # segment_render 依赖本模块，在此导入避免循环引用
+        from segment_render import render_segmented
+        return render_segmented(name, output_format, bitrate, trace=trace)
+    
     composition = load_composition(name)
     if not composition:
         print(f"找不到组合配置: {name}")
@@ -207,26 +449,55 @@ def render_composition(name: str, output_format: str = 'mp3',
     def progress(current, total, message):
         print(f"  [{current}/{total}] {message}")
     
-    # 合成音频
-    audio = compose_audio(composition, progress_callback=progress)
-    
-    # 确保输出目录存在
-    os.makedirs(COMPOSED_DIR, exist_ok=True)
-    
-    # 输出文件路径
-    output_path = os.path.join(COMPOSED_DIR, f"{name}.{output_format}")
+    render_trace = RenderTrace(name, enabled=trace)
+    profiler = cProfile.Profile() if profile else None
+    render_start = time.perf_counter()
     
-    # 导出音频
-    print(f"导出文件: {output_path}")
+    if profiler:
+        profiler.enable()
     
-    export_params = {
-        'format': output_format,
-    }
-    
-    if output_format == 'mp3':
-        export_params['bitrate'] = bitrate
-    
-    audio.export(output_path, **export_params)
+    try:
+        # 合成音频
+        audio = compose_audio(composition, progress_callback=progress, trace=render_trace)
+        
+        # 确保输出目录存在
+        os.makedirs(COMPOSED_DIR, exist_ok=True)
+        
+        # 输出文件路径
+        output_path = os.path.join(COMPOSED_DIR, f"{name}.{output_format}")
+        
+        # 导出音频
+        print(f"导出文件: {output_path}")
+        
+        export_params = {
+            'format': output_format,
+        }
+        
+        if output_format == 'mp3':
+            export_params['bitrate'] = bitrate
+        
+        with render_trace.stage('export'):
+            audio.export(output_path, **export_params)
+    finally:
+        if profiler:
+            profiler.disable()
+    
+    RENDER_SECONDS.observe(time.perf_counter() - render_start)
+    
+    if profiler:
+        profile_path = os.path.join(COMPOSED_DIR, f"{name}.prof")
+        profiler.dump_stats(profile_path)
+        render_trace.extra['profile'] = os.path.basename(profile_path)
+        print(f"性能分析数据: {profile_path}")
+    
+    if trace:
+        render_trace.extra.update({
+            'output': os.path.basename(output_path),
+            'duration': composition.duration,
+            'format': output_format,
+        })
+        trace_path = render_trace.write(os.path.join(COMPOSED_DIR, f"{name}.trace.json"))
+        print(f"追踪清单: {trace_path}")
     
     print(f"合成完成: {output_path}")
     return output_path
@@ -292,6 +563,8 @@ if __name__ == '__main__':
         print("用法:")
         print("  python composer.py list              - 列出所有组合")
         print("  python composer.py render <name>     - 渲染指定组合")
+        print("      --profile                        - 同时采集 cProfile 数据")
+        print("      --parallel                       - 分段并行渲染")
         print("  python composer.py info <name>       - 查看组合详情")
         sys.exit(1)
     
@@ -309,7 +582,8 @@ if __name__ == '__main__':
     
     elif command == 'render' and len(sys.argv) > 2:
         name = sys.argv[2]
-        render_composition(name)
+        render_composition(name, profile='--profile' in sys.argv[3:],
+                           parallel=True if '--parallel' in sys.argv[3:] else None)
     
     elif command == 'info' and len(sys.argv) > 2:
         name = sys.argv[2]
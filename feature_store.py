@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Feature Store - 按内容哈希持久化的音频特征库
+
+analyze_audio.py、rescan_audio.py 等工具需要的音频特征都从这里读取，只计算缺失的部分：
+
+- 特征按 (内容哈希, 分析器名, 分析器版本) 保存在 SQLite 中，
+  文件改名、复制或在多个分类中重复出现都只分析一次；分析器升级版本后旧结果自然失效
+- 路径 -> 内容哈希 按 (大小, 修改时间) 记忆，文件未变化时不必重新计算哈希
+
+用法:
+    python feature_store.py                  # 查看统计
+    python feature_store.py pixabay/*.mp3    # 预先计算特征
+    python feature_store.py --fast pixabay/*.mp3  # 抽样快速分析
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import audio_features
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_STORE_PATH = os.environ.get('FEATURE_STORE_PATH', os.path.join(BASE_DIR, '.audio_features.db'))
+
+# 分析器: 名称 -> (版本, 分析函数 path -> dict)
+ANALYZERS: Dict[str, Tuple[int, Callable[[str], Dict]]] = {
+    'full': (audio_features.ANALYZER_VERSION, audio_features.analyze_file),
+    'fast': (audio_features.FAST_ANALYZER_VERSION, audio_features.analyze_file_sampled),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    content_hash TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, analyzer, version)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+
+def file_hash(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的 SHA-1"""
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """SQLite 特征库，可在多线程中共享；子进程中使用时自动重新连接"""
+
+    def __init__(self, path: str = FEATURE_STORE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork 出的子进程不能复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def content_hash(self, filepath: str) -> str:
+        """文件内容哈希，大小和修改时间未变时直接使用记忆的结果"""
+        path = os.path.realpath(filepath)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT size, mtime_ns, content_hash FROM files WHERE path = ?', (path,)
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        digest = file_hash(path)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)',
+                    (path, stat.st_size, stat.st_mtime_ns, digest)
+                )
+        return digest
+
+    def get(self, content_hash: str, analyzer: str = 'full',
+            version: Optional[int] = None) -> Optional[Dict]:
+        """已保存的特征，不存在时返回 None"""
+        if version is None:
+            version = ANALYZERS[analyzer][0]
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT data FROM features WHERE content_hash = ? AND analyzer = ? AND version = ?',
+                (content_hash, analyzer, version)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, content_hash: str, features: Dict, analyzer: str = 'full',
+            version: Optional[int] = None):
+        if version is None:
+            version = ANALYZERS[analyzer][0]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO features (content_hash, analyzer, version, data, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (content_hash, analyzer, version, json.dumps(features, ensure_ascii=False), time.time())
+                )
+
+    def get_any(self, content_hash: str, analyzers=('full', 'fast')) -> Optional[Dict]:
+        """按 analyzers 的顺序返回第一个已保存的特征（默认完整分析优先）"""
+        for analyzer in analyzers:
+            found = self.get(content_hash, analyzer)
+            if found is not None:
+                return found
+        return None
+
+    def features(self, filepath: str, analyzer: str = 'full', refresh: bool = False) -> Dict:
+        """
+        读取文件的特征，缺失时计算并保存
+
+        Args:
+            refresh: 忽略已保存的结果重新计算
+
+        Raises:
+            RuntimeError: 解码失败
+        """
+        version, analyze = ANALYZERS[analyzer]
+        digest = self.content_hash(filepath)
+        if not refresh:
+            cached = self.get(digest, analyzer, version)
+            if cached is not None:
+                return cached
+
+        result = analyze(filepath)
+        self.put(digest, result, analyzer, version)
+        return result
+
+    def analyzed_files(self, analyzers=('full', 'fast')) -> Dict[str, Tuple[int, int]]:
+        """
+        已有当前版本特征的文件: 真实路径 -> 记忆的 (大小, 修改时间 ns)
+
+        文件的大小和修改时间与记忆的一致时，无需重新哈希和分析。
+        """
+        clauses = ' OR '.join('(analyzer = ? AND version = ?)' for _ in analyzers)
+        params = [value for analyzer in analyzers for value in (analyzer, ANALYZERS[analyzer][0])]
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT path, size, mtime_ns FROM files WHERE content_hash IN '
+                f'(SELECT content_hash FROM features WHERE {clauses})', params
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def version(self) -> int:
+        """特征表的版本标识（最大 rowid），保存新特征后随之增大"""
+        with self._lock:
+            row = self._connection().execute('SELECT MAX(rowid) FROM features').fetchone()
+        return row[0] or 0
+
+    def stats(self) -> Dict[str, int]:
+        """各分析器（含版本）保存的特征数"""
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT analyzer, version, COUNT(*) FROM features GROUP BY analyzer, version'
+            ).fetchall()
+        return {f"{analyzer}@v{version}": count for analyzer, version, count in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_store: Optional[FeatureStore] = None
+_store_lock = threading.Lock()
+
+
+def get_feature_store() -> FeatureStore:
+    """进程内共享的特征库"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FeatureStore()
+        return _store
+
+
+if __name__ == '__main__':
+    import sys
+
+    store = get_feature_store()
+    analyzer = 'fast' if '--fast' in sys.argv else 'full'
+    for path in [arg for arg in sys.argv[1:] if not arg.startswith('--')]:
+        started = time.perf_counter()
+        try:
+            store.features(path, analyzer)
+        except RuntimeError as e:
+            print(f"  ❌ {path}: {e}")
+            continue
+        print(f"  ✅ {path} ({time.perf_counter() - started:.2f}s)")
+
+    print(f"🗄️  特征库: {store.path}")
+    for key, count in sorted(store.stats().items()):
+        print(f"   {key}: {count}")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Live Mix - 服务端实时混音流
+
+根据主页混音器的当前状态（音效文件 + 各自音量）在服务端逐块混音，
+编码成一条连续的 MP3 流返回给浏览器，客户端无需下载和解码任何源文件。
+
+- 每个音轨由一个循环解码的 ffmpeg 子进程提供 PCM，逐块读取
+- 混音线程只比实时超前 LEAD_SECONDS，音量变化在下一个块平滑生效
+- 每个收听者的内存只与块大小和音轨数有关，可以无限时长播放
+"""
+
+import os
+import time
+import uuid
+import queue
+import weakref
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_io import (
+    SAMPLE_RATE, CHANNELS, open_decoder, read_frames, close_process,
+    encode_command, probe_duration, to_int16
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+
+# 每块帧数（约 46ms）
+BLOCK_FRAMES = 2048
+# 混音超前实时的最大秒数，决定音量变化的延迟
+LEAD_SECONDS = float(os.environ.get('LIVE_MIX_LEAD_SECONDS', '0.5'))
+# 编码输出码率
+STREAM_BITRATE = os.environ.get('LIVE_MIX_BITRATE', '128k')
+# 单个会话最多音轨数
+MAX_TRACKS = 12
+# 同时在线的收听者上限
+MAX_LISTENERS = int(os.environ.get('LIVE_MIX_MAX_LISTENERS', '32'))
+# 无收听者的会话在此时长后过期
+SESSION_TTL = 600
+
+
+class LiveMixSession:
+    """混音器状态：音轨及其音量，可在播放过程中随时更新"""
+
+    def __init__(self, tracks: List[Dict], master_volume: float = 1.0):
+        self.id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self.tracks: Dict[str, float] = {}
+        self.master_volume = 1.0
+        self.listeners = 0
+        self.last_active = time.time()
+        self.update(tracks, master_volume)
+
+    def update(self, tracks: Optional[List[Dict]] = None, master_volume: Optional[float] = None):
+        """更新混音状态，tracks 为 [{'audio': 文件名, 'volume': 0-1}, ...]"""
+        with self._lock:
+            if tracks is not None:
+                self.tracks = {
+                    t['audio']: min(max(float(t.get('volume', 0.7)), 0.0), 1.0)
+                    for t in tracks[:MAX_TRACKS]
+                }
+            if master_volume is not None:
+                self.master_volume = min(max(float(master_volume), 0.0), 1.0)
+            self.last_active = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.tracks), self.master_volume
+
+    def to_dict(self) -> Dict:
+        tracks, master_volume = self.snapshot()
+        return {
+            'id': self.id,
+            'tracks': [{'audio': a, 'volume': v} for a, v in tracks.items()],
+            'master_volume': master_volume,
+            'listeners': self.listeners,
+        }
+
+
+class _TrackVoice:
+    """单个音轨的解码器和当前增益"""
+
+    def __init__(self, audio: str):
+        self.audio = audio
+        self.proc = open_decoder(os.path.join(AUDIO_DIR, audio), loop=True)
+        self.gain = 0.0
+
+    def read(self, frames: int) -> Optional[np.ndarray]:
+        block = read_frames(self.proc, frames)
+        if block is None:
+            return None
+        if len(block) < frames:
+            block = np.pad(block, ((0, frames - len(block)), (0, 0)))
+        return block.astype(np.float32) / 32768.0
+
+    def close(self):
+        close_process(self.proc)
+
+
+class LiveMixer:
+    """一个收听者的混音器，按会话状态逐块生成 PCM"""
+
+    def __init__(self, session: LiveMixSession, block_frames: int = BLOCK_FRAMES):
+        self.session = session
+        self.block_frames = block_frames
+        self.voices: Dict[str, _TrackVoice] = {}
+        # 解码失败的文件，不再重新启动解码器
+        self.failed = set()
+        self.master_gain = 0.0
+
+    def _sync_voices(self, targets: Dict[str, float]):
+        for audio in targets:
+            if audio not in self.voices and audio not in self.failed:
+                self.voices[audio] = _TrackVoice(audio)
+
+    def next_block(self) -> np.ndarray:
+        """混合下一块音频，增益在块内线性过渡到目标值"""
+        targets, master_volume = self.session.snapshot()
+        self._sync_voices(targets)
+
+        frames = self.block_frames
+        mix = np.zeros((frames, CHANNELS), dtype=np.float32)
+
+        for audio, voice in list(self.voices.items()):
+            target = targets.get(audio, 0.0)
+            block = voice.read(frames)
+
+            # 解码结束（文件损坏等）或已移除且淡出完毕
+            if block is None or (audio not in targets and voice.gain == 0.0):
+                if block is None:
+                    self.failed.add(audio)
+                    print(f"实时混音音轨解码失败，已停用: {audio}")
+                voice.close()
+                del self.voices[audio]
+                continue
+
+            ramp = np.linspace(voice.gain, target, frames, dtype=np.float32)
+            mix += block * ramp[:, None]
+            voice.gain = target
+
+        master_ramp = np.linspace(self.master_gain, master_volume, frames, dtype=np.float32)
+        mix *= master_ramp[:, None]
+        self.master_gain = master_volume
+
+        return mix
+
+    def blocks(self):
+        """按实时节奏生成 int16 PCM 字节块，最多超前 LEAD_SECONDS"""
+        started = time.monotonic()
+        produced = 0.0
+        block_seconds = self.block_frames / SAMPLE_RATE
+
+        while True:
+            ahead = produced - (time.monotonic() - started)
+            if ahead > LEAD_SECONDS:
+                time.sleep(ahead - LEAD_SECONDS)
+
+            block = self.next_block()
+            yield to_int16(block).tobytes()
+            produced += block_seconds
+
+    def close(self):
+        for voice in self.voices.values():
+            voice.close()
+        self.voices.clear()
+
+
+def stream_encoded(session: LiveMixSession, bitrate: str = STREAM_BITRATE,
+                   chunk_size: int = 4096):
+    """
+    生成编码后的 MP3 流
+
+    混音线程把 PCM 写入编码器 stdin，生成器从编码器 stdout 读取并产出；
+    管道缓冲有限，客户端读取慢时混音线程会被阻塞，内存不会增长。
+    """
+    mixer = LiveMixer(session)
+    encoder = subprocess.Popen(
+        encode_command('mp3', bitrate=bitrate),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    stop = threading.Event()
+    errors: 'queue.Queue[Exception]' = queue.Queue()
+
+    def pump():
+        try:
+            for pcm in mixer.blocks():
+                if stop.is_set():
+                    break
+                encoder.stdin.write(pcm)
+        except (BrokenPipeError, ValueError, OSError):
+            pass
+        except Exception as e:
+            errors.put(e)
+        finally:
+            mixer.close()
+            try:
+                encoder.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=pump, name=f'live-mix-{session.id}', daemon=True)
+    writer.start()
+
+    try:
+        while True:
+            chunk = encoder.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            session.last_active = time.time()
+            yield chunk
+        if not errors.empty():
+            print(f"实时混音失败: {errors.get()}")
+    finally:
+        stop.set()
+        session.last_active = time.time()
+        close_process(encoder)
+        writer.join(timeout=2)
+
+
+class ListenerStream:
+    """
+    占用一个收听名额的 MP3 流，作为响应体迭代
+
+    名额在 close() 或对象被回收时释放一次；响应体从未开始迭代时也不会泄漏名额。
+    """
+
+    def __init__(self, session: LiveMixSession, registry: 'SessionRegistry'):
+        self._chunks = stream_encoded(session)
+        self._release = weakref.finalize(self, registry.release_listener, session)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        self._release()
+
+
+class SessionRegistry:
+    """实时混音会话表"""
+
+    def __init__(self):
+        self._sessions: Dict[str, LiveMixSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self, tracks: List[Dict], master_volume: float = 1.0) -> LiveMixSession:
+        self.expire()
+        session = LiveMixSession(tracks, master_volume)
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[LiveMixSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def open_stream(self, session: LiveMixSession) -> Optional[ListenerStream]:
+        """占用一个收听名额并打开 MP3 流；所有会话的收听者总数已达 MAX_LISTENERS 时返回 None"""
+        with self._lock:
+            if sum(s.listeners for s in self._sessions.values()) >= MAX_LISTENERS:
+                return None
+            session.listeners += 1
+        return ListenerStream(session, self)
+
+    def release_listener(self, session: LiveMixSession):
+        with self._lock:
+            session.listeners -= 1
+            session.last_active = time.time()
+
+    def expire(self):
+        """清理长时间无人收听的会话"""
+        now = time.time()
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if session.listeners == 0 and now - session.last_active > SESSION_TTL:
+                    del self._sessions[session_id]
+
+
+# 文件能否解码: (路径, 大小, 修改时间) -> bool
+_decodable_cache: Dict[tuple, bool] = {}
+_decodable_lock = threading.Lock()
+
+
+def is_decodable(path: str) -> bool:
+    """用 ffprobe 检查文件能否读出有效时长，按文件大小和修改时间缓存结果"""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _decodable_lock:
+        if key in _decodable_cache:
+            return _decodable_cache[key]
+    try:
+        ok = probe_duration(path) > 0
+    except (RuntimeError, OSError):
+        ok = False
+    with _decodable_lock:
+        _decodable_cache[key] = ok
+    return ok
+
+
+def validate_tracks(tracks) -> Optional[str]:
+    """校验混音器状态（文件须存在且能解码），返回错误信息或 None"""
+    if not isinstance(tracks, list):
+        return 'tracks 必须是列表'
+    if len(tracks) > MAX_TRACKS:
+        return f'音轨数量不能超过 {MAX_TRACKS}'
+    for track in tracks:
+        audio = track.get('audio') if isinstance(track, dict) else None
+        if not audio or os.path.basename(audio) != audio:
+            return f'无效的音频文件: {audio}'
+        path = os.path.join(AUDIO_DIR, audio)
+        if not os.path.exists(path):
+            return f'音频文件不存在: {audio}'
+        if not is_decodable(path):
+            return f'音频文件无法解码: {audio}'
+    return None
+
+
+# 全局会话表
+sessions = SessionRegistry()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+LLM Client - 长连接复用的 LLM API 客户端
+
+- 每个事件循环共享一个 httpx.AsyncClient，连接保持复用（安装了 h2 时使用 HTTP/2）
+- 信号量限制（每个事件循环）同时发往 API 的请求数
+- 429 / 5xx / 超时 / 连接错误按带抖动的指数退避重试，遵循 Retry-After
+- 同步代码（Flask）通过 run_sync 在共享的后台事件循环中执行，连接池跨请求保留
+
+测试时可用 set_llm_client 替换为指向本地替身服务的客户端。
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import LLM_RETRIES
+
+# 同时进行的 API 请求上限
+MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+# 失败后的最多重试次数
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+# 退避基数与上限（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# 连接池大小
+MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '20'))
+# 超时：连接 10 秒；读取超时按每次读取计算（流式响应两次收到数据之间最多 60 秒），
+# 不限制整个请求的时长，整体时限由 llm_composer.COMPOSE_TIMEOUT 控制
+TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMHTTPError(Exception):
+    """API 返回了非 200 状态（重试用尽后）"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期）"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """共享连接池、限制并发并自动重试的 API 客户端"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 timeout: httpx.Timeout = TIMEOUT, http2: bool = HTTP2_AVAILABLE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.http2 = http2
+        self.transport = transport
+        # 事件循环 -> (连接池, 信号量)
+        self._clients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """
+        当前事件循环的连接池与信号量
+
+        连接池与信号量绑定到事件循环，每个事件循环各用一套（ASGI 服务的事件循环与
+        run_sync 的后台事件循环可以并存，不会来回重建）。已关闭的事件循环上的连接池
+        无法再关闭，创建新连接池时丢弃。
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            if entry is None or entry[0].is_closed:
+                for closed in [l for l in self._clients if l.is_closed()]:
+                    del self._clients[closed]
+                client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    transport=self.transport,
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_CONNECTIONS,
+                        keepalive_expiry=120.0,
+                    ),
+                )
+                entry = self._clients[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+        return entry
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def _send(self, client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+        """
+        发送请求（响应体尚未读取），可重试的失败自动重试
+
+        Returns:
+            最后一次的响应（重试用尽时可能仍是 429/5xx）
+
+        Raises:
+            httpx.TimeoutException / httpx.TransportError: 重试用尽后仍然失败
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await client.send(request, stream=True)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                reason = 'timeout' if isinstance(e, httpx.TimeoutException) else 'transport'
+                delay = self.backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+                await response.aclose()
+                reason = str(response.status_code)
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                delay = min(delay, BACKOFF_MAX)
+
+            LLM_RETRIES.inc(reason=reason)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def post(self, url: str, json: Dict, headers: Optional[Dict] = None) -> httpx.Response:
+        """发送 POST 请求并读取完整响应，失败时按 _send 的规则重试"""
+        client, semaphore = self._ensure_client()
+
+        async with semaphore:
+            response = await self._send(client, client.build_request('POST', url, json=json, headers=headers))
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            return response
+
+    async def stream(self, url: str, json: Dict, headers: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        发送流式请求，逐个产出 SSE 事件的 data 内容（遇到 [DONE] 结束）
+
+        只在收到响应之前重试；开始产出数据后出错直接抛出。
+
+        Raises:
+            LLMHTTPError: 重试用尽后状态码仍不是 200
+        """
+        client, semaphore = self._ensure_client()
+
+        async with semaphore:
+            response = await self._send(client, client.build_request('POST', url, json=json, headers=headers))
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise LLMHTTPError(response.status_code, response.text)
+
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    yield data
+            finally:
+                await response.aclose()
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        with self._lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+
+_llm_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """进程内共享的客户端"""
+    global _llm_client
+    with _client_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient()
+        return _llm_client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """替换共享客户端（例如指向本地替身服务的 transport），传 None 恢复默认"""
+    global _llm_client
+    with _client_lock:
+        _llm_client = client
+
+
+# ============ 同步调用 ============
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_background_loop.run_forever, name='llm-client-loop', daemon=True
+            )
+            thread.start()
+        return _background_loop
+
+
+def run_sync(coro, timeout: Optional[float] = None):
+    """
+    在共享的后台事件循环中执行协程并等待结果
+
+    与每次 asyncio.run 新建事件循环不同，连接池在多次调用之间保持有效。
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_background_loop())
+    return future.result(timeout)
+
+
+def iterate_sync(agen):
+    """在共享的后台事件循环中逐项驱动异步生成器，供同步代码（如 Flask 流式响应）迭代"""
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
@@ -8,51 +8,58 @@ import os
 import re
 import yaml
 import httpx
+import json
 import uuid
+import asyncio
+import time
+import copy
+import textwrap
 from typing import Optional
 
-# DeepSeek API 配置
-DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
+from catalog import load_catalog_cached, catalog_version, iter_files
+from catalog_index import get_catalog_index
+import rule_composer
+from compose_cache import composition_cache, cache_key
+from mix_predict import mix_warnings
+from llm_client import get_llm_client, run_sync, LLMHTTPError
+from metrics import LLM_REQUESTS, LLM_REQUEST_SECONDS, CACHE_REQUESTS
+
+# DeepSeek API 配置（可指向任何兼容 chat completions 的服务，如 mock_llm_server.py）
+DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/chat/completions")
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
+# 单次回复的最大 token 数
+MAX_COMPLETION_TOKENS = 2000
+
+# 并行候选：每次生成同时发出的请求数（取第一个通过校验的结果）
+CANDIDATES = int(os.environ.get("LLM_CANDIDATES", "1"))
+# 单次生成允许的最多候选数
+MAX_CANDIDATES = 4
+# 单次生成的 token 预算（所有候选的提示词 + 回复上限之和），0 表示不限制
+FANOUT_TOKEN_BUDGET = int(os.environ.get("LLM_FANOUT_TOKEN_BUDGET", "0"))
+# 各候选使用的 temperature，第一个与单请求模式相同
+CANDIDATE_TEMPERATURES = (0.7, 0.9, 0.5, 1.0)
+
+# 单次生成的总时限（秒），超时后改用规则作曲的结果
+COMPOSE_TIMEOUT = float(os.environ.get("LLM_COMPOSE_TIMEOUT", "45"))
+# LLM 超时、请求失败或未配置时是否改用规则作曲兜底
+RULE_FALLBACK = os.environ.get("LLM_RULE_FALLBACK", "1") != "0"
+FALLBACK_REASONS = {'not_configured', 'http_error', 'timeout', 'error'}
 
 # 项目路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 COMPOSITIONS_DIR = os.path.join(BASE_DIR, 'compositions')
-AUDIO_DESC_PATH = os.path.join(BASE_DIR, 'audio_descriptions.yaml')
-
-
-def get_audio_summary() -> str:
-    """获取音效库的精简摘要，用于 Prompt"""
-    with open(AUDIO_DESC_PATH, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-    
-    summary_lines = ["可用音效库：\n"]
-    
-    for category_id, category in data.get('categories', {}).items():
-        category_name = category.get('name_zh', category_id)
-        summary_lines.append(f"\n## {category_name}")
-        
-        for file_info in category.get('files', []):
-            filename = file_info['filename']
-            desc_zh = file_info.get('description_zh', '')
-            scene = file_info.get('scene', '')
-            duration = file_info.get('duration_formatted', '')
-            volume_level = file_info.get('volume_level', 'medium')
-            
-            summary_lines.append(
-                f"- {filename}: {desc_zh} | 场景: {scene} | 时长: {duration} | 音量: {volume_level}"
-            )
-    
-    return '\n'.join(summary_lines)
 
 
-def get_system_prompt() -> str:
-    """构建系统提示词"""
-    audio_summary = get_audio_summary()
-    
-    return f"""你是一位专业的白噪音/环境音作曲家，同时也是一位懂得声学美学和环境设计的艺术家。用户会描述一个场景，你需要从音效库中选择合适的音效，编排成一首有层次感、有呼吸感、环境合理的音效交响乐。
+# 提示词中音效库摘要的 token 预算，0 表示不限制
+PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", "0"))
+# 音效库摘要模式：full（完整描述）或 compact（精简）
+PROMPT_SUMMARY_MODE = os.environ.get("LLM_PROMPT_SUMMARY", "full")
+# 检索模式：每个场景只提供最相关的 K 个音效（外加各分类的兜底音效），0 表示提供完整音效库
+PROMPT_RETRIEVAL_K = int(os.environ.get("LLM_RETRIEVAL_K", "0"))
 
-{audio_summary}
+# 系统提示词的静态部分。放在最前面且逐字节不变，
+# 服务端的前缀缓存可以跨请求复用，缩短首 token 时间；随音效库变化的摘要放在最后。
+SYSTEM_RULES = """你是一位专业的白噪音/环境音作曲家，同时也是一位懂得声学美学和环境设计的艺术家。用户会描述一个场景，你需要从提供的音效库中选择合适的音效，编排成一首有层次感、有呼吸感、环境合理的音效交响乐。
 
 ## 核心设计理念
 
@@ -178,6 +185,131 @@ tracks:
 
 只输出 YAML 代码块，不要有任何其他文字。"""
 
+# 缓存的系统提示词: (缓存键, 提示词)
+_prompt_cache: tuple = (None, None)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 字符 1 个 token，其余字符（中文等）约 1 字符 1 个 token"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def _summary_line(file_info: dict, compact: bool) -> str:
+    filename = file_info['filename']
+    desc_zh = file_info.get('description_zh', '')
+    volume_level = file_info.get('volume_level', 'medium')
+    
+    if compact:
+        return f"- {filename}: {desc_zh} | {volume_level}"
+    
+    scene = file_info.get('scene', '')
+    duration = file_info.get('duration_formatted', '')
+    return f"- {filename}: {desc_zh} | 场景: {scene} | 时长: {duration} | 音量: {volume_level}"
+
+
+def get_audio_summary(data: Optional[dict] = None, compact: bool = False,
+                      token_budget: int = 0, only: Optional[set] = None) -> str:
+    """
+    获取音效库的摘要，用于 Prompt
+    
+    Args:
+        data: 音效库元数据，默认读取 audio_descriptions.yaml
+        compact: 精简模式，只保留文件名、中文描述和音量级别
+        token_budget: token 预算（0 表示不限制）。完整摘要超出预算时自动改用精简模式，
+            仍然超出时在各分类间轮流保留音效，直到用完预算
+        only: 只包含这些文件名
+    """
+    if data is None:
+        data = load_catalog_cached()[1]
+    
+    categories = [
+        (
+            category.get('name_zh', category_id),
+            [f for f in category.get('files', []) if only is None or f['filename'] in only]
+        )
+        for category_id, category in data.get('categories', {}).items()
+    ]
+    
+    def render(selected) -> str:
+        summary_lines = ["可用音效库：\n"]
+        for (category_name, _), lines in zip(categories, selected):
+            if lines:
+                summary_lines.append(f"\n## {category_name}")
+                summary_lines.extend(lines)
+        return '\n'.join(summary_lines)
+    
+    full = [[_summary_line(f, compact) for f in files] for _, files in categories]
+    summary = render(full)
+    if not token_budget or estimate_tokens(summary) <= token_budget:
+        return summary
+    
+    if not compact:
+        return get_audio_summary(data, compact=True, token_budget=token_budget, only=only)
+    
+    # 轮流从各分类取一个音效，保证每个分类都有代表
+    selected = [[] for _ in categories]
+    used = estimate_tokens(render(selected))
+    depth = 0
+    while True:
+        added = False
+        for (category_name, _), lines, chosen in zip(categories, full, selected):
+            if depth >= len(lines):
+                continue
+            cost = estimate_tokens(lines[depth]) + 1
+            if not chosen:
+                cost += estimate_tokens(category_name) + 5
+            if used + cost > token_budget:
+                return render(selected)
+            chosen.append(lines[depth])
+            used += cost
+            added = True
+        if not added:
+            return render(selected)
+        depth += 1
+
+
+def get_system_prompt() -> str:
+    """
+    构建系统提示词
+    
+    提示词只在音效库元数据或预算配置变化时重新生成。
+    检索模式下系统提示词只包含静态规则，音效库摘要随场景放在用户消息中（见 get_scene_audio_summary）。
+    """
+    global _prompt_cache
+    if PROMPT_RETRIEVAL_K:
+        return SYSTEM_RULES
+    
+    version, data = load_catalog_cached()
+    key = (version, PROMPT_SUMMARY_MODE, PROMPT_TOKEN_BUDGET)
+    
+    if _prompt_cache[0] == key:
+        return _prompt_cache[1]
+    
+    audio_summary = get_audio_summary(
+        data,
+        compact=PROMPT_SUMMARY_MODE == 'compact',
+        token_budget=PROMPT_TOKEN_BUDGET
+    )
+    prompt = f"{SYSTEM_RULES}\n\n{audio_summary}"
+    _prompt_cache = (key, prompt)
+    return prompt
+
+
+def get_scene_audio_summary(scene_description: str) -> str:
+    """
+    检索模式下为场景挑选的音效库摘要
+    
+    提示词大小只取决于 PROMPT_RETRIEVAL_K 和分类数，不随音效库增长。
+    """
+    selected = get_catalog_index().select(scene_description, top_k=PROMPT_RETRIEVAL_K)
+    return get_audio_summary(
+        load_catalog_cached()[1],
+        compact=PROMPT_SUMMARY_MODE == 'compact',
+        token_budget=PROMPT_TOKEN_BUDGET,
+        only={file_info['filename'] for _, file_info in selected}
+    )
+
 
 def extract_yaml_from_response(response_text: str) -> Optional[str]:
     """从响应中提取 YAML 内容"""
@@ -197,6 +329,9 @@ def extract_yaml_from_response(response_text: str) -> Optional[str]:
 
 def validate_composition(composition: dict, available_files: set) -> tuple[bool, str]:
     """验证生成的组合配置是否有效"""
+    if not isinstance(composition, dict):
+        return False, "配置必须是字典"
+    
     required_fields = ['name', 'duration', 'tracks']
     
     for field in required_fields:
@@ -207,10 +342,13 @@ def validate_composition(composition: dict, available_files: set) -> tuple[bool,
         return False, "tracks 必须是非空列表"
     
     for i, track in enumerate(composition['tracks']):
+        if not isinstance(track, dict):
+            return False, f"音轨 {i+1} 必须是字典"
+        
         if 'audio' not in track:
             return False, f"音轨 {i+1} 缺少 audio 字段"
         
-        if track['audio'] not in available_files:
+        if not isinstance(track['audio'], str) or track['audio'] not in available_files:
             return False, f"音轨 {i+1} 的音频文件不存在: {track['audio']}"
         
         # 设置默认值
@@ -226,78 +364,173 @@ def validate_composition(composition: dict, available_files: set) -> tuple[bool,
 
 def get_available_audio_files() -> set:
     """获取所有可用的音频文件名"""
-    with open(AUDIO_DESC_PATH, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-    
-    files = set()
-    for category in data.get('categories', {}).values():
-        for file_info in category.get('files', []):
-            files.add(file_info['filename'])
-    
-    return files
+    data = load_catalog_cached()[1]
+    return {file_info['filename'] for _, file_info in iter_files(data)}
 
 
-async def generate_composition(scene_description: str) -> dict:
+def _record_llm_request(outcome: str, start: float):
+    """记录一次失败的 LLM API 请求"""
+    LLM_REQUESTS.inc(outcome=outcome)
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+
+
+async def _run_blocking(func, *args):
+    """
+    在事件循环的默认线程池中执行阻塞函数（读写缓存文件、读取音效库和特征库等），不阻塞事件循环
+
+    ASGI 服务端启动时把默认线程池设为它的 I/O 线程池。
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def _scene_cache_key(scene_description: str) -> str:
+    """场景在当前音效库版本下的缓存键"""
+    return cache_key(scene_description, catalog_version())
+
+
+def _cached_result(key: str) -> Optional[dict]:
+    """
+    查询缓存，命中时返回带新 ID 的结果副本
+
+    混音警告不缓存，按特征库的当前状态重新计算（之前尚未分析的音效此后可能已分析）。
+    """
+    cached = composition_cache.get(key)
+    if cached is None:
+        return None
+    CACHE_REQUESTS.inc(cache='ai_compose', result='hit')
+    result = copy.deepcopy(cached)
+    result['id'] = f"ai_{uuid.uuid4().hex[:8]}"
+    result['cached'] = True
+    result['mix_warnings'] = mix_warnings(result['composition'])
+    return result
+
+
+def _cache_result(key: str, result: dict):
+    composition_cache.put(key, {
+        'success': True,
+        'composition': result['composition'],
+        'yaml_content': result['yaml_content']
+    })
+
+
+async def generate_composition(scene_description: str, fresh: bool = False,
+                               candidates: Optional[int] = None) -> dict:
     """
     根据场景描述生成音效组合
     
+    规范化后相同的场景（且音效库未变化）直接返回缓存结果，不调用 LLM。
+    
     Args:
         scene_description: 用户描述的场景
+        fresh: 跳过缓存，强制重新生成（结果仍会写入缓存）
+        candidates: 并行候选数，默认 LLM_CANDIDATES，受 MAX_CANDIDATES 和 token 预算限制
     
     Returns:
-        包含生成结果的字典
+        包含生成结果的字典，命中缓存时带有 cached: True
     """
-    if not DEEPSEEK_API_KEY:
-        return {
-            'success': False,
-            'error': 'DeepSeek API Key 未配置。请设置环境变量 DEEPSEEK_API_KEY'
-        }
+    key = await _run_blocking(_scene_cache_key, scene_description)
     
-    system_prompt = get_system_prompt()
-    user_prompt = f"请为以下场景创作一首音效组合：\n\n{scene_description}"
+    if not fresh:
+        result = await _run_blocking(_cached_result, key)
+        if result is not None:
+            return result
     
+    CACHE_REQUESTS.inc(cache='ai_compose', result='miss')
+    count = await _run_blocking(candidate_count, scene_description, candidates)
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                DEEPSEEK_API_URL,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 2000
-                }
-            )
-            
-            if response.status_code != 200:
-                return {
-                    'success': False,
-                    'error': f'API 请求失败: {response.status_code} - {response.text}'
-                }
-            
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
-    except httpx.TimeoutException:
-        return {
-            'success': False,
-            'error': 'API 请求超时，请稍后重试'
-        }
-    except Exception as e:
-        return {
-            'success': False,
-            'error': f'API 请求异常: {str(e)}'
-        }
+        result = await asyncio.wait_for(
+            request_composition_fanout(scene_description, count),
+            COMPOSE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        LLM_REQUESTS.inc(outcome='deadline')
+        result = _deadline_exceeded()
+    
+    if result['success']:
+        await _run_blocking(_cache_result, key, result)
+        return result
+    
+    return await _run_blocking(_fallback_result, scene_description, result)
+
+
+def _deadline_exceeded() -> dict:
+    return {
+        'success': False,
+        'error': f'AI 生成超过 {COMPOSE_TIMEOUT:g} 秒未完成',
+        'reason': 'timeout'
+    }
+
+
+def _fallback_result(scene_description: str, failure: dict) -> dict:
+    """
+    LLM 超时、不可用或未配置时改用规则作曲的结果（不写入缓存）
+    
+    模型输出无法通过校验等其他失败原样返回，交给用户重试或并行候选处理。
+    """
+    if not RULE_FALLBACK or failure.get('reason') not in FALLBACK_REASONS:
+        return failure
+    
+    result = rule_composer.compose_result(scene_description)
+    if not result['success']:
+        return failure
     
+    result['fallback'] = True
+    result['fallback_reason'] = failure['error']
+    return result
+
+
+def build_request(scene_description: str, temperature: float = 0.7, stream: bool = False) -> dict:
+    """构建 chat completions 请求体"""
+    user_prompt = f"请为以下场景创作一首音效组合：\n\n{scene_description}"
+    if PROMPT_RETRIEVAL_K:
+        user_prompt = f"{get_scene_audio_summary(scene_description)}\n\n{user_prompt}"
+    
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": get_system_prompt()},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": MAX_COMPLETION_TOKENS
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _api_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _not_configured() -> dict:
+    LLM_REQUESTS.inc(outcome='not_configured')
+    return {
+        'success': False,
+        'error': 'DeepSeek API Key 未配置。请设置环境变量 DEEPSEEK_API_KEY',
+        'reason': 'not_configured'
+    }
+
+
+def _request_failed(outcome: str, start: float, error: str) -> dict:
+    """记录一次失败的 API 请求并返回失败结果，reason 用于判断是否改用规则作曲兜底"""
+    _record_llm_request(outcome, start)
+    return {
+        'success': False,
+        'error': error,
+        'reason': outcome
+    }
+
+
+def parse_composition(content: str) -> dict:
+    """从 LLM 的完整回复中解析并验证组合配置，返回与 generate_composition 相同格式的结果"""
     # 解析 YAML
     yaml_content = extract_yaml_from_response(content)
     if not yaml_content:
+        LLM_REQUESTS.inc(outcome='parse_error')
         return {
             'success': False,
             'error': '无法从响应中提取有效的 YAML 配置',
@@ -307,23 +540,30 @@ async def generate_composition(scene_description: str) -> dict:
     try:
         composition = yaml.safe_load(yaml_content)
     except yaml.YAMLError as e:
+        LLM_REQUESTS.inc(outcome='parse_error')
         return {
             'success': False,
             'error': f'YAML 解析失败: {str(e)}',
             'raw_response': content
         }
     
-    # 验证配置
+    # 验证配置（结构异常的输出按校验失败处理，并行候选可继续等待其他结果）
     available_files = get_available_audio_files()
-    is_valid, error_msg = validate_composition(composition, available_files)
+    try:
+        is_valid, error_msg = validate_composition(composition, available_files)
+    except Exception as e:
+        is_valid, error_msg = False, str(e)
     
     if not is_valid:
+        LLM_REQUESTS.inc(outcome='invalid')
         return {
             'success': False,
             'error': f'配置验证失败: {error_msg}',
             'raw_response': content
         }
     
+    LLM_REQUESTS.inc(outcome='success')
+    
     # 生成唯一 ID
     composition_id = f"ai_{uuid.uuid4().hex[:8]}"
     
@@ -331,10 +571,316 @@ async def generate_composition(scene_description: str) -> dict:
         'success': True,
         'id': composition_id,
         'composition': composition,
-        'yaml_content': yaml_content
+        'yaml_content': yaml_content,
+        'mix_warnings': mix_warnings(composition)
     }
 
 
+async def request_composition(scene_description: str, temperature: float = 0.7) -> dict:
+    """调用 LLM 生成音效组合（不经过缓存）"""
+    if not DEEPSEEK_API_KEY:
+        return _not_configured()
+    
+    request_start = time.perf_counter()
+    
+    try:
+        # 构建提示词可能需要重新读取音效库、检索音效
+        payload = await _run_blocking(build_request, scene_description, temperature)
+        response = await get_llm_client().post(
+            DEEPSEEK_API_URL,
+            headers=_api_headers(),
+            json=payload
+        )
+        
+        if response.status_code != 200:
+            return _request_failed(
+                'http_error', request_start,
+                f'API 请求失败: {response.status_code} - {response.text}'
+            )
+        
+        result = response.json()
+        content = result['choices'][0]['message']['content']
+        
+    except httpx.TimeoutException:
+        return _request_failed('timeout', request_start, 'API 请求超时，请稍后重试')
+    except asyncio.CancelledError:
+        # 并行候选中已有其他结果胜出
+        _record_llm_request('cancelled', request_start)
+        raise
+    except Exception as e:
+        return _request_failed('error', request_start, f'API 请求异常: {str(e)}')
+    
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome='ok')
+    
+    # 校验和混音预测需要读取音效库和特征库
+    return await _run_blocking(parse_composition, content)
+
+
+def candidate_count(scene_description: str, requested: Optional[int] = None) -> int:
+    """
+    计算本次生成的并行候选数
+    
+    每个候选的成本按实际请求消息（检索模式下用户消息中含音效库摘要）的 token 数加回复上限估算，
+    总和不超过 FANOUT_TOKEN_BUDGET。
+    """
+    count = max(1, min(requested or CANDIDATES, MAX_CANDIDATES))
+    if FANOUT_TOKEN_BUDGET and count > 1:
+        messages = build_request(scene_description)['messages']
+        per_candidate = sum(estimate_tokens(m['content']) for m in messages) + MAX_COMPLETION_TOKENS
+        count = max(1, min(count, FANOUT_TOKEN_BUDGET // per_candidate))
+    return count
+
+
+async def request_composition_fanout(scene_description: str, candidates: int = 1) -> dict:
+    """
+    同时发出多个生成请求（temperature 各不相同），返回第一个通过校验的结果并取消其余请求
+    
+    全部失败时返回最先完成的失败结果。
+    """
+    if candidates <= 1:
+        return await request_composition(scene_description)
+    
+    temperatures = [CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)] for i in range(candidates)]
+    tasks = [
+        asyncio.ensure_future(request_composition(scene_description, temperature=t))
+        for t in temperatures
+    ]
+    first_failure = None
+    
+    try:
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            if result['success']:
+                result['candidates'] = candidates
+                return result
+            if first_failure is None:
+                first_failure = result
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    first_failure['candidates'] = candidates
+    return first_failure
+
+
+# ============ 流式生成 ============
+
+class IncrementalTrackParser:
+    """
+    增量解析流式输出的组合 YAML
+    
+    只处理完整的行：顶层字段（name / description / duration）读到即解析，
+    每个音轨在下一个音轨或下一个顶层字段开始时（或输出结束时）才算完整。
+    """
+    
+    HEADER_FIELDS = ('name', 'description', 'duration')
+    
+    def __init__(self):
+        self.buffer = ''
+        self.header = {}
+        self.in_tracks = False
+        self.track_lines = []
+    
+    def feed(self, text: str) -> list:
+        """
+        追加一段输出
+        
+        Returns:
+            新产生的事件列表：('header', 字段, 值) 或 ('track', 音轨 dict)
+        """
+        self.buffer += text
+        events = []
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            events.extend(self._line(line))
+        return events
+    
+    def finish(self) -> list:
+        """输出结束，处理剩余内容"""
+        events = self._line(self.buffer) if self.buffer else []
+        self.buffer = ''
+        events.extend(self._flush_track())
+        return events
+    
+    def _line(self, line: str) -> list:
+        if line.lstrip().startswith('```') or not line.strip():
+            return []
+        
+        if not line[0].isspace() and not line.startswith('-'):
+            # 顶层字段
+            events = self._flush_track()
+            key, _, value = line.partition(':')
+            key = key.strip()
+            self.in_tracks = key == 'tracks'
+            if key in self.HEADER_FIELDS and value.strip():
+                try:
+                    self.header[key] = yaml.safe_load(value)
+                except yaml.YAMLError:
+                    return events
+                events.append(('header', key, self.header[key]))
+            return events
+        
+        if not self.in_tracks:
+            return []
+        
+        if line.lstrip().startswith('- '):
+            events = self._flush_track()
+            self.track_lines = [line]
+            return events
+        
+        if self.track_lines:
+            self.track_lines.append(line)
+        return []
+    
+    def _flush_track(self) -> list:
+        if not self.track_lines:
+            return []
+        block = textwrap.dedent('\n'.join(self.track_lines))
+        self.track_lines = []
+        try:
+            items = yaml.safe_load(block)
+        except yaml.YAMLError:
+            return []
+        if isinstance(items, list) and items and isinstance(items[0], dict):
+            return [('track', items[0])]
+        return []
+
+
+def _composition_events(result: dict):
+    """把完整结果展开成流式事件（用于缓存命中时回放）"""
+    composition = result['composition']
+    yield {'type': 'meta', 'composition': {
+        k: composition[k] for k in IncrementalTrackParser.HEADER_FIELDS if k in composition
+    }}
+    for index, track in enumerate(composition.get('tracks', [])):
+        yield {'type': 'track', 'index': index, 'track': track}
+    yield {'type': 'done', 'result': result}
+
+
+async def stream_composition(scene_description: str):
+    """
+    以流式方式调用 LLM（不经过缓存），边生成边产出事件
+    
+    事件：
+        {'type': 'meta', 'composition': {name, description, duration}}  顶层字段更新
+        {'type': 'track', 'index': n, 'track': {...}}                   一个通过校验的音轨
+        {'type': 'done', 'result': {...}}                               最终结果，格式与 generate_composition 相同
+    
+    音轨只在文件存在时转发；最终结果仍按完整 YAML 严格校验。
+    """
+    if not DEEPSEEK_API_KEY:
+        yield {'type': 'done', 'result': _not_configured()}
+        return
+    
+    available_files = await _run_blocking(get_available_audio_files)
+    parser = IncrementalTrackParser()
+    parts = []
+    sent_tracks = 0
+    request_start = time.perf_counter()
+    
+    def to_events(parsed):
+        nonlocal sent_tracks
+        events = []
+        for event in parsed:
+            if event[0] == 'header':
+                events.append({'type': 'meta', 'composition': dict(parser.header)})
+            elif event[1].get('audio') in available_files:
+                track = event[1]
+                track.setdefault('start', 0)
+                track.setdefault('end', parser.header.get('duration'))
+                track.setdefault('volume', 0.5)
+                track.setdefault('fade_in', 5)
+                track.setdefault('fade_out', 5)
+                track.setdefault('loop', True)
+                events.append({'type': 'track', 'index': sent_tracks, 'track': track})
+                sent_tracks += 1
+        return events
+    
+    try:
+        payload = await _run_blocking(build_request, scene_description, 0.7, True)
+        async for data in get_llm_client().stream(
+            DEEPSEEK_API_URL,
+            headers=_api_headers(),
+            json=payload
+        ):
+            delta = json.loads(data)['choices'][0].get('delta', {}).get('content') or ''
+            if not delta:
+                continue
+            parts.append(delta)
+            for event in to_events(parser.feed(delta)):
+                yield event
+        
+        for event in to_events(parser.finish()):
+            yield event
+    
+    except LLMHTTPError as e:
+        yield {'type': 'done', 'result': _request_failed(
+            'http_error', request_start, f'API 请求失败: {e.status_code} - {e.text}'
+        )}
+        return
+    except httpx.TimeoutException:
+        yield {'type': 'done', 'result': _request_failed(
+            'timeout', request_start, 'API 请求超时，请稍后重试'
+        )}
+        return
+    except Exception as e:
+        yield {'type': 'done', 'result': _request_failed(
+            'error', request_start, f'API 请求异常: {str(e)}'
+        )}
+        return
+    
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome='ok')
+    
+    yield {'type': 'done', 'result': await _run_blocking(parse_composition, ''.join(parts))}
+
+
+async def generate_composition_stream(scene_description: str, fresh: bool = False):
+    """
+    流式版本的 generate_composition，产出 stream_composition 的事件
+    
+    命中缓存时立即回放缓存结果；否则先产出规则作曲的草稿
+    {'type': 'draft', 'result': {...}}，再转发 LLM 的事件。生成成功后写入缓存；
+    LLM 超时或不可用时最终结果改为规则作曲的兜底结果。
+    """
+    key = await _run_blocking(_scene_cache_key, scene_description)
+    
+    if not fresh:
+        result = await _run_blocking(_cached_result, key)
+        if result is not None:
+            for event in _composition_events(result):
+                yield event
+            return
+    
+    CACHE_REQUESTS.inc(cache='ai_compose', result='miss')
+    yield {'type': 'draft', 'result': await _run_blocking(rule_composer.compose_result, scene_description)}
+    
+    events = stream_composition(scene_description)
+    deadline = time.monotonic() + COMPOSE_TIMEOUT
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.__anext__(), max(0.0, deadline - time.monotonic()))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                LLM_REQUESTS.inc(outcome='deadline')
+                yield {'type': 'done', 'result': await _run_blocking(
+                    _fallback_result, scene_description, _deadline_exceeded()
+                )}
+                return
+            
+            if event['type'] == 'done':
+                if event['result']['success']:
+                    await _run_blocking(_cache_result, key, event['result'])
+                else:
+                    event = {'type': 'done', 'result': await _run_blocking(
+                        _fallback_result, scene_description, event['result']
+                    )}
+            yield event
+    finally:
+        await events.aclose()
+
+
 def save_composition(composition_id: str, composition: dict) -> str:
     """
     保存组合配置到文件
@@ -353,16 +899,14 @@ def save_composition(composition_id: str, composition: dict) -> str:
 
 
 # 同步版本（供不支持异步的场景使用）
-def generate_composition_sync(scene_description: str) -> dict:
-    """同步版本的生成函数"""
-    import asyncio
-    return asyncio.run(generate_composition(scene_description))
+def generate_composition_sync(scene_description: str, fresh: bool = False,
+                              candidates: Optional[int] = None) -> dict:
+    """同步版本的生成函数（在共享的后台事件循环中执行，复用连接池）"""
+    return run_sync(generate_composition(scene_description, fresh=fresh, candidates=candidates))
 
 
 if __name__ == '__main__':
     # 测试
-    import asyncio
-    
     test_scene = "在树林中行走，旅途中有小鸟的叫声，有风声，还能听到远处海浪的声音"
     
     print("测试场景:", test_scene)
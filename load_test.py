@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Load Test - AI 作曲接口压测
+
+以固定并发向 /api/ai/compose 发送请求，覆盖 生成 → 校验 → 保存 的完整路径，
+报告吞吐量、延迟分位数（p50/p95/p99）和错误分布；流式模式下额外报告首个音轨到达时间。
+
+配合 mock_llm_server.py 使用，不会产生 API 费用：
+
+    python mock_llm_server.py --port 8001 &
+    DEEPSEEK_API_URL=http://127.0.0.1:8001/chat/completions DEEPSEEK_API_KEY=mock python server.py &
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 16 --requests 200
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+SCENES = [
+    "深夜的咖啡馆，窗外下着小雨，室内有轻柔的人声和时钟的滴答声",
+    "森林中的清晨，鸟儿在歌唱，远处有潺潺的溪流声，偶尔有风吹过树叶的沙沙声",
+    "海边的篝火晚会，海浪声此起彼伏，篝火噼啪作响，还有远处的雷声",
+    "图书馆的安静午后，有轻微的翻书声，远处偶尔有脚步声，窗外有小雨",
+    "冬夜的小木屋，壁炉燃烧，屋外寒风呼啸",
+    "山间寺庙的清晨，钟声悠远，溪水潺潺",
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法分位数"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.first_track: List[float] = []
+        self.errors: Counter = Counter()
+        self.success = 0
+        self.saved_ids: List[str] = []
+        self.elapsed = 0.0
+
+    def record(self, latency: float, result: Dict, first_track: Optional[float] = None):
+        self.latencies.append(latency)
+        if first_track is not None:
+            self.first_track.append(first_track)
+        if result.get('success'):
+            self.success += 1
+            if result.get('saved'):
+                self.saved_ids.append(result['id'])
+        else:
+            # 按错误信息的前缀归类
+            self.errors[str(result.get('error', 'unknown')).split(':')[0][:60]] += 1
+
+
+async def compose_once(client: httpx.AsyncClient, url: str, scene: str, args, stats: Stats):
+    body = {
+        'scene': scene,
+        'auto_save': not args.no_save,
+        'fresh': not args.allow_cache,
+        'stream': args.stream,
+    }
+    if args.candidates:
+        body['candidates'] = args.candidates
+
+    start = time.perf_counter()
+    first_track = None
+    try:
+        if args.stream:
+            result = {'success': False, 'error': '流未完成'}
+            async with client.stream('POST', url, json=body) as response:
+                if 'ndjson' not in response.headers.get('Content-Type', ''):
+                    await response.aread()
+                    result = response.json()
+                else:
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        event = json.loads(line)
+                        if event['type'] == 'track' and first_track is None:
+                            first_track = time.perf_counter() - start
+                        elif event['type'] == 'done':
+                            result = event['result']
+        else:
+            response = await client.post(url, json=body)
+            result = response.json()
+    except httpx.HTTPError as e:
+        result = {'success': False, 'error': f'{type(e).__name__}: {e}'}
+    except ValueError:
+        # 非 JSON 响应体（如反向代理返回的 502 页面）
+        result = {'success': False, 'error': f'HTTP {response.status_code}'}
+
+    stats.record(time.perf_counter() - start, result, first_track)
+
+
+async def run(args) -> Stats:
+    url = f"{args.url.rstrip('/')}/api/ai/compose"
+    stats = Stats()
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(SCENES[i % len(SCENES)])
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            while True:
+                try:
+                    scene = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await compose_once(client, url, scene, args, stats)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        stats.elapsed = time.perf_counter() - started
+
+        if args.cleanup:
+            for composition_id in stats.saved_ids:
+                await client.delete(f"{args.url.rstrip('/')}/api/compositions/{composition_id}")
+
+    return stats
+
+
+def report(stats: Stats, args):
+    total = len(stats.latencies)
+    print(f"\n📊 压测结果（并发 {args.concurrency}，{'流式' if args.stream else '非流式'}）")
+    print(f"   请求数: {total}，成功: {stats.success}，失败: {total - stats.success}")
+    print(f"   总耗时: {stats.elapsed:.2f}s，吞吐量: {total / stats.elapsed:.2f} req/s")
+    print("   延迟: " + "  ".join(
+        f"p{p}={percentile(stats.latencies, p) * 1000:.0f}ms" for p in (50, 95, 99)
+    ) + f"  max={max(stats.latencies) * 1000:.0f}ms")
+    if stats.first_track:
+        print("   首个音轨: " + "  ".join(
+            f"p{p}={percentile(stats.first_track, p) * 1000:.0f}ms" for p in (50, 95, 99)
+        ))
+    if stats.errors:
+        print("   错误分布:")
+        for error, count in stats.errors.most_common():
+            print(f"     {count:5d}  {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='AI 作曲接口压测')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='WhiteNoise 服务地址')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--stream', action='store_true', help='使用流式接口')
+    parser.add_argument('--candidates', type=int, default=0, help='并行候选数（默认使用服务端配置）')
+    parser.add_argument('--allow-cache', action='store_true', help='允许命中结果缓存（默认 fresh 跳过缓存）')
+    parser.add_argument('--no-save', action='store_true', help='不保存生成结果')
+    parser.add_argument('--cleanup', action='store_true', help='结束后删除压测期间保存的组合')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print("🚀 AI 作曲压测")
+    print(f"   目标: {args.url}")
+    report(asyncio.run(run(args)), args)
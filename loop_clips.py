@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Loop Clips - 为长音频生成可无缝循环的短片段
+
+主页混音器只需要循环播放音效，下载并解码 15 分钟的完整文件没有必要。
+本脚本为较长的音频选取一段 30-90 秒、首尾特征最接近的片段，
+对接缝做等功率交叉淡化后导出到 loops/ 目录，并把片段信息写回音效库元数据。
+
+用法:
+    python loop_clips.py                 # 处理所有超过 MIN_SOURCE_SECONDS 的文件
+    python loop_clips.py --force         # 重新生成已有片段
+    python loop_clips.py heavy-rain-114710.mp3 ...
+"""
+
+import os
+import sys
+import subprocess
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE, decode_file, encode_command, to_int16
+from catalog import AUDIO_DESC_PATH, load_catalog, save_catalog, iter_files
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+LOOPS_DIR = os.path.join(BASE_DIR, 'loops')
+
+# 超过此时长的文件才生成循环片段
+MIN_SOURCE_SECONDS = 120
+# 片段时长范围与目标值
+MIN_CLIP_SECONDS = 30
+MAX_CLIP_SECONDS = 90
+TARGET_CLIP_SECONDS = 60
+# 接缝交叉淡化时长
+CROSSFADE_SECONDS = 3.0
+# 循环片段码率
+CLIP_BITRATE = '192k'
+
+# 分析用低采样率单声道
+ANALYSIS_RATE = 11025
+# 分析帧长（秒）
+FRAME_SECONDS = 0.1
+# 频带数量
+ANALYSIS_BANDS = 16
+
+
+def frame_features(samples: np.ndarray, rate: int = ANALYSIS_RATE) -> np.ndarray:
+    """
+    计算每帧的特征向量：对数频带能量 + 对数 RMS
+
+    Returns:
+        形状 (帧数, ANALYSIS_BANDS + 1)
+    """
+    hop = int(rate * FRAME_SECONDS)
+    n_frames = len(samples) // hop
+    frames = samples[:n_frames * hop].reshape(n_frames, hop)
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(hop), axis=1)) ** 2
+    edges = np.unique(np.geomspace(1, spectrum.shape[1], ANALYSIS_BANDS + 1).astype(int))
+    bands = np.add.reduceat(spectrum, edges[:-1], axis=1)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1, keepdims=True))
+
+    return np.log10(np.hstack([bands, rms]) + 1e-10)
+
+
+def find_loop_region(features: np.ndarray, min_frames: int, max_frames: int,
+                     target_frames: int, window: int) -> Tuple[int, int]:
+    """
+    选择循环区间 [start, start + length)
+
+    以 window 帧为窗口比较区间开头与结尾的平均特征，距离越小接缝越自然；
+    同时惩罚窗口内的特征波动（避免在突发声上交叉淡化）和偏离目标时长。
+
+    Returns:
+        (起始帧, 长度帧数)
+    """
+    n = len(features)
+    # 滑动窗口均值与波动
+    cumsum = np.vstack([np.zeros(features.shape[1]), np.cumsum(features, axis=0)])
+    cumsq = np.vstack([np.zeros(features.shape[1]), np.cumsum(features ** 2, axis=0)])
+    count = n - window + 1
+    means = (cumsum[window:] - cumsum[:count]) / window
+    variance = (cumsq[window:] - cumsq[:count]) / window - means ** 2
+    instability = np.sqrt(np.maximum(variance, 0).mean(axis=1))
+
+    best = (np.inf, 0, min(target_frames, n))
+    step = max(1, int(1 / FRAME_SECONDS))
+
+    for length in range(min_frames, max_frames + 1, step):
+        # 结尾窗口从 start + length 开始（交叉淡化使用片段之后的音频）
+        starts = count - length
+        if starts <= 0:
+            break
+        distance = np.sqrt(((means[:starts] - means[length:length + starts]) ** 2).mean(axis=1))
+        score = distance + 0.5 * (instability[:starts] + instability[length:length + starts])
+        score += 0.1 * abs(length - target_frames) / target_frames
+
+        index = int(np.argmin(score))
+        if score[index] < best[0]:
+            best = (float(score[index]), index, length)
+
+    return best[1], best[2]
+
+
+def make_seamless(segment: np.ndarray, length: int, crossfade: int) -> np.ndarray:
+    """
+    把 length + crossfade 帧的片段做成 length 帧的无缝循环
+
+    片段末尾 crossfade 帧与紧随其后的音频（即片段开头之前的循环位置）做等功率交叉淡化，
+    使片段最后一帧自然衔接到第一帧。
+    """
+    head = segment[:crossfade]
+    body = segment[crossfade:crossfade + length].copy()
+
+    t = np.linspace(0, 1, crossfade, endpoint=False, dtype=np.float32)[:, None]
+    fade_in = np.sin(t * np.pi / 2)
+    fade_out = np.cos(t * np.pi / 2)
+
+    body[-crossfade:] = body[-crossfade:] * fade_out + head * fade_in
+    return body
+
+
+def create_loop_clip(audio_path: str, output_path: str,
+                     target_seconds: float = TARGET_CLIP_SECONDS) -> Optional[Dict]:
+    """
+    为单个音频文件生成循环片段
+
+    Returns:
+        片段信息 {'start', 'seconds'}，文件过短时返回 None
+    """
+    analysis = decode_file(audio_path, sample_rate=ANALYSIS_RATE, channels=1)[:, 0]
+    source_seconds = len(analysis) / ANALYSIS_RATE
+    if source_seconds < MIN_SOURCE_SECONDS:
+        return None
+
+    frames_per_second = 1 / FRAME_SECONDS
+    features = frame_features(analysis)
+    del analysis
+
+    max_seconds = min(MAX_CLIP_SECONDS, source_seconds - CROSSFADE_SECONDS * 2)
+    start_frame, length_frames = find_loop_region(
+        features,
+        min_frames=int(MIN_CLIP_SECONDS * frames_per_second),
+        max_frames=int(max_seconds * frames_per_second),
+        target_frames=int(min(target_seconds, max_seconds) * frames_per_second),
+        window=int(CROSSFADE_SECONDS * frames_per_second),
+    )
+
+    start = start_frame * FRAME_SECONDS
+    seconds = length_frames * FRAME_SECONDS
+
+    # 只以完整采样率解码所需的区间
+    segment = decode_file(audio_path, start=start, duration=seconds + CROSSFADE_SECONDS)
+    length = int(round(seconds * SAMPLE_RATE))
+    crossfade = int(CROSSFADE_SECONDS * SAMPLE_RATE)
+    if len(segment) < length + crossfade:
+        length = len(segment) - crossfade
+
+    clip = make_seamless(segment, length, crossfade)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    proc = subprocess.run(
+        encode_command('mp3', bitrate=CLIP_BITRATE, output=output_path),
+        input=to_int16(clip).tobytes(),
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors='ignore').strip())
+
+    return {
+        'start': round(start, 2),
+        'seconds': round(length / SAMPLE_RATE, 3),
+    }
+
+
+def loop_clip_name(filename: str) -> str:
+    return f"{os.path.splitext(filename)[0]}.loop.mp3"
+
+
+def ingest(filenames=None, force: bool = False, yaml_path: str = AUDIO_DESC_PATH) -> int:
+    """
+    为音效库中的长音频生成循环片段并更新元数据
+
+    Returns:
+        新生成的片段数量
+    """
+    data = load_catalog(yaml_path)
+    created = 0
+
+    for _, file_entry in iter_files(data):
+        filename = file_entry['filename']
+        if filenames and filename not in filenames:
+            continue
+        if (file_entry.get('duration_seconds') or 0) < MIN_SOURCE_SECONDS:
+            continue
+
+        audio_path = os.path.join(AUDIO_DIR, filename)
+        if not os.path.exists(audio_path):
+            print(f"  ❌ {filename} - 文件不存在")
+            continue
+
+        clip_name = loop_clip_name(filename)
+        clip_path = os.path.join(LOOPS_DIR, clip_name)
+
+        if (not force and file_entry.get('loop_clip') == clip_name
+                and os.path.exists(clip_path)
+                and os.path.getmtime(clip_path) >= os.path.getmtime(audio_path)):
+            continue
+
+        print(f"  🔁 {filename}", end="", flush=True)
+        try:
+            info = create_loop_clip(audio_path, clip_path)
+        except Exception as e:
+            print(f" - 生成失败: {e}")
+            continue
+
+        if info is None:
+            print(" - 时长不足，跳过")
+            continue
+
+        file_entry['loop_clip'] = clip_name
+        file_entry['loop_clip_seconds'] = info['seconds']
+        file_entry['loop_clip_start'] = info['start']
+        created += 1
+        print(f" [{info['start']}s 起, {info['seconds']}s]")
+
+    if created:
+        save_catalog(data, yaml_path)
+
+    return created
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    force = '--force' in sys.argv
+
+    print("🎵 循环片段生成工具")
+    print(f"   输出目录: {LOOPS_DIR}")
+
+    count = ingest(set(args) or None, force=force)
+    print(f"\n✅ 完成，新生成 {count} 个循环片段")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Metrics - 轻量级 Prometheus 风格指标
+
+提供 Counter / Gauge / Histogram 三种指标和文本格式导出，不依赖第三方库。
+热路径上每次记录只有一次加锁和字典查找，开销可以忽略。
+
+用法:
+    from metrics import RENDER_STAGE_SECONDS
+    start = time.perf_counter()
+    ...
+    RENDER_STAGE_SECONDS.observe(time.perf_counter() - start, stage='decode')
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 渲染类操作耗时较长，使用更宽的分桶
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_registry: List['_Metric'] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}'
+                for k, v in items]
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各分桶计数..., +Inf 计数, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            data[index] += 1
+            data[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), data[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(data[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render_text() -> str:
+    """导出所有指标（Prometheus 文本格式）"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+# ==================== 指标定义 ====================
+
+# HTTP 服务
+HTTP_REQUESTS = Counter(
+    'whitenoise_http_requests_total', 'HTTP 请求总数',
+    ('method', 'route', 'status'))
+HTTP_REQUEST_SECONDS = Histogram(
+    'whitenoise_http_request_duration_seconds', 'HTTP 请求耗时',
+    ('method', 'route'))
+
+# 渲染
+RENDER_SECONDS = Histogram(
+    'whitenoise_render_duration_seconds', '整个组合渲染耗时',
+    buckets=SLOW_BUCKETS)
+RENDER_STAGE_SECONDS = Histogram(
+    'whitenoise_render_stage_duration_seconds', '渲染各阶段耗时',
+    ('stage',), buckets=SLOW_BUCKETS)
+RENDER_JOBS = Gauge(
+    'whitenoise_render_jobs', '排队及进行中的渲染任务数')
+RENDER_ERRORS = Counter(
+    'whitenoise_render_errors_total', '渲染失败次数（含单个音轨失败）',
+    ('scope',))
+
+# 音频解码
+DECODE_SECONDS = Histogram(
+    'whitenoise_audio_decode_duration_seconds', '音频文件解码耗时',
+    buckets=SLOW_BUCKETS)
+DECODE_ERRORS = Counter(
+    'whitenoise_audio_decode_errors_total', '音频文件解码失败次数')
+
+# 缓存
+CACHE_REQUESTS = Counter(
+    'whitenoise_cache_requests_total', '缓存查询次数',
+    ('cache', 'result'))
+
+# LLM
+LLM_REQUESTS = Counter(
+    'whitenoise_llm_requests_total', 'LLM 生成请求数（按结果分类）',
+    ('outcome',))
+LLM_REQUEST_SECONDS = Histogram(
+    'whitenoise_llm_request_duration_seconds', 'LLM API 请求耗时',
+    ('outcome',))
+LLM_RETRIES = Counter(
+    'whitenoise_llm_retries_total', 'LLM API 请求重试次数（按原因分类）',
+    ('reason',))
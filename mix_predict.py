@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Mix Predict - 不渲染音频，预测组合的混音响度与频带能量
+
+每个音效在分析时已经得到逐秒的频带能量和 K 加权功率（audio_features 的 band_profile）。
+按音轨的起止时间、循环、淡入淡出和音量把它们按功率相加，就能得到组合逐秒的
+响度和各频带能量，毫秒级完成，不解码任何音频：
+
+- 各音轨按互不相关的声音处理，功率直接相加
+- 淡入淡出与 pydub 一致，按振幅线性变化
+- 只有抽样快速分析结果（没有 band_profile）的音效按平均频带能量和响度近似为恒定值
+
+据此给出警告：可能削波、整体过响/过轻、低频过多发闷，以及同一频带被两个音轨同时占据（掩蔽）。
+"""
+
+import os
+import math
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_features import BANDS, gated_loudness, to_db
+from feature_store import get_feature_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+
+# 预测的时间分辨率（秒），与 band_profile 一致
+RESOLUTION = 1.0
+
+# 综合响度的合理范围（LUFS）
+LOUD_LUFS = float(os.environ.get('MIX_LOUD_LUFS', '-14'))
+QUIET_LUFS = float(os.environ.get('MIX_QUIET_LUFS', '-45'))
+# 峰值估计超过此值（dBFS）视为可能削波
+CLIP_DB = 0.0
+# 低频（sub + bass + low_mid）占比超过此值视为发闷
+MUDDY_SHARE = 0.6
+LOW_BANDS = ('sub', 'bass', 'low_mid')
+# 掩蔽：两个音轨在同一频带的能量相差不超过 MASKING_RANGE_DB，
+# 且该频带都占各自能量的 MASKING_SHARE 以上
+MASKING_RANGE_DB = 6.0
+MASKING_SHARE = 0.35
+# 持续至少这么多秒才报告
+MIN_WARNING_SECONDS = 3
+# 低于此电平（dBFS）的时段不检查频带平衡
+SILENCE_DB = -60.0
+
+# 可预测的最长组合（秒）
+MAX_DURATION = 6 * 3600
+
+# 音效频带档案缓存（按内容哈希）
+PROFILE_CACHE_SIZE = 64
+
+BAND_NAMES = [name for name, _, _ in BANDS]
+
+
+class SourceProfile:
+    """单个音效的逐秒频带功率、K 加权功率与峰值因数"""
+
+    def __init__(self, power: np.ndarray, k_power: np.ndarray, crest_db: float, estimated: bool):
+        self.power = power
+        self.k_power = k_power
+        self.crest_db = crest_db
+        # 没有逐秒数据，用平均值近似
+        self.estimated = estimated
+
+    def __len__(self):
+        return len(self.k_power)
+
+    @classmethod
+    def from_features(cls, features: Dict) -> 'SourceProfile':
+        crest_db = max(0.0, features['peak_db'] - features['mean_db'])
+        profile = features.get('band_profile')
+        if profile:
+            return cls(np.array(profile['power'], dtype=np.float64),
+                       np.array(profile['k_power'], dtype=np.float64), crest_db, False)
+
+        # 抽样分析只有整体统计：按平均频带占比与响度近似为恒定
+        seconds = max(1, int(round(features['duration_seconds'] / RESOLUTION)))
+        mean_ms = 10 ** (features['mean_db'] / 10)
+        shares = np.array([features['band_energies'].get(name, 0.0) for name in BAND_NAMES])
+        loudness = features.get('loudness_lufs')
+        k_power = 10 ** ((loudness + 0.691) / 10) if loudness is not None else 2 * mean_ms
+        return cls(np.tile(shares * mean_ms, (seconds, 1)), np.full(seconds, k_power), crest_db, True)
+
+
+_profiles: 'OrderedDict[str, SourceProfile]' = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def load_profile(filename: str, audio_dir: str = AUDIO_DIR) -> Optional[SourceProfile]:
+    """读取音效的频带档案，文件不存在或尚未分析时返回 None"""
+    path = os.path.join(audio_dir, filename)
+    if os.path.basename(filename) != filename or not os.path.exists(path):
+        return None
+
+    store = get_feature_store()
+    digest = store.content_hash(path)
+    with _profiles_lock:
+        if digest in _profiles:
+            _profiles.move_to_end(digest)
+            return _profiles[digest]
+
+    features = store.get_any(digest)
+    if features is None:
+        return None
+    profile = SourceProfile.from_features(features)
+
+    with _profiles_lock:
+        _profiles[digest] = profile
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+
+def track_envelope(track: Dict, times: np.ndarray, source_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    音轨在各时间点的振幅增益与对应的源文件秒序号
+
+    不循环且源文件比音轨短时，与渲染一致在源文件结束处淡出。
+
+    Returns:
+        (增益, 源序号)，音轨不发声的时间点增益为 0
+    """
+    start = float(track.get('start', 0))
+    end = float(track['end'])
+    loop = track.get('loop', True)
+    if not loop:
+        end = min(end, start + source_length * RESOLUTION)
+    fade_in = float(track.get('fade_in', 0))
+    fade_out = float(track.get('fade_out', 0))
+    volume = float(track.get('volume', 1.0))
+
+    elapsed = times - start
+    index = np.floor(elapsed / RESOLUTION).astype(int)
+    active = (times >= start) & (times < end)
+    if loop:
+        index = np.mod(index, source_length)
+    else:
+        active &= index < source_length
+    index = np.clip(index, 0, source_length - 1)
+
+    gain = np.where(active, volume, 0.0)
+    if fade_in > 0:
+        gain *= np.clip(elapsed / fade_in, 0.0, 1.0)
+    if fade_out > 0:
+        gain *= np.clip((end - times) / fade_out, 0.0, 1.0)
+    return gain, index
+
+
+def _spans(mask: np.ndarray, times: np.ndarray) -> List[Tuple[float, float]]:
+    """mask 中连续为 True 且不短于 MIN_WARNING_SECONDS 的时段"""
+    spans = []
+    padded = np.concatenate([[False], mask, [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    for begin, end in zip(changes[::2], changes[1::2]):
+        if (end - begin) * RESOLUTION >= MIN_WARNING_SECONDS:
+            spans.append((float(times[begin] - RESOLUTION / 2), float(times[end - 1] + RESOLUTION / 2)))
+    return spans
+
+
+def _warning(kind: str, message: str, span: Optional[Tuple[float, float]] = None,
+             tracks: Optional[List[str]] = None) -> Dict:
+    warning = {'type': kind, 'message': message}
+    if span is not None:
+        warning['start'] = round(span[0], 1)
+        warning['end'] = round(span[1], 1)
+    if tracks:
+        warning['tracks'] = tracks
+    return warning
+
+
+def predict_mix(composition, audio_dir: str = AUDIO_DIR) -> Dict:
+    """
+    预测组合的混音结果
+
+    Args:
+        composition: composer.Composition，或同样结构的 dict
+            （duration、tracks: [{audio, start, end, volume, fade_in, fade_out, loop}]）
+
+    Raises:
+        KeyError / TypeError / ValueError: 组合配置缺少字段或数值无效
+
+    Returns:
+        {
+            resolution: 时间分辨率（秒）,
+            loudness_lufs: 综合响度,
+            peak_db: 峰值估计（各时刻混音 RMS + 发声音轨中最大的峰值因数）,
+            loudness_curve: 逐秒响度（LUFS）,
+            band_curve: {频带: 逐秒能量（dBFS）},
+            band_energies: {频带: 全程能量占比},
+            warnings: [{type, message, start?, end?, tracks?}, ...],
+        }
+    """
+    if dataclasses.is_dataclass(composition):
+        composition = dataclasses.asdict(composition)
+    duration = float(composition['duration'])
+    if not 0 < duration <= MAX_DURATION:
+        raise ValueError(f'duration 必须在 0-{MAX_DURATION} 秒之间')
+    steps = max(1, int(math.ceil(duration / RESOLUTION)))
+    times = (np.arange(steps) + 0.5) * RESOLUTION
+
+    band_power = np.zeros((steps, len(BANDS)))
+    k_power = np.zeros(steps)
+    crest = np.full(steps, -np.inf)
+    contributions = []
+    warnings = []
+    unanalyzed = []
+
+    for track in composition.get('tracks', []):
+        audio = track.get('audio', '')
+        profile = load_profile(audio, audio_dir)
+        if profile is None or not len(profile):
+            if audio not in unanalyzed:
+                unanalyzed.append(audio)
+            continue
+
+        gain, index = track_envelope(track, times, len(profile))
+        power = profile.power[index] * (gain ** 2)[:, None]
+        band_power += power
+        k_power += profile.k_power[index] * gain ** 2
+        crest = np.where(gain > 0, np.maximum(crest, profile.crest_db), crest)
+        contributions.append((audio, power))
+
+    # 同一文件可能出现在多个音轨中，只报告一次
+    if unanalyzed:
+        warnings.append(_warning('unanalyzed', f"{'、'.join(unanalyzed)} 尚未分析，预测中未包含",
+                                 tracks=unanalyzed))
+
+    mix_ms = band_power.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        mix_db = 10 * np.log10(mix_ms)
+        loudness_curve = -0.691 + 10 * np.log10(k_power)
+    peak_db = np.where(np.isfinite(crest), mix_db + crest, -np.inf)
+    loudness = gated_loudness(k_power) if k_power.any() else None
+
+    # 削波
+    for span in _spans(peak_db > CLIP_DB, times):
+        warnings.append(_warning('clipping', f'{span[0]:.0f}s-{span[1]:.0f}s 的峰值估计超过 0 dBFS，可能削波', span))
+
+    # 整体响度
+    if loudness is not None and loudness > LOUD_LUFS:
+        warnings.append(_warning('too_loud', f'综合响度 {loudness:.1f} LUFS，高于 {LOUD_LUFS:.0f} LUFS，建议降低音量'))
+    elif loudness is not None and loudness < QUIET_LUFS:
+        warnings.append(_warning('too_quiet', f'综合响度 {loudness:.1f} LUFS，低于 {QUIET_LUFS:.0f} LUFS，可能听不清'))
+
+    # 低频过多
+    audible = mix_db > SILENCE_DB
+    low = band_power[:, [BAND_NAMES.index(name) for name in LOW_BANDS]].sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        low_share = np.where(audible, low / mix_ms, 0.0)
+    for span in _spans(low_share > MUDDY_SHARE, times):
+        warnings.append(_warning('muddy', f'{span[0]:.0f}s-{span[1]:.0f}s 低频能量占比过高，声音可能发闷', span))
+
+    # 掩蔽：同一频带被两个音轨以相近的能量占据
+    for i in range(len(contributions)):
+        for j in range(i + 1, len(contributions)):
+            (name_a, power_a), (name_b, power_b) = contributions[i], contributions[j]
+            if name_a == name_b:
+                continue
+            total_a = power_a.sum(axis=1, keepdims=True)
+            total_b = power_b.sum(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                close = np.abs(10 * np.log10(power_a / power_b)) <= MASKING_RANGE_DB
+                dominant = (power_a >= MASKING_SHARE * total_a) & (power_b >= MASKING_SHARE * total_b)
+            for b, band in enumerate(BAND_NAMES):
+                for span in _spans(close[:, b] & dominant[:, b] & audible, times):
+                    warnings.append(_warning(
+                        'masking',
+                        f'{span[0]:.0f}s-{span[1]:.0f}s {name_a} 与 {name_b} 在 {band} 频带能量相近，可能相互掩蔽',
+                        span, [name_a, name_b]
+                    ))
+
+    total_power = band_power.sum(axis=0)
+    total = total_power.sum()
+    return {
+        'resolution': RESOLUTION,
+        'duration': duration,
+        'loudness_lufs': round(float(loudness), 2) if loudness is not None else None,
+        'peak_db': round(float(peak_db.max()), 2) if np.isfinite(peak_db).any() else None,
+        'loudness_curve': [round(max(float(v), -70.0), 1) for v in loudness_curve],
+        'band_curve': {
+            name: [round(to_db(float(v)), 1) for v in band_power[:, b]]
+            for b, name in enumerate(BAND_NAMES)
+        },
+        'band_energies': {
+            name: round(float(total_power[b] / total), 4) if total > 0 else 0.0
+            for b, name in enumerate(BAND_NAMES)
+        },
+        'warnings': warnings,
+    }
+
+
+def mix_warnings(composition) -> List[Dict]:
+    """只返回预测的警告；预测失败时返回空列表，不影响调用方"""
+    try:
+        return predict_mix(composition)['warnings']
+    except Exception as e:
+        print(f"混音预测失败: {e}")
+        return []
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import yaml
+
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            composition = yaml.safe_load(f)
+        started = time.perf_counter()
+        prediction = predict_mix(composition)
+        print(f"🔮 {composition.get('name', path)}  ({(time.perf_counter() - started) * 1000:.1f}ms)")
+        print(f"   响度: {prediction['loudness_lufs']} LUFS，峰值估计: {prediction['peak_db']} dBFS")
+        print(f"   频带占比: {prediction['band_energies']}")
+        for warning in prediction['warnings']:
+            print(f"   ⚠️  {warning['message']}")
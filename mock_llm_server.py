@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Mock LLM Server - 本地 chat completions 替身服务
+
+用于在不调用 DeepSeek（不产生费用）的情况下压测 /api/ai/compose。
+按音效库随机编排出符合提示词格式的组合 YAML，支持：
+
+- 模拟延迟：首 token 延迟 + 按速率逐块输出
+- 流式输出（请求体 stream: true 时返回 SSE）
+- 错误注入：429（带 Retry-After）、500、无效文件名
+
+用法:
+    python mock_llm_server.py --port 8001 --ttfb 0.8 --tokens-per-second 80 --error-rate 0.05
+    DEEPSEEK_API_URL=http://127.0.0.1:8001/chat/completions DEEPSEEK_API_KEY=mock python server.py
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from catalog import load_catalog_cached, iter_files
+
+# 每个流式块包含的字符数（约等于一个 token）
+CHUNK_CHARS = 4
+
+# 三层结构对应的分类与音量范围
+LAYERS = (
+    ('base', ('rain_sounds', 'wind_sounds', 'water_sounds'), (0.15, 0.30), 1, 2),
+    ('main', ('urban_ambience', 'fire_sounds', 'water_sounds', 'nature_ambience'), (0.35, 0.55), 1, 2),
+    ('accent', ('nature_ambience', 'thunderstorm', 'clock_ticking', 'meditation_spiritual'), (0.25, 0.45), 1, 2),
+)
+
+
+def random_composition(rng: random.Random, invalid: bool = False) -> str:
+    """生成一首符合提示词格式的随机组合（YAML 代码块）"""
+    data = load_catalog_cached()[1]
+    by_category = {}
+    for category_id, file_info in iter_files(data):
+        by_category.setdefault(category_id, []).append(file_info['filename'])
+
+    duration = rng.choice((300, 360, 420, 480, 600))
+    lines = [
+        '```yaml',
+        f'name: 模拟作品{rng.randint(1, 999)}',
+        'description: 本地替身服务生成的组合',
+        f'duration: {duration}',
+        'tracks:',
+    ]
+
+    used = set()
+    for layer, categories, (low, high), min_count, max_count in LAYERS:
+        pool = [f for c in categories for f in by_category.get(c, []) if f not in used]
+        for _ in range(rng.randint(min_count, max_count)):
+            if not pool:
+                break
+            audio = pool.pop(rng.randrange(len(pool)))
+            used.add(audio)
+
+            if layer == 'base':
+                start, end = 0, duration
+            elif layer == 'main':
+                start = rng.randint(10, 60)
+                end = duration - rng.randint(0, 60)
+            else:
+                start = rng.randint(30, duration // 2)
+                end = min(duration, start + rng.randint(30, 120))
+
+            lines += [
+                f'  - audio: {audio}',
+                f'    start: {start}',
+                f'    end: {end}',
+                f'    volume: {round(rng.uniform(low, high), 2)}',
+                f'    fade_in: {rng.randint(3, 20)}',
+                f'    fade_out: {rng.randint(5, 30)}',
+                f'    loop: {"true" if layer != "accent" else "false"}',
+            ]
+
+    if invalid:
+        lines += ['  - audio: does-not-exist.mp3', '    start: 0']
+
+    lines.append('```')
+    return '\n'.join(lines)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """处理 POST /chat/completions"""
+
+    protocol_version = 'HTTP/1.1'
+    config = None  # argparse.Namespace，由 serve() 设置
+    lock = threading.Lock()
+    rng = random.Random()
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'invalid json'}})
+            return
+
+        config = self.config
+        with self.lock:
+            roll = self.rng.random()
+            invalid = self.rng.random() < config.invalid_rate
+            seed = self.rng.random()
+
+        # 错误注入
+        if roll < config.rate_limit_rate:
+            self._send_json(429, {'error': {'message': 'rate limited'}},
+                            headers={'Retry-After': str(config.retry_after)})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            time.sleep(config.ttfb)
+            self._send_json(500, {'error': {'message': 'injected server error'}})
+            return
+
+        content = random_composition(random.Random(seed), invalid=invalid)
+        time.sleep(max(0.0, random.gauss(config.ttfb, config.ttfb * config.jitter)))
+
+        if request.get('stream'):
+            self._stream(content)
+        else:
+            time.sleep(len(content) / CHUNK_CHARS / config.tokens_per_second)
+            self._send_json(200, {
+                'id': 'mock',
+                'object': 'chat.completion',
+                'model': request.get('model', 'mock'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop',
+                }],
+            })
+
+    def _stream(self, content: str):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        interval = 1 / self.config.tokens_per_second
+        try:
+            for i in range(0, len(content), CHUNK_CHARS):
+                chunk = {'choices': [{'index': 0, 'delta': {'content': content[i:i + CHUNK_CHARS]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(config):
+    MockLLMHandler.config = config
+    MockLLMHandler.rng = random.Random(config.seed)
+    server = ThreadingHTTPServer((config.host, config.port), MockLLMHandler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地 chat completions 替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--ttfb', type=float, default=0.8, help='首 token 延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.25, help='首 token 延迟的相对标准差')
+    parser.add_argument('--tokens-per-second', type=float, default=80, help='输出速率')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='429 的 Retry-After（秒）')
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help='回复中包含不存在文件名的比例')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    config = parse_args()
+    server = serve(config)
+    print("🤖 Mock LLM 服务")
+    print(f"   地址: http://{config.host}:{config.port}/chat/completions")
+    print(f"   首 token 延迟: {config.ttfb}s, 输出速率: {config.tokens_per_second} tok/s")
+    print(f"   错误注入: 500 {config.error_rate:.0%}, 429 {config.rate_limit_rate:.0%}, "
+          f"无效文件 {config.invalid_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
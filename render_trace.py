@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Render Trace - 单次渲染的分阶段追踪
+
+记录 compose_audio / render_composition 中每个阶段（decode、loop、fade、gain、
+mix、export）以及每个音轨的耗时和内存，渲染结束后以 JSON 清单形式写在输出文件旁边。
+每个阶段的耗时同时计入 metrics 中的渲染阶段直方图。
+
+内存数据是整个进程的常驻内存，多个渲染同时进行时会相互影响；
+清单中的 concurrent_renders 记录本次渲染期间同时进行的渲染数（含自身），大于 1 时内存数据仅供参考。
+不支持 resource 模块的平台（Windows）内存数据为 None。
+"""
+
+import os
+import sys
+import json
+import time
+import weakref
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from metrics import RENDER_STAGE_SECONDS
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# 进行中的渲染（包括不保存明细的追踪），对象释放后自动移除
+_active: 'weakref.WeakSet[RenderTrace]' = weakref.WeakSet()
+_active_lock = threading.Lock()
+
+
+def current_rss_mb() -> Optional[float]:
+    """当前进程常驻内存（MB），不支持 /proc 的平台退化为峰值内存"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * _PAGE_SIZE / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程峰值常驻内存（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+class RenderTrace:
+    """
+    渲染追踪记录
+
+    enabled 为 False 时只把阶段耗时计入 metrics，不保存明细。
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: List[Dict] = []
+        self.tracks: List[Dict] = []
+        self.extra: Dict = {}
+        self._current_track: Optional[Dict] = None
+        with _active_lock:
+            _active.add(self)
+            self.concurrent_renders = len(_active)
+
+    def _observe_concurrency(self):
+        with _active_lock:
+            self.concurrent_renders = max(self.concurrent_renders, len(_active))
+
+    def begin_track(self, index: int, track) -> None:
+        """开始记录一个音轨"""
+        if not self.enabled:
+            return
+        self._current_track = {
+            'index': index,
+            'audio': track.audio,
+            'start': track.start,
+            'end': track.end,
+            'loop': track.loop,
+            'seconds': 0.0,
+            'stages': {},
+        }
+        self.tracks.append(self._current_track)
+
+    def end_track(self, **info) -> None:
+        """结束当前音轨，可附带额外信息（如源文件时长、错误）"""
+        if self._current_track is not None:
+            self._current_track.update(info)
+        self._current_track = None
+
+    @contextmanager
+    def stage(self, stage: str):
+        """记录一个阶段的耗时与内存变化"""
+        rss_before = current_rss_mb() if self.enabled else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            RENDER_STAGE_SECONDS.observe(elapsed, stage=stage)
+
+            if self.enabled:
+                self._observe_concurrency()
+                rss_after = current_rss_mb()
+                record = {
+                    'stage': stage,
+                    'seconds': round(elapsed, 4),
+                    'rss_mb': rss_after,
+                    'rss_delta_mb': (round(rss_after - rss_before, 1)
+                                     if rss_after is not None and rss_before is not None else None),
+                }
+                track = self._current_track
+                if track is not None:
+                    record['track'] = track['index']
+                    track['seconds'] = round(track['seconds'] + elapsed, 4)
+                    track['stages'][stage] = round(
+                        track['stages'].get(stage, 0) + elapsed, 4)
+                self.stages.append(record)
+
+    def summary(self) -> Dict[str, float]:
+        """按阶段汇总耗时"""
+        totals: Dict[str, float] = {}
+        for record in self.stages:
+            totals[record['stage']] = round(totals.get(record['stage'], 0) + record['seconds'], 4)
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_seconds': round(time.perf_counter() - self._start, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'memory_scope': 'process',
+            'concurrent_renders': self.concurrent_renders,
+            'stage_totals': self.summary(),
+            'tracks': self.tracks,
+            'stages': self.stages,
+            **self.extra,
+        }
+
+    def write(self, path: str) -> str:
+        """写出 JSON 清单，本次渲染随之结束"""
+        self._observe_concurrency()
+        with _active_lock:
+            _active.discard(self)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
@@ -1,156 +1,244 @@
 #!/usr/bin/env python3
 """
 音频重新扫描脚本 - 根据 audio_descriptions.yaml 重新扫描所有音频的时长和音量
+
+- 特征从 feature_store 读取，只分析特征库中还没有的文件：未变化、改名或重复的文件都不会重新解码；
+  --full 忽略特征库全部重新分析
+- 多进程并行分析（--jobs，默认 CPU 核数），内容相同的文件只分析一次
+- --fast 抽样快速分析：只解码几个均匀分布的窗口估计音量和响度，每个文件耗时与长度无关；
+  特征库中已有完整分析结果时仍优先使用完整结果
+- 扫描结束后报告疑似重复的音效（内容相同或频谱嵌入高度相似），并原子写回 YAML
 """
 
-import yaml
+import os
+import sys
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
 try:
     from mutagen.mp3 import MP3
     HAS_MUTAGEN = True
 except ImportError:
     HAS_MUTAGEN = False
-    print("错误: 请先安装 mutagen: pip install mutagen")
-    exit(1)
 
-import subprocess
-import json
+from audio_features import analyze_file, format_duration
+from catalog import load_catalog, save_catalog
+from feature_store import ANALYZERS, get_feature_store
+from similarity_index import DUPLICATE_THRESHOLD, SimilarityIndex, print_duplicates
+
+# 写回 YAML 的分析字段
+INFO_FIELDS = ("duration_seconds", "duration_formatted", "volume_db", "volume_level",
+               "peak_db", "loudness_lufs", "bitrate_kbps")
+
 
+def volume_level(db: float) -> str:
+    """根据平均音量（dB）判断音量等级"""
+    if db > -15:
+        return "loud"
+    elif db > -25:
+        return "medium"
+    elif db > -35:
+        return "soft"
+    return "very_soft"
 
-def get_audio_info(filepath: str) -> dict:
-    """获取音频文件的时长和音量信息"""
+
+def header_info(filepath: str) -> dict:
+    """mutagen 只读取文件头，获取时长和比特率"""
     result = {
         "duration_seconds": None,
         "duration_formatted": None,
         "volume_level": "unknown",
         "volume_db": None,
     }
-    
-    # 使用 mutagen 获取时长和比特率
+    if not HAS_MUTAGEN:
+        return result
     try:
         audio = MP3(filepath)
         duration = audio.info.length
         result["duration_seconds"] = round(duration, 2)
-        result["duration_formatted"] = f"{int(duration // 60)}:{int(duration % 60):02d}"
+        result["duration_formatted"] = format_duration(duration)
         result["bitrate_kbps"] = audio.info.bitrate // 1000
     except Exception as e:
         print(f"  获取时长失败: {e}")
-        return result
+    return result
+
+
+def get_audio_info(filepath: str, features: Optional[Dict] = None) -> dict:
+    """
+    获取音频文件的时长和音量信息
+
+    Args:
+        features: 已有的 audio_features 特征；为 None 时解码分析（解码失败只返回 mutagen 读到的时长）
+    """
+    # 比特率来自文件头，解码失败时也用文件头的时长兜底
+    result = header_info(filepath)
     
-    # 使用 ffprobe 获取精确音量 (mean_volume)
+    # 解码一次，得到精确时长、平均音量（与 volumedetect 的 mean_volume 一致）、峰值和响度
+    if features is None:
+        if result["duration_seconds"] is None:
+            return result
+        try:
+            features = analyze_file(filepath)
+        except Exception as e:
+            print(f"  获取音量失败: {e}")
+            return result
+
+    result["duration_seconds"] = features["duration_seconds"]
+    result["duration_formatted"] = format_duration(features["duration_seconds"])
+    result["volume_db"] = features["mean_db"]
+    result["volume_level"] = volume_level(features["mean_db"])
+    result["peak_db"] = features["peak_db"]
+    result["loudness_lufs"] = features["loudness_lufs"]
+    return result
+
+
+def _analyze(filepath: str, analyzer: str) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """进程池任务：分析单个文件，返回 (路径, 特征, 错误信息)"""
     try:
-        cmd = [
-            "ffprobe", "-v", "quiet",
-            "-print_format", "json",
-            "-show_format",
-            "-af", "volumedetect",
-            filepath
-        ]
-        # 使用 ffmpeg 的 volumedetect 滤镜获取精确音量
-        cmd2 = [
-            "ffmpeg", "-i", filepath,
-            "-af", "volumedetect",
-            "-f", "null", "-"
-        ]
-        proc = subprocess.run(cmd2, capture_output=True, text=True, timeout=30)
-        stderr = proc.stderr
-        
-        # 解析 mean_volume
-        for line in stderr.split('\n'):
-            if 'mean_volume' in line:
-                # 格式: [Parsed_volumedetect_0 @ ...] mean_volume: -23.5 dB
-                parts = line.split('mean_volume:')
-                if len(parts) > 1:
-                    db_str = parts[1].strip().replace('dB', '').strip()
-                    db = float(db_str)
-                    result["volume_db"] = round(db, 2)
-                    
-                    # 根据 dB 判断音量等级
-                    if db > -15:
-                        result["volume_level"] = "loud"
-                    elif db > -25:
-                        result["volume_level"] = "medium"
-                    elif db > -35:
-                        result["volume_level"] = "soft"
-                    else:
-                        result["volume_level"] = "very_soft"
-                    break
+        return filepath, ANALYZERS[analyzer][1](filepath), None
     except Exception as e:
-        print(f"  获取音量失败: {e}")
-    
-    return result
+        return filepath, None, str(e)
+
+
+def apply_info(file_entry: Dict, info: Dict) -> bool:
+    """把分析结果写入文件条目，返回条目是否有变化"""
+    before = {k: file_entry.get(k) for k in INFO_FIELDS}
+
+    file_entry["duration_seconds"] = info["duration_seconds"]
+    file_entry["duration_formatted"] = info["duration_formatted"]
+
+    if info["volume_db"] is not None:
+        file_entry["volume_db"] = info["volume_db"]
+        file_entry["volume_level"] = info["volume_level"]
+    if info.get("loudness_lufs") is not None:
+        file_entry["peak_db"] = info["peak_db"]
+        file_entry["loudness_lufs"] = info["loudness_lufs"]
+    if info.get("bitrate_kbps"):
+        file_entry["bitrate_kbps"] = info["bitrate_kbps"]
+
+    return before != {k: file_entry.get(k) for k in INFO_FIELDS}
+
 
+def rescan_yaml(yaml_path: str, audio_dir: str, jobs: Optional[int] = None, full: bool = False,
+                fast: bool = False):
+    """
+    重新扫描 YAML 中的音频文件
 
-def rescan_yaml(yaml_path: str, audio_dir: str):
-    """重新扫描 YAML 中所有音频文件"""
+    Args:
+        jobs: 并行进程数，默认 CPU 核数
+        full: 忽略特征库，重新分析所有文件
+        fast: 缺失的特征用抽样快速分析计算
+    """
     yaml_path = Path(yaml_path)
     audio_dir = Path(audio_dir)
-    
-    # 读取现有 YAML
-    with open(yaml_path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-    
+    store = get_feature_store()
+    analyzer = "fast" if fast else "full"
+
+    data = load_catalog(str(yaml_path))
+
     total_files = 0
+    cached_files = 0
     updated_files = 0
     errors = []
-    
-    # 遍历所有分类
+    # (文件条目, 路径, 内容哈希)
+    entries: List[Tuple[Dict, Path, str]] = []
+    # 特征: 内容哈希 -> 特征
+    features: Dict[str, Dict] = {}
+    # 待分析: 内容哈希 -> 路径（内容相同的文件只分析一次）
+    pending: Dict[str, str] = {}
+
+    # 遍历所有分类，找出特征库中还没有的文件
     for cat_key, cat_data in data.get("categories", {}).items():
-        print(f"\n📁 分类: {cat_data.get('name_zh', cat_key)}")
-        
         for file_entry in cat_data.get("files", []):
             filename = file_entry.get("filename")
             if not filename:
                 continue
-            
+
             total_files += 1
             filepath = audio_dir / filename
-            
+
             if not filepath.exists():
                 errors.append(f"文件不存在: {filename}")
                 print(f"  ❌ {filename} - 文件不存在")
                 continue
-            
-            print(f"  🔍 {filename}", end="")
-            
-            # 获取音频信息
-            info = get_audio_info(str(filepath))
-            
-            if info["duration_seconds"] is not None:
-                old_duration = file_entry.get("duration_seconds")
-                file_entry["duration_seconds"] = info["duration_seconds"]
-                file_entry["duration_formatted"] = info["duration_formatted"]
-                
-                if info["volume_db"] is not None:
-                    file_entry["volume_db"] = info["volume_db"]
-                    file_entry["volume_level"] = info["volume_level"]
-                if info.get("bitrate_kbps"):
-                    file_entry["bitrate_kbps"] = info["bitrate_kbps"]
-                
-                updated_files += 1
-                
-                # 显示变化
-                duration_str = f" [{info['duration_formatted']}]"
-                volume_str = f" [{info['volume_level']}: {info['volume_db']}dB]" if info["volume_db"] else ""
-                print(f"{duration_str}{volume_str}")
+
+            digest = store.content_hash(str(filepath))
+            entries.append((file_entry, filepath, digest))
+            if digest in features or digest in pending:
+                continue
+
+            cached = None
+            if not full:
+                cached = store.get_any(digest, ("full", "fast") if fast else ("full",))
+            if cached is not None:
+                features[digest] = cached
+                cached_files += 1
             else:
-                print(" - 分析失败")
-    
-    # 写回 YAML
-    with open(yaml_path, 'w', encoding='utf-8') as f:
-        yaml.dump(data, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
-    
+                pending[digest] = str(filepath)
+
+    print(f"\n🔍 待分析 {len(pending)} 个文件，特征库已有 {cached_files} 个")
+
+    # 并行分析，结果写入特征库
+    if pending:
+        digests = {path: digest for digest, path in pending.items()}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_analyze, path, analyzer) for path in pending.values()]
+            for future in as_completed(futures):
+                path, result, error = future.result()
+                if result is None:
+                    print(f"  ⚠️  {Path(path).name} - 解码失败: {error}")
+                    continue
+                features[digests[path]] = result
+                store.put(digests[path], result, analyzer)
+                error_str = ""
+                if result.get("error_db", {}).get("mean_db"):
+                    error_str = f" ±{result['error_db']['mean_db']}dB"
+                print(f"  🔍 {Path(path).name} [{format_duration(result['duration_seconds'])}] "
+                      f"[{result['mean_db']}dB{error_str}, {result['loudness_lufs']} LUFS]")
+
+    # 用特征更新文件条目
+    for file_entry, filepath, digest in entries:
+        if digest in features:
+            info = get_audio_info(str(filepath), features[digest])
+        else:
+            # 解码失败：只更新 mutagen 读到的时长
+            info = header_info(str(filepath))
+        if info["duration_seconds"] is None:
+            errors.append(f"分析失败: {filepath.name}")
+            continue
+        if apply_info(file_entry, info):
+            updated_files += 1
+
+    # 疑似重复报告：内容完全相同的文件，以及频谱嵌入高度相似的文件
+    by_name = {filepath.name: features[digest] for _, filepath, digest in entries if digest in features}
+    same_content = {}
+    for _, filepath, digest in entries:
+        same_content.setdefault(digest, set()).add(filepath.name)
+    identical = [sorted(names) for names in same_content.values() if len(names) > 1]
+    if identical:
+        print(f"\n📎 内容完全相同的文件:")
+        for names in identical:
+            print(f"   {'  =  '.join(names)}")
+    print()
+    print_duplicates(SimilarityIndex.from_features(by_name).duplicates(DUPLICATE_THRESHOLD), DUPLICATE_THRESHOLD)
+
+    # 原子写回 YAML
+    if updated_files:
+        save_catalog(data, str(yaml_path))
+
     # 输出统计
     print(f"\n{'='*50}")
     print(f"✅ 扫描完成!")
     print(f"   总文件数: {total_files}")
-    print(f"   已更新: {updated_files}")
+    print(f"   新分析: {len(pending)}")
+    print(f"   条目有变化: {updated_files}")
     if errors:
         print(f"   错误: {len(errors)}")
         for err in errors:
             print(f"     - {err}")
-    print(f"\n📄 YAML 已更新: {yaml_path}")
+    if updated_files:
+        print(f"\n📄 YAML 已更新: {yaml_path}")
 
 
 if __name__ == "__main__":
@@ -166,8 +254,20 @@ if __name__ == "__main__":
         print(f"错误: 音频目录不存在 - {audio_dir}")
         exit(1)
     
+    if not HAS_MUTAGEN:
+        print("错误: 请先安装 mutagen: pip install mutagen")
+        exit(1)
+    
+    jobs = None
+    if "--jobs" in sys.argv:
+        jobs = int(sys.argv[sys.argv.index("--jobs") + 1])
+    full = "--full" in sys.argv
+    fast = "--fast" in sys.argv
+    
     print("🎵 音频重新扫描工具")
     print(f"   YAML: {yaml_path}")
     print(f"   音频目录: {audio_dir}")
+    print(f"   模式: {'全量' if full else '增量'}{'（抽样快速分析）' if fast else ''}，"
+          f"并行进程: {jobs or os.cpu_count()}")
     
-    rescan_yaml(str(yaml_path), str(audio_dir))
+    rescan_yaml(str(yaml_path), str(audio_dir), jobs=jobs, full=full, fast=fast)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Rule Composer - 基于规则的本地作曲
+
+不调用 LLM，按 llm_composer 系统提示词中的作曲规则直接从音效库编排组合，毫秒级返回：
+
+- 用 catalog_index 按场景描述为每个音效打分，选出 基底层 / 主体层 / 点缀层
+- 每层每个分类最多一个音效，基底层和主体层之间也不重复分类，避免相似频率的声音叠加
+- 音量按层级范围和原始音量级别（volume_level）确定
+- 基底层先入、长淡入；主体层错开加入；点缀层不循环，分几次间歇出现
+
+用作 AI 作曲的即时草稿，以及 LLM 超时、不可用或未配置时的兜底结果。
+"""
+
+import uuid
+import random
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from catalog import load_catalog_cached
+from catalog_index import get_catalog_index
+from mix_predict import mix_warnings
+
+DEFAULT_DURATION = 360
+
+# 层级: (可选分类, 音量范围, 最少数量, 最多数量)
+LAYERS = {
+    'base': (('rain_sounds', 'wind_sounds', 'water_sounds'), (0.15, 0.30), 1, 2),
+    'main': (('urban_ambience', 'fire_sounds', 'water_sounds', 'nature_ambience',
+              'thunderstorm', 'meditation_spiritual', 'rain_sounds'), (0.35, 0.55), 1, 2),
+    'accent': (('nature_ambience', 'thunderstorm', 'clock_ticking', 'meditation_spiritual',
+                'fire_sounds', 'miscellaneous'), (0.25, 0.45), 1, 2),
+}
+
+# 原始音量级别在层级音量范围中的位置：越安静的素材音量设得越高
+LEVEL_POSITION = {'very_soft': 1.0, 'soft': 0.7, 'medium': 0.4, 'loud': 0.0}
+# 原始音量级别的音量上限
+LEVEL_CAP = {'very_soft': 0.8, 'soft': 0.6, 'medium': 0.5, 'loud': 0.35}
+
+# 第二个基底/主体/点缀音效的相关度至少是同层第一个的这个比例才加入
+SECOND_PICK_RATIO = 0.5
+
+
+def _scene_rng(scene: str) -> random.Random:
+    """同一场景得到相同的编排"""
+    seed = int(hashlib.sha1(scene.encode('utf-8')).hexdigest()[:12], 16)
+    return random.Random(seed)
+
+
+def _volume(layer: str, file_info: Dict) -> float:
+    low, high = LAYERS[layer][1]
+    level = file_info.get('volume_level', 'medium')
+    volume = low + (high - low) * LEVEL_POSITION.get(level, 0.4)
+    return round(min(volume, LEVEL_CAP.get(level, 0.5)), 2)
+
+
+def select_layers(scene: str) -> Dict[str, List[Tuple[str, Dict]]]:
+    """
+    按相关度为每一层挑选音效
+
+    Returns:
+        {'base': [(分类 ID, 文件条目), ...], 'main': [...], 'accent': [...]}
+    """
+    index = get_catalog_index()
+    scores = index.scores(scene)
+    order = sorted(range(len(index.entries)), key=lambda i: (-scores[i], i))
+
+    used_files = set()
+    used_categories = set()
+    layers = {}
+
+    for layer, (categories, _, min_count, max_count) in LAYERS.items():
+        picks = []
+        layer_categories = set()
+        for i in order:
+            category_id, file_info = index.entries[i]
+            if category_id not in categories or file_info['filename'] in used_files:
+                continue
+            # 每层每个分类只取一个；基底层和主体层之间也不重复
+            if category_id in layer_categories or (layer != 'accent' and category_id in used_categories):
+                continue
+            if len(picks) >= min_count and scores[i] < scores[picks[0]] * SECOND_PICK_RATIO:
+                break
+            if len(picks) >= min_count and scores[i] <= 0:
+                break
+
+            picks.append(i)
+            layer_categories.add(category_id)
+            used_files.add(file_info['filename'])
+            if layer != 'accent':
+                used_categories.add(category_id)
+            if len(picks) >= max_count:
+                break
+
+        layers[layer] = [index.entries[i] for i in picks]
+
+    return layers
+
+
+def _accent_windows(rng: random.Random, duration: float, length: float,
+                    count: int) -> List[Tuple[float, float]]:
+    """点缀层的间歇时段：在 30s 到结尾前 60s 之间均匀分段，每段内随机出现一次"""
+    first, last = 30.0, max(60.0, duration - 60.0)
+    span = (last - first) / count
+    windows = []
+    for k in range(count):
+        segment_start = first + span * k
+        start = segment_start + rng.uniform(0, max(0.0, span - length))
+        windows.append((round(start), round(min(start + length, duration))))
+    return windows
+
+
+def compose_tracks(scene: str, layers: Dict[str, List[Tuple[str, Dict]]],
+                   duration: float = DEFAULT_DURATION) -> List[Dict]:
+    """按规则为 select_layers 选出的音效编排音轨"""
+    rng = _scene_rng(scene)
+    tracks = []
+
+    # 基底层：全程存在，第一个从 0 开始，其余稍晚加入
+    for k, (_, file_info) in enumerate(layers['base']):
+        start = 0 if k == 0 else rng.randint(8, 20)
+        tracks.append({
+            'audio': file_info['filename'],
+            'start': start,
+            'end': duration,
+            'volume': _volume('base', file_info),
+            'fade_in': rng.randint(15, 30),
+            'fade_out': rng.randint(25, 40),
+            'loop': True,
+        })
+
+    # 主体层：30s 左右开始陆续加入，错开 10-30s，部分提前淡出
+    start = rng.randint(20, 40)
+    for k, (_, file_info) in enumerate(layers['main']):
+        end = duration if k == 0 else duration - rng.randint(30, 60)
+        fade_in = rng.randint(8, 15)
+        tracks.append({
+            'audio': file_info['filename'],
+            'start': start,
+            'end': end,
+            'volume': _volume('main', file_info),
+            'fade_in': fade_in,
+            'fade_out': fade_in * 2,
+            'loop': True,
+        })
+        start += rng.randint(10, 30)
+
+    # 点缀层：不循环，分 2-3 次间歇出现
+    for _, file_info in layers['accent']:
+        source_seconds = file_info.get('duration_seconds') or 60
+        length = min(source_seconds, rng.randint(30, 60))
+        count = 3 if duration >= 300 else 2
+        fade_in = rng.randint(3, 8)
+        for window_start, window_end in _accent_windows(rng, duration, length, count):
+            tracks.append({
+                'audio': file_info['filename'],
+                'start': window_start,
+                'end': window_end,
+                'volume': _volume('accent', file_info),
+                'fade_in': fade_in,
+                'fade_out': min(fade_in * 2, max(1, (window_end - window_start) // 2)),
+                'loop': False,
+            })
+
+    return tracks
+
+
+def _title(layers: Dict[str, List[Tuple[str, Dict]]]) -> Tuple[str, str]:
+    """用主体层与基底层的描述拼出名称和描述"""
+    catalog = load_catalog_cached()[1]['categories']
+    picks = layers['main'][:1] + layers['base'][:1]
+    names = [catalog[c].get('name_zh', c) for c, _ in picks]
+    name = '与'.join(dict.fromkeys(names)) or '环境音'
+    descriptions = [f.get('description_zh', '') for _, f in layers['base'] + layers['main'] + layers['accent']]
+    return f"{name}小品", '，'.join(d for d in descriptions if d)
+
+
+def compose(scene: str, duration: float = DEFAULT_DURATION) -> Optional[Dict]:
+    """
+    为场景生成组合配置（与 LLM 输出的 YAML 格式相同）
+
+    Returns:
+        组合 dict，音效库为空时返回 None
+    """
+    layers = select_layers(scene)
+    if not any(layers.values()):
+        return None
+
+    name, description = _title(layers)
+    return {
+        'name': name,
+        'description': description,
+        'duration': duration,
+        'tracks': compose_tracks(scene, layers, duration),
+    }
+
+
+def compose_result(scene: str, duration: float = DEFAULT_DURATION) -> Dict:
+    """生成与 generate_composition 相同格式的结果，带有 source: 'rules'"""
+    composition = compose(scene, duration)
+    if composition is None:
+        return {'success': False, 'error': '音效库为空，无法生成组合'}
+
+    return {
+        'success': True,
+        'id': f"ai_{uuid.uuid4().hex[:8]}",
+        'composition': composition,
+        'yaml_content': yaml.dump(composition, allow_unicode=True, default_flow_style=False, sort_keys=False),
+        'source': 'rules',
+        'mix_warnings': mix_warnings(composition),
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    scene = ' '.join(sys.argv[1:]) or '深夜的咖啡馆，窗外下着小雨，室内有轻柔的人声和时钟的滴答声'
+    started = time.perf_counter()
+    result = compose_result(scene)
+    print(f"🎼 {scene}  ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    print(result.get('yaml_content') or result['error'])
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Segment Render - 分段并行渲染组合
+
+把时间轴切成若干片段，在进程池中各自解码、混音，得到样本精确的 PCM，
+按顺序送入同一个编码器，只编码一次：
+
+- 每个片段只解码各音轨在该时段内用到的部分（ffmpeg 定位），片段之间逐样本连续，
+  拼接处没有间隙或编码器的首尾填充
+- 跨片段的源文件先比对定位解码与从头顺序解码的结果；VBR MP3 等定位不精确的文件
+  改为顺序解码到临时文件，按帧下标读取
+- 淡入淡出与 pydub 一致按振幅线性变化，音量按 db_from_volume 换算
+- 最多同时有 2 × 进程数 个片段在途，内存占用与组合时长无关；
+  前面的片段在编码的同时后面的片段继续混音，混音耗时随 CPU 核数下降
+
+用法:
+    python segment_render.py <name> [--workers 8]
+"""
+
+import os
+import time
+import tempfile
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_io import (
+    SAMPLE_RATE, CHANNELS, decode_command, encode_command, decode_file, open_decoder, read_frames,
+    count_frames, probe_duration, close_process, to_int16
+)
+from composer import AUDIO_DIR, COMPOSED_DIR, Composition, load_composition, db_from_volume
+from metrics import RENDER_SECONDS, RENDER_ERRORS
+from render_trace import RenderTrace
+
+# 片段时长（秒）
+SEGMENT_SECONDS = float(os.environ.get('RENDER_SEGMENT_SECONDS', '60'))
+# 进程数，默认 CPU 核数
+SEGMENT_WORKERS = int(os.environ.get('RENDER_SEGMENT_WORKERS', '0')) or os.cpu_count() or 1
+# 每个进程最多预先排队的片段数
+SEGMENTS_PER_WORKER = 2
+
+# ffmpeg -ss 精确到毫秒，定位点对齐到 10ms（441 帧）保证落在整数帧上
+SEEK_ALIGN_FRAMES = SAMPLE_RATE // 100
+# 定位点前多解码一小段再丢弃，让解码器（MP3 比特池等）先稳定下来
+PRE_ROLL_FRAMES = SAMPLE_RATE // 20
+# 循环音轨在一个片段内重复超过此次数时，整段解码源文件后按下标取样
+MAX_LOOP_PIECES = 8
+# 容器时长与所需时长相差不到此秒数时，解码统计精确长度
+PROBE_MARGIN_SECONDS = 1.0
+# 校验定位精度时比较的帧数和允许的样本误差（同一解码器顺序解码与定位解码的结果应一致）
+SEEK_CHECK_FRAMES = SAMPLE_RATE // 10
+SEEK_CHECK_TOLERANCE = 1e-4
+
+
+def ms_to_frames(ms: int) -> int:
+    """毫秒换算为帧数（pydub 以毫秒为单位定位）"""
+    return ms * SAMPLE_RATE // 1000
+
+
+def seek_offset(plan: Dict, segment_frames: int) -> int:
+    """片段边界落在音轨内时，需要定位读取的最大源文件位置（帧）；不跨片段时为 0"""
+    offset = 0
+    boundary = (plan['start'] // segment_frames + 1) * segment_frames
+    while boundary < plan['start'] + plan['length']:
+        position = boundary - plan['start']
+        offset = max(offset, position % plan['period'] if plan['period'] else position)
+        boundary += segment_frames
+    return offset
+
+
+def plan_tracks(composition: Composition, executor: ProcessPoolExecutor,
+                segment_frames: int, spool_dir: str) -> List[Dict]:
+    """
+    计算每个音轨在时间轴上的位置、长度、循环周期、淡入淡出和增益（以帧为单位）
+
+    源文件可能比音轨短（需要循环，或不循环时提前结束）时，在进程池中解码统计精确长度。
+    跨片段的源文件在最远的定位点校验定位精度，不精确的顺序解码到 spool_dir 下的临时文件。
+    """
+    candidates = []
+    lengths = {}
+    for track in composition.tracks:
+        path = os.path.join(AUDIO_DIR, track.audio)
+        if not os.path.exists(path):
+            print(f"警告: 音频文件不存在 {track.audio}")
+            continue
+        track_ms = int((track.end - track.start) * 1000)
+        if track_ms <= 0:
+            continue
+        try:
+            source_seconds = probe_duration(path)
+        except RuntimeError:
+            source_seconds = 0.0
+        if source_seconds < track_ms / 1000 + PROBE_MARGIN_SECONDS and path not in lengths:
+            lengths[path] = executor.submit(count_frames, path)
+        candidates.append((track, path, track_ms))
+
+    plans = []
+    for track, path, track_ms in candidates:
+        track_frames = ms_to_frames(track_ms)
+        source_frames = lengths[path].result() if path in lengths else None
+        if source_frames == 0:
+            RENDER_ERRORS.inc(scope='track')
+            print(f"处理音轨失败 {track.audio}: 解码失败")
+            continue
+
+        period = None
+        length = track_frames
+        if source_frames is not None and source_frames < track_frames:
+            if track.loop:
+                period = source_frames
+            else:
+                length = source_frames
+
+        plans.append({
+            'audio': track.audio,
+            'path': path,
+            'start': ms_to_frames(int(track.start * 1000)),
+            'length': length,
+            'period': period,
+            'fade_in': min(ms_to_frames(int(track.fade_in * 1000)), length),
+            'fade_out': min(ms_to_frames(int(track.fade_out * 1000)), length),
+            'gain': 10 ** (db_from_volume(track.volume) / 20) if track.volume != 1.0 else 1.0,
+            'spool': None,
+        })
+
+    offsets = {}
+    for plan in plans:
+        offsets[plan['path']] = max(offsets.get(plan['path'], 0), seek_offset(plan, segment_frames))
+    checks = {path: executor.submit(seek_is_exact, path, offset)
+              for path, offset in offsets.items() if offset > 0}
+    spools = {}
+    for path, check in checks.items():
+        if not check.result():
+            print(f"  {os.path.basename(path)} 定位解码与顺序解码不一致，改为顺序解码")
+            spool_path = os.path.join(spool_dir, f"{len(spools)}.f32")
+            spools[path] = (spool_path, executor.submit(spool_source, path, spool_path))
+    for path, (spool_path, spooled) in spools.items():
+        spooled.result()
+        for plan in plans:
+            if plan['path'] == path:
+                plan['spool'] = spool_path
+    return plans
+
+
+def linear_window(path: str, first: int, count: int, block_frames: int = 1 << 16) -> np.ndarray:
+    """从头顺序解码，取第 first 帧开始的 count 帧，内存占用与位置无关"""
+    proc = open_decoder(path, sample_format='f32le')
+    position = 0
+    window = []
+    try:
+        while sum(len(block) for block in window) < count:
+            block = read_frames(proc, block_frames, dtype=np.float32)
+            if block is None:
+                break
+            if position + len(block) > first:
+                window.append(block[max(0, first - position):])
+            position += len(block)
+    finally:
+        close_process(proc)
+    if not window:
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.concatenate(window)[:count]
+
+
+def seek_is_exact(path: str, first: int) -> bool:
+    """
+    进程池任务：比较从第 first 帧定位解码与从头顺序解码的结果
+
+    VBR MP3 等格式按时间定位时只能估算位置，可能偏移若干帧，拼接处会错位；
+    偏移随位置增大，因此在最远的定位点校验。
+    """
+    expected = linear_window(path, first, SEEK_CHECK_FRAMES)
+    if len(expected) == 0:
+        return True
+    actual = read_source(path, first, len(expected))
+    return bool(np.allclose(actual, expected, atol=SEEK_CHECK_TOLERANCE))
+
+
+def spool_source(path: str, spool_path: str) -> int:
+    """进程池任务：把源文件顺序解码为 f32le 临时文件，返回帧数"""
+    with open(spool_path, 'wb') as f:
+        proc = subprocess.run(decode_command(path, sample_format='f32le'),
+                              stdout=f, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码失败 {path}: {proc.stderr.decode(errors='ignore').strip()}")
+    return os.path.getsize(spool_path) // (np.dtype(np.float32).itemsize * CHANNELS)
+
+
+def read_source(path: str, first: int, count: int, spool: Optional[str] = None) -> np.ndarray:
+    """解码源文件从第 first 帧开始的 count 帧，不足部分补零；给出 spool 时从顺序解码的临时文件读取"""
+    if spool is not None:
+        frame_bytes = np.dtype(np.float32).itemsize * CHANNELS
+        if first * frame_bytes < os.path.getsize(spool):
+            samples = np.fromfile(spool, dtype=np.float32, count=count * CHANNELS,
+                                  offset=first * frame_bytes).reshape(-1, CHANNELS)
+        else:
+            samples = np.zeros((0, CHANNELS), dtype=np.float32)
+    else:
+        seek = max(0, first - PRE_ROLL_FRAMES) // SEEK_ALIGN_FRAMES * SEEK_ALIGN_FRAMES
+        skip = first - seek
+        samples = decode_file(path, start=seek / SAMPLE_RATE,
+                              duration=(skip + count) / SAMPLE_RATE + 0.01)
+        samples = samples[skip:skip + count]
+    if len(samples) < count:
+        samples = np.pad(samples, ((0, count - len(samples)), (0, 0)))
+    return samples
+
+
+def track_samples(plan: Dict, first: int, stop: int) -> np.ndarray:
+    """音轨第 first 到 stop 帧（相对音轨起点）对应的源文件样本，循环音轨按周期回绕"""
+    period = plan['period']
+    if period is None:
+        return read_source(plan['path'], first, stop - first, plan['spool'])
+
+    pieces = []
+    position = first
+    while position < stop:
+        offset = position % period
+        count = min(stop - position, period - offset)
+        pieces.append((offset, count))
+        position += count
+
+    if len(pieces) > MAX_LOOP_PIECES:
+        source = read_source(plan['path'], 0, period, plan['spool'])
+        return source[np.arange(first, stop) % period]
+    return np.concatenate([read_source(plan['path'], offset, count, plan['spool'])
+                           for offset, count in pieces])
+
+
+def track_envelope(plan: Dict, offsets: np.ndarray) -> np.ndarray:
+    """音轨各帧的振幅增益：音量 × 线性淡入 × 线性淡出"""
+    envelope = np.full(len(offsets), plan['gain'], dtype=np.float32)
+    if plan['fade_in'] > 0:
+        envelope *= np.clip(offsets / plan['fade_in'], 0.0, 1.0)
+    if plan['fade_out'] > 0:
+        envelope *= np.clip((plan['length'] - offsets) / plan['fade_out'], 0.0, 1.0)
+    return envelope
+
+
+def render_segment(plans: List[Dict], start: int, frames: int) -> bytes:
+    """进程池任务：混合时间轴上 [start, start + frames) 帧，返回 s16le PCM"""
+    mix = np.zeros((frames, CHANNELS), dtype=np.float32)
+    for plan in plans:
+        first = max(start, plan['start'])
+        stop = min(start + frames, plan['start'] + plan['length'])
+        if first >= stop:
+            continue
+        offsets = np.arange(first - plan['start'], stop - plan['start'])
+        try:
+            samples = track_samples(plan, int(offsets[0]), int(offsets[-1]) + 1)
+        except RuntimeError as e:
+            print(f"处理音轨失败 {plan['audio']}: {e}")
+            continue
+        mix[first - start:stop - start] += samples * track_envelope(plan, offsets)[:, None]
+    return to_int16(mix).tobytes()
+
+
+def render_segmented(name: str, output_format: str = 'mp3', bitrate: str = '192k',
+                     trace: bool = True, workers: Optional[int] = None) -> Optional[str]:
+    """
+    分段并行渲染组合配置为音频文件
+
+    Args:
+        name: 组合配置名称（不含.yaml后缀）
+        output_format: 输出格式 (mp3, wav, ogg)
+        bitrate: 比特率
+        trace: 是否在输出文件旁写出分阶段追踪清单 (<name>.trace.json)
+        workers: 进程数，默认 SEGMENT_WORKERS
+
+    Returns:
+        输出文件路径，失败返回 None
+    """
+    composition = load_composition(name)
+    if not composition:
+        print(f"找不到组合配置: {name}")
+        return None
+
+    workers = workers or SEGMENT_WORKERS
+    total_frames = ms_to_frames(int(composition.duration * 1000))
+    segment_frames = max(1, int(SEGMENT_SECONDS * SAMPLE_RATE))
+    segments = [(start, min(segment_frames, total_frames - start))
+                for start in range(0, total_frames, segment_frames)]
+
+    print(f"开始分段合成: {composition.name}")
+    print(f"总时长: {composition.duration}秒, 音轨数: {len(composition.tracks)}, "
+          f"片段: {len(segments)}, 进程: {workers}")
+
+    render_trace = RenderTrace(name, enabled=trace)
+    render_start = time.perf_counter()
+
+    os.makedirs(COMPOSED_DIR, exist_ok=True)
+    output_path = os.path.join(COMPOSED_DIR, f"{name}.{output_format}")
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+
+    encoder = None
+    try:
+        with tempfile.TemporaryDirectory(prefix='segment-render-') as spool_dir, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            with render_trace.stage('plan'):
+                plans = plan_tracks(composition, executor, segment_frames, spool_dir)
+
+            encoder = subprocess.Popen(
+                encode_command(output_format, bitrate=bitrate, output=tmp_path),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+            # 按顺序写入编码器，后面的片段在此期间继续混音
+            with render_trace.stage('mix'):
+                remaining = iter(segments)
+                in_flight = deque()
+                for start, frames in remaining:
+                    in_flight.append(executor.submit(render_segment, plans, start, frames))
+                    if len(in_flight) >= workers * SEGMENTS_PER_WORKER:
+                        break
+                done = 0
+                while in_flight:
+                    encoder.stdin.write(in_flight.popleft().result())
+                    done += 1
+                    print(f"  [{done}/{len(segments)}] 片段完成")
+                    following = next(remaining, None)
+                    if following is not None:
+                        in_flight.append(executor.submit(render_segment, plans, *following))
+
+        with render_trace.stage('export'):
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg 编码失败: {output_path}")
+            os.replace(tmp_path, output_path)
+    finally:
+        close_process(encoder)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    RENDER_SECONDS.observe(time.perf_counter() - render_start)
+
+    if trace:
+        render_trace.extra.update({
+            'output': os.path.basename(output_path),
+            'duration': composition.duration,
+            'format': output_format,
+            'mode': 'segmented',
+            'workers': workers,
+            'segments': len(segments),
+        })
+        trace_path = render_trace.write(os.path.join(COMPOSED_DIR, f"{name}.trace.json"))
+        print(f"追踪清单: {trace_path}")
+
+    print(f"合成完成: {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python segment_render.py <name> [--workers N]")
+        sys.exit(1)
+
+    workers = None
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    render_segmented(sys.argv[1], workers=workers)
@@ -3,11 +3,12 @@
 WhiteNoise - 白噪音混合播放器服务端
 """
 
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, send_from_directory, jsonify, request, g, Response
 import yaml
+import json
 import os
+import time
 import threading
-import asyncio
 
 app = Flask(__name__, static_folder='static')
 
@@ -21,11 +22,63 @@ from composer import (
     list_compositions, 
     get_composition_detail, 
     load_composition,
-    render_composition
+    render_composition,
+    track_from_params,
+    render_track_clip
 )
 
 # 导入 LLM composer 模块
-from llm_composer import generate_composition, save_composition
+from llm_composer import generate_composition, generate_composition_stream, save_composition
+import rule_composer
+from llm_client import run_sync, iterate_sync
+
+# 导入实时混音模块
+import live_mix
+
+# 导入相似音效检索模块
+from similarity_index import similar_sounds
+
+# 导入混音预测模块
+from mix_predict import predict_mix
+
+# 导入音效目录监视模块
+import watch_audio
+
+# 导入指标模块
+import metrics
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def _observe_request(status: int):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=route)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求耗时与状态码；流式响应（实时混音、SSE）只计到返回响应对象为止，不含响应体的传输时间"""
+    _observe_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+def record_failed_request(error):
+    """未处理的异常跳过 after_request 时（如调试模式下向上抛出），按 500 记录"""
+    _observe_request(500)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 指标"""
+    return Response(metrics.render_text(), mimetype=metrics.CONTENT_TYPE)
 
 
 @app.route('/')
@@ -52,6 +105,12 @@ def serve_audio(filename):
     return send_from_directory('pixabay', filename)
 
 
+@app.route('/loops/<path:filename>')
+def serve_loop_clip(filename):
+    """长音频的无缝循环片段"""
+    return send_from_directory('loops', filename)
+
+
 @app.route('/composed/<path:filename>')
 def serve_composed(filename):
     """合成后的音频文件"""
@@ -67,6 +126,30 @@ def get_sounds():
     return jsonify(data)
 
 
+@app.route('/api/sounds/<path:filename>/similar')
+def api_similar_sounds(filename):
+    """与指定音效频谱最相似的音效"""
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'k 必须是整数'
+        }), 400
+    
+    results = similar_sounds(filename, max(1, min(k, 50)))
+    if results is None:
+        return jsonify({
+            'success': False,
+            'error': f'音效不存在或尚未分析: {filename}'
+        }), 404
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'data': results
+    })
+
+
 # ==================== 组合配置 API ====================
 
 @app.route('/api/compositions')
@@ -186,10 +269,11 @@ def api_delete_composition(name):
     
     os.remove(config_path)
     
-    # 同时删除已渲染的文件（如果存在）
-    rendered_path = os.path.join(COMPOSED_DIR, f"{name}.mp3")
-    if os.path.exists(rendered_path):
-        os.remove(rendered_path)
+    # 同时删除已渲染的文件及追踪数据（如果存在）
+    for suffix in ('.mp3', '.trace.json', '.prof'):
+        rendered_path = os.path.join(COMPOSED_DIR, f"{name}{suffix}")
+        if os.path.exists(rendered_path):
+            os.remove(rendered_path)
     
     return jsonify({
         'success': True,
@@ -197,6 +281,43 @@ def api_delete_composition(name):
     })
 
 
+@app.route('/api/compositions/<name>/predict')
+def api_predict_composition(name):
+    """不渲染音频，预测已保存组合的响度与频带能量"""
+    composition = load_composition(name)
+    
+    if not composition:
+        return jsonify({
+            'success': False,
+            'error': f'组合配置不存在: {name}'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': predict_mix(composition)
+    })
+
+
+@app.route('/api/mix/predict', methods=['POST'])
+def api_predict_mix():
+    """预测尚未保存的组合（请求体为组合配置，或 {"composition": 组合配置}）"""
+    data = request.get_json(silent=True) or {}
+    composition = data.get('composition', data) if isinstance(data, dict) else None
+    
+    try:
+        prediction = predict_mix(composition)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({
+            'success': False,
+            'error': f'组合配置无效: {e}'
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'data': prediction
+    })
+
+
 @app.route('/api/compositions/<name>/render', methods=['POST'])
 def api_render_composition(name):
     """渲染组合配置为 MP3 文件"""
@@ -214,8 +335,11 @@ def api_render_composition(name):
     # 获取请求参数
     data = request.get_json() or {}
     force = data.get('force', False)
+    profile = data.get('profile', False)
+    parallel = data.get('parallel')
     
     if os.path.exists(output_path) and not force:
+        metrics.CACHE_REQUESTS.inc(cache='render', result='hit')
         return jsonify({
             'success': True,
             'message': '已存在渲染结果',
@@ -223,13 +347,19 @@ def api_render_composition(name):
             'cached': True
         })
     
+    metrics.CACHE_REQUESTS.inc(cache='render', result='miss')
+    
     # 在后台线程中渲染（避免阻塞请求）
     def do_render():
         try:
-            render_composition(name)
+            render_composition(name, profile=profile, parallel=parallel)
         except Exception as e:
+            metrics.RENDER_ERRORS.inc(scope='composition')
             print(f"渲染失败: {e}")
+        finally:
+            metrics.RENDER_JOBS.dec()
     
+    metrics.RENDER_JOBS.inc()
     thread = threading.Thread(target=do_render)
     thread.start()
     
@@ -261,6 +391,122 @@ def api_render_status(name):
     })
 
 
+@app.route('/api/clip/<path:audio>')
+def api_track_clip(audio):
+    """
+    音轨实际发声的音频片段（已循环/裁剪，已应用淡入淡出和音量）
+    
+    参数: start, end, volume, fade_in, fade_out, loop
+    """
+    try:
+        track = track_from_params(audio, request.args)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        clip_path = render_track_clip(track)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'片段生成失败: {str(e)}'
+        }), 500
+    
+    response = send_from_directory(os.path.dirname(clip_path), os.path.basename(clip_path),
+                                   mimetype='audio/mpeg')
+    # 地址不含源文件版本，替换源文件后内容会变：每次按 ETag 重新验证，未变化时返回 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ==================== 实时混音 API ====================
+
+@app.route('/api/live', methods=['POST'])
+def api_live_create():
+    """根据混音器状态创建实时混音会话"""
+    data = request.get_json() or {}
+    tracks = data.get('tracks', [])
+    
+    error = live_mix.validate_tracks(tracks)
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+    
+    session = live_mix.sessions.create(tracks, data.get('master_volume', 1.0))
+    
+    return jsonify({
+        'success': True,
+        'id': session.id,
+        'stream_url': f'/api/live/{session.id}/stream'
+    })
+
+
+@app.route('/api/live/<session_id>', methods=['PUT'])
+def api_live_update(session_id):
+    """更新混音器状态（音轨增减、音量变化），正在播放的流即时生效"""
+    session = live_mix.sessions.get(session_id)
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': f'混音会话不存在: {session_id}'
+        }), 404
+    
+    data = request.get_json() or {}
+    tracks = data.get('tracks')
+    
+    if tracks is not None:
+        error = live_mix.validate_tracks(tracks)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400
+    
+    session.update(tracks, data.get('master_volume'))
+    
+    return jsonify({
+        'success': True,
+        'data': session.to_dict()
+    })
+
+
+@app.route('/api/live/<session_id>', methods=['DELETE'])
+def api_live_delete(session_id):
+    """结束混音会话"""
+    live_mix.sessions.remove(session_id)
+    return jsonify({
+        'success': True
+    })
+
+
+@app.route('/api/live/<session_id>/stream')
+def api_live_stream(session_id):
+    """实时混音 MP3 流（持续输出，直到客户端断开）"""
+    session = live_mix.sessions.get(session_id)
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': f'混音会话不存在: {session_id}'
+        }), 404
+    
+    stream = live_mix.sessions.open_stream(session)
+    if stream is None:
+        return jsonify({
+            'success': False,
+            'error': '实时混音收听者已满，请稍后重试'
+        }), 503
+    
+    return Response(
+        stream,
+        mimetype='audio/mpeg',
+        headers={'Cache-Control': 'no-store'}
+    )
+
+
 # ==================== AI 作曲 API ====================
 
 @app.route('/ai')
@@ -294,9 +540,29 @@ def api_ai_compose():
             'error': '场景描述过长，请控制在1000字以内'
         }), 400
     
+    fresh = bool(data.get('fresh'))
+    try:
+        candidates = int(data['candidates']) if data.get('candidates') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'candidates 必须是整数'
+        }), 400
+    # 是否自动保存
+    auto_save = data.get('auto_save', True)
+    
+    # 流式生成：逐行输出 NDJSON 事件，音轨生成一个推送一个
+    if data.get('stream'):
+        events = iterate_sync(generate_composition_stream(scene_description, fresh=fresh))
+        return Response(
+            _compose_events(events, auto_save),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+        )
+    
     # 调用 AI 生成
     try:
-        result = asyncio.run(generate_composition(scene_description))
+        result = run_sync(generate_composition(scene_description, fresh=fresh, candidates=candidates))
     except Exception as e:
         return jsonify({
             'success': False,
@@ -306,20 +572,51 @@ def api_ai_compose():
     if not result['success']:
         return jsonify(result), 400
     
-    # 是否自动保存
-    auto_save = data.get('auto_save', True)
-    
     if auto_save:
-        try:
-            save_composition(result['id'], result['composition'])
-            result['saved'] = True
-        except Exception as e:
-            result['saved'] = False
-            result['save_error'] = str(e)
+        _auto_save(result)
     
     return jsonify(result)
 
 
+@app.route('/api/ai/draft', methods=['POST'])
+def api_ai_draft():
+    """规则作曲的即时草稿（不调用 LLM，不保存）"""
+    data = request.get_json()
+    scene_description = (data or {}).get('scene', '').strip()
+    
+    if len(scene_description) < 5 or len(scene_description) > 1000:
+        return jsonify({
+            'success': False,
+            'error': '场景描述长度应在 5 到 1000 字之间'
+        }), 400
+    
+    return jsonify(rule_composer.compose_result(scene_description))
+
+
+def _auto_save(result):
+    """保存生成结果，并在结果中记录保存状态"""
+    try:
+        save_composition(result['id'], result['composition'])
+        result['saved'] = True
+    except Exception as e:
+        result['saved'] = False
+        result['save_error'] = str(e)
+
+
+def _compose_events(events, auto_save):
+    """把流式生成事件编码为 NDJSON，最终结果按需自动保存"""
+    try:
+        for event in events:
+            if event['type'] == 'done' and event['result']['success'] and auto_save:
+                _auto_save(event['result'])
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+    except Exception as e:
+        yield json.dumps({'type': 'done', 'result': {
+            'success': False,
+            'error': f'生成过程出错: {str(e)}'
+        }}, ensure_ascii=False) + '\n'
+
+
 @app.route('/api/ai/save', methods=['POST'])
 def api_ai_save():
     """保存 AI 生成的组合"""
@@ -391,4 +688,9 @@ if __name__ == '__main__':
     print("AI作曲:   http://localhost:5000/ai")
     print("组合器:   http://localhost:5000/composer")
     print("按 Ctrl+C 停止服务\n")
+    
+    # debug 模式下重新加载器会启动两个进程，只在实际服务的子进程中监视
+    if watch_audio.WATCH_ENABLED and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        watch_audio.start_watcher()
+    
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,768 @@
+#!/usr/bin/env python3
+"""
+WhiteNoise - 白噪音混合播放器服务端（ASGI 版本）
+
+与 server.py 提供相同的路由，基于 Quart 运行在单个事件循环上：
+- LLM 请求在共享事件循环中原生异步执行，不再为每个请求创建新循环
+- YAML 读写、渲染等阻塞操作交给线程池执行，不阻塞事件循环
+
+启动方式:
+    hypercorn server_asgi:app --bind 0.0.0.0:5000
+    uvicorn server_asgi:app --host 0.0.0.0 --port 5000
+"""
+
+from quart import Quart, send_from_directory, jsonify, request, g, Response
+from concurrent.futures import ThreadPoolExecutor
+import yaml
+import json
+import os
+import time
+import asyncio
+
+app = Quart(__name__, static_folder=None)
+
+# 项目根目录
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+COMPOSITIONS_DIR = os.path.join(BASE_DIR, 'compositions')
+COMPOSED_DIR = os.path.join(BASE_DIR, 'composed')
+LOOPS_DIR = os.path.join(BASE_DIR, 'loops')
+
+# 阻塞 I/O（YAML 读写、文件操作）线程池
+IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', '16'))
+# 渲染线程池（渲染是 CPU 密集型，数量不宜过多）
+RENDER_WORKERS = int(os.environ.get('ASGI_RENDER_WORKERS', '2'))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
+render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='render')
+
+# 正在渲染中的组合，避免重复提交同一渲染任务
+_rendering = set()
+
+# 导入 composer 模块
+from composer import (
+    list_compositions,
+    get_composition_detail,
+    load_composition,
+    render_composition,
+    track_from_params,
+    render_track_clip
+)
+
+# 导入 LLM composer 模块
+from llm_composer import generate_composition, generate_composition_stream, save_composition
+import rule_composer
+from llm_client import get_llm_client
+
+# 导入实时混音模块
+import live_mix
+
+# 实时混音流线程池：每个收听者的编码器读取始终占用一个线程，
+# 与 I/O 线程池分开并按收听者上限配置，收听者满额时不会占满其他接口的线程
+live_executor = ThreadPoolExecutor(max_workers=live_mix.MAX_LISTENERS, thread_name_prefix='live')
+
+# 导入相似音效检索模块
+from similarity_index import similar_sounds
+
+# 导入混音预测模块
+from mix_predict import predict_mix
+
+# 导入音效目录监视模块
+import watch_audio
+
+# 导入指标模块
+import metrics
+
+
+async def run_blocking(func, *args):
+    """在 I/O 线程池中执行阻塞函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, func, *args)
+
+
+async def iterate_blocking(generator, executor):
+    """在给定线程池中迭代阻塞的同步生成器，转为异步生成器"""
+    loop = asyncio.get_running_loop()
+    sentinel = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, generator, sentinel)
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        await loop.run_in_executor(executor, generator.close)
+
+
+def _load_yaml(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def _dump_yaml(path: str, config: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.dump(config, f, allow_unicode=True, default_flow_style=False)
+
+
+def _delete_composition_files(name: str):
+    os.remove(os.path.join(COMPOSITIONS_DIR, f"{name}.yaml"))
+
+    # 同时删除已渲染的文件及追踪数据（如果存在）
+    for suffix in ('.mp3', '.trace.json', '.prof'):
+        rendered_path = os.path.join(COMPOSED_DIR, f"{name}{suffix}")
+        if os.path.exists(rendered_path):
+            os.remove(rendered_path)
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def _observe_request(status: int):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=route)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    """记录请求耗时与状态码；流式响应（实时混音、SSE）只计到返回响应对象为止，不含响应体的传输时间"""
+    _observe_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+async def record_failed_request(error):
+    """未处理的异常跳过 after_request 时（如调试模式下向上抛出），按 500 记录"""
+    _observe_request(500)
+
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    """Prometheus 指标"""
+    return Response(metrics.render_text(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/')
+async def index():
+    """主页"""
+    return await send_from_directory(STATIC_DIR, 'index.html')
+
+
+@app.route('/composer')
+async def composer_page():
+    """组合播放器页面"""
+    return await send_from_directory(STATIC_DIR, 'composer.html')
+
+
+@app.route('/static/<path:filename>')
+async def serve_static(filename):
+    """静态资源"""
+    return await send_from_directory(STATIC_DIR, filename)
+
+
+@app.route('/audio/<path:filename>')
+async def serve_audio(filename):
+    """音频文件"""
+    return await send_from_directory(AUDIO_DIR, filename)
+
+
+@app.route('/loops/<path:filename>')
+async def serve_loop_clip(filename):
+    """长音频的无缝循环片段"""
+    return await send_from_directory(LOOPS_DIR, filename)
+
+
+@app.route('/composed/<path:filename>')
+async def serve_composed(filename):
+    """合成后的音频文件"""
+    return await send_from_directory(COMPOSED_DIR, filename)
+
+
+@app.route('/api/sounds')
+async def get_sounds():
+    """获取音频元数据"""
+    yaml_path = os.path.join(BASE_DIR, 'audio_descriptions.yaml')
+    data = await run_blocking(_load_yaml, yaml_path)
+    return jsonify(data)
+
+
+@app.route('/api/sounds/<path:filename>/similar')
+async def api_similar_sounds(filename):
+    """与指定音效频谱最相似的音效"""
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'k 必须是整数'
+        }), 400
+
+    results = await run_blocking(similar_sounds, filename, max(1, min(k, 50)))
+    if results is None:
+        return jsonify({
+            'success': False,
+            'error': f'音效不存在或尚未分析: {filename}'
+        }), 404
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'data': results
+    })
+
+
+# ==================== 组合配置 API ====================
+
+@app.route('/api/compositions')
+async def api_list_compositions():
+    """获取所有组合配置列表"""
+    compositions = await run_blocking(list_compositions)
+    return jsonify({
+        'success': True,
+        'data': compositions
+    })
+
+
+@app.route('/api/compositions/<name>')
+async def api_get_composition(name):
+    """获取单个组合配置详情"""
+    detail = await run_blocking(get_composition_detail, name)
+    if detail:
+        return jsonify({
+            'success': True,
+            'data': detail
+        })
+    return jsonify({
+        'success': False,
+        'error': f'组合配置不存在: {name}'
+    }), 404
+
+
+@app.route('/api/compositions', methods=['POST'])
+async def api_create_composition():
+    """创建新的组合配置"""
+    data = await request.get_json()
+
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': '无效的请求数据'
+        }), 400
+
+    # 验证必需字段
+    required_fields = ['id', 'name', 'duration', 'tracks']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({
+                'success': False,
+                'error': f'缺少必需字段: {field}'
+            }), 400
+
+    # 构建配置内容
+    config = {
+        'name': data['name'],
+        'description': data.get('description', ''),
+        'duration': data['duration'],
+        'tracks': data['tracks']
+    }
+
+    # 保存配置文件
+    config_path = os.path.join(COMPOSITIONS_DIR, f"{data['id']}.yaml")
+    await run_blocking(_dump_yaml, config_path, config)
+
+    return jsonify({
+        'success': True,
+        'message': '组合配置已创建',
+        'id': data['id']
+    })
+
+
+@app.route('/api/compositions/<name>', methods=['PUT'])
+async def api_update_composition(name):
+    """更新组合配置"""
+    data = await request.get_json()
+
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': '无效的请求数据'
+        }), 400
+
+    config_path = os.path.join(COMPOSITIONS_DIR, f"{name}.yaml")
+
+    if not os.path.exists(config_path):
+        return jsonify({
+            'success': False,
+            'error': f'组合配置不存在: {name}'
+        }), 404
+
+    # 构建配置内容
+    config = {
+        'name': data.get('name', name),
+        'description': data.get('description', ''),
+        'duration': data.get('duration', 300),
+        'tracks': data.get('tracks', [])
+    }
+
+    await run_blocking(_dump_yaml, config_path, config)
+
+    return jsonify({
+        'success': True,
+        'message': '组合配置已更新'
+    })
+
+
+@app.route('/api/compositions/<name>', methods=['DELETE'])
+async def api_delete_composition(name):
+    """删除组合配置"""
+    config_path = os.path.join(COMPOSITIONS_DIR, f"{name}.yaml")
+
+    if not os.path.exists(config_path):
+        return jsonify({
+            'success': False,
+            'error': f'组合配置不存在: {name}'
+        }), 404
+
+    await run_blocking(_delete_composition_files, name)
+
+    return jsonify({
+        'success': True,
+        'message': '组合配置已删除'
+    })
+
+
+@app.route('/api/compositions/<name>/predict')
+async def api_predict_composition(name):
+    """不渲染音频，预测已保存组合的响度与频带能量"""
+    composition = await run_blocking(load_composition, name)
+
+    if not composition:
+        return jsonify({
+            'success': False,
+            'error': f'组合配置不存在: {name}'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'data': await run_blocking(predict_mix, composition)
+    })
+
+
+@app.route('/api/mix/predict', methods=['POST'])
+async def api_predict_mix():
+    """预测尚未保存的组合（请求体为组合配置，或 {"composition": 组合配置}）"""
+    data = await request.get_json(silent=True) or {}
+    composition = data.get('composition', data) if isinstance(data, dict) else None
+
+    try:
+        prediction = await run_blocking(predict_mix, composition)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({
+            'success': False,
+            'error': f'组合配置无效: {e}'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'data': prediction
+    })
+
+
+@app.route('/api/compositions/<name>/render', methods=['POST'])
+async def api_render_composition(name):
+    """渲染组合配置为 MP3 文件"""
+    composition = await run_blocking(load_composition, name)
+
+    if not composition:
+        return jsonify({
+            'success': False,
+            'error': f'组合配置不存在: {name}'
+        }), 404
+
+    # 检查是否已有渲染结果
+    output_path = os.path.join(COMPOSED_DIR, f"{name}.mp3")
+
+    # 获取请求参数
+    data = await request.get_json(silent=True) or {}
+    force = data.get('force', False)
+    profile = data.get('profile', False)
+    parallel = data.get('parallel')
+
+    if os.path.exists(output_path) and not force:
+        metrics.CACHE_REQUESTS.inc(cache='render', result='hit')
+        return jsonify({
+            'success': True,
+            'message': '已存在渲染结果',
+            'url': f'/composed/{name}.mp3',
+            'cached': True
+        })
+
+    metrics.CACHE_REQUESTS.inc(cache='render', result='miss')
+
+    # 提交到渲染线程池（不等待结果，避免阻塞请求）
+    if name not in _rendering:
+        _rendering.add(name)
+
+        def do_render():
+            try:
+                render_composition(name, profile=profile, parallel=parallel)
+            except Exception as e:
+                metrics.RENDER_ERRORS.inc(scope='composition')
+                print(f"渲染失败: {e}")
+            finally:
+                _rendering.discard(name)
+                metrics.RENDER_JOBS.dec()
+
+        metrics.RENDER_JOBS.inc()
+        render_executor.submit(do_render)
+
+    return jsonify({
+        'success': True,
+        'message': '开始渲染，请稍后...',
+        'url': f'/composed/{name}.mp3',
+        'rendering': True
+    })
+
+
+@app.route('/api/compositions/<name>/render/status')
+async def api_render_status(name):
+    """检查渲染状态"""
+    output_path = os.path.join(COMPOSED_DIR, f"{name}.mp3")
+
+    if os.path.exists(output_path) and name not in _rendering:
+        file_size = os.path.getsize(output_path)
+        return jsonify({
+            'success': True,
+            'ready': True,
+            'url': f'/composed/{name}.mp3',
+            'size': file_size
+        })
+
+    return jsonify({
+        'success': True,
+        'ready': False
+    })
+
+
+@app.route('/api/clip/<path:audio>')
+async def api_track_clip(audio):
+    """
+    音轨实际发声的音频片段（已循环/裁剪，已应用淡入淡出和音量）
+
+    参数: start, end, volume, fade_in, fade_out, loop
+    """
+    try:
+        track = track_from_params(audio, request.args)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    try:
+        clip_path = await asyncio.get_running_loop().run_in_executor(
+            render_executor, render_track_clip, track)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'片段生成失败: {str(e)}'
+        }), 500
+
+    response = await send_from_directory(os.path.dirname(clip_path), os.path.basename(clip_path))
+    # 地址不含源文件版本，替换源文件后内容会变：每次按 ETag 重新验证，未变化时返回 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ==================== 实时混音 API ====================
+
+@app.route('/api/live', methods=['POST'])
+async def api_live_create():
+    """根据混音器状态创建实时混音会话"""
+    data = await request.get_json(silent=True) or {}
+    tracks = data.get('tracks', [])
+
+    error = await run_blocking(live_mix.validate_tracks, tracks)
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+
+    session = live_mix.sessions.create(tracks, data.get('master_volume', 1.0))
+
+    return jsonify({
+        'success': True,
+        'id': session.id,
+        'stream_url': f'/api/live/{session.id}/stream'
+    })
+
+
+@app.route('/api/live/<session_id>', methods=['PUT'])
+async def api_live_update(session_id):
+    """更新混音器状态（音轨增减、音量变化），正在播放的流即时生效"""
+    session = live_mix.sessions.get(session_id)
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': f'混音会话不存在: {session_id}'
+        }), 404
+
+    data = await request.get_json(silent=True) or {}
+    tracks = data.get('tracks')
+
+    if tracks is not None:
+        error = await run_blocking(live_mix.validate_tracks, tracks)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400
+
+    session.update(tracks, data.get('master_volume'))
+
+    return jsonify({
+        'success': True,
+        'data': session.to_dict()
+    })
+
+
+@app.route('/api/live/<session_id>', methods=['DELETE'])
+async def api_live_delete(session_id):
+    """结束混音会话"""
+    live_mix.sessions.remove(session_id)
+    return jsonify({
+        'success': True
+    })
+
+
+@app.route('/api/live/<session_id>/stream')
+async def api_live_stream(session_id):
+    """实时混音 MP3 流（持续输出，直到客户端断开）"""
+    session = live_mix.sessions.get(session_id)
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': f'混音会话不存在: {session_id}'
+        }), 404
+
+    stream = live_mix.sessions.open_stream(session)
+    if stream is None:
+        return jsonify({
+            'success': False,
+            'error': '实时混音收听者已满，请稍后重试'
+        }), 503
+
+    response = Response(
+        iterate_blocking(stream, live_executor),
+        content_type='audio/mpeg',
+        headers={'Cache-Control': 'no-store'}
+    )
+    response.timeout = None
+    return response
+
+
+# ==================== AI 作曲 API ====================
+
+@app.route('/ai')
+async def ai_composer_page():
+    """AI 作曲页面"""
+    return await send_from_directory(STATIC_DIR, 'ai_composer.html')
+
+
+@app.route('/api/ai/compose', methods=['POST'])
+async def api_ai_compose():
+    """AI 生成音效组合（在共享事件循环中异步等待 LLM）"""
+    data = await request.get_json()
+
+    if not data or 'scene' not in data:
+        return jsonify({
+            'success': False,
+            'error': '请提供场景描述'
+        }), 400
+
+    scene_description = data['scene'].strip()
+
+    if len(scene_description) < 5:
+        return jsonify({
+            'success': False,
+            'error': '场景描述太短，请提供更详细的描述'
+        }), 400
+
+    if len(scene_description) > 1000:
+        return jsonify({
+            'success': False,
+            'error': '场景描述过长，请控制在1000字以内'
+        }), 400
+
+    fresh = bool(data.get('fresh'))
+    try:
+        candidates = int(data['candidates']) if data.get('candidates') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'candidates 必须是整数'
+        }), 400
+    # 是否自动保存
+    auto_save = data.get('auto_save', True)
+
+    # 流式生成：逐行输出 NDJSON 事件，音轨生成一个推送一个
+    if data.get('stream'):
+        response = Response(
+            _compose_events(generate_composition_stream(scene_description, fresh=fresh), auto_save),
+            content_type='application/x-ndjson',
+            headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+        )
+        response.timeout = None
+        return response
+
+    # 调用 AI 生成
+    try:
+        result = await generate_composition(scene_description, fresh=fresh, candidates=candidates)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'生成过程出错: {str(e)}'
+        }), 500
+
+    if not result['success']:
+        return jsonify(result), 400
+
+    if auto_save:
+        await _auto_save(result)
+
+    return jsonify(result)
+
+
+@app.route('/api/ai/draft', methods=['POST'])
+async def api_ai_draft():
+    """规则作曲的即时草稿（不调用 LLM，不保存）"""
+    data = await request.get_json()
+    scene_description = (data or {}).get('scene', '').strip()
+
+    if len(scene_description) < 5 or len(scene_description) > 1000:
+        return jsonify({
+            'success': False,
+            'error': '场景描述长度应在 5 到 1000 字之间'
+        }), 400
+
+    return jsonify(await run_blocking(rule_composer.compose_result, scene_description))
+
+
+async def _auto_save(result):
+    """保存生成结果，并在结果中记录保存状态"""
+    try:
+        await run_blocking(save_composition, result['id'], result['composition'])
+        result['saved'] = True
+    except Exception as e:
+        result['saved'] = False
+        result['save_error'] = str(e)
+
+
+async def _compose_events(events, auto_save):
+    """把流式生成事件编码为 NDJSON，最终结果按需自动保存"""
+    try:
+        async for event in events:
+            if event['type'] == 'done' and event['result']['success'] and auto_save:
+                await _auto_save(event['result'])
+            yield (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+    except Exception as e:
+        yield (json.dumps({'type': 'done', 'result': {
+            'success': False,
+            'error': f'生成过程出错: {str(e)}'
+        }}, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+@app.route('/api/ai/save', methods=['POST'])
+async def api_ai_save():
+    """保存 AI 生成的组合"""
+    data = await request.get_json()
+
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': '无效的请求数据'
+        }), 400
+
+    composition_id = data.get('id')
+    composition = data.get('composition')
+
+    if not composition_id or not composition:
+        return jsonify({
+            'success': False,
+            'error': '缺少必需字段: id 或 composition'
+        }), 400
+
+    try:
+        file_path = await run_blocking(save_composition, composition_id, composition)
+        return jsonify({
+            'success': True,
+            'message': '保存成功',
+            'id': composition_id,
+            'path': file_path
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'保存失败: {str(e)}'
+        }), 500
+
+
+@app.route('/api/sounds/summary')
+async def api_sounds_summary():
+    """获取音效库摘要（用于前端展示）"""
+    yaml_path = os.path.join(BASE_DIR, 'audio_descriptions.yaml')
+    data = await run_blocking(_load_yaml, yaml_path)
+
+    summary = {
+        'total_files': data.get('metadata', {}).get('total_files', 0),
+        'categories': []
+    }
+
+    for category_id, category in data.get('categories', {}).items():
+        cat_summary = {
+            'id': category_id,
+            'name_zh': category.get('name_zh', category_id),
+            'name_en': category.get('name_en', category_id),
+            'file_count': len(category.get('files', []))
+        }
+        summary['categories'].append(cat_summary)
+
+    return jsonify(summary)
+
+
+@app.before_serving
+async def startup():
+    """确保必要目录存在，按需启动音效目录监视"""
+    # llm_composer 中的阻塞操作（缓存写入、校验等）经默认线程池执行，统一使用 I/O 线程池
+    asyncio.get_running_loop().set_default_executor(io_executor)
+    os.makedirs(COMPOSITIONS_DIR, exist_ok=True)
+    os.makedirs(COMPOSED_DIR, exist_ok=True)
+    if watch_audio.WATCH_ENABLED:
+        watch_audio.start_watcher()
+
+
+@app.after_serving
+async def shutdown():
+    """停止音效目录监视，关闭线程池和 LLM 连接池"""
+    await run_blocking(watch_audio.stop_watcher)
+    await get_llm_client().aclose()
+    io_executor.shutdown(wait=False)
+    render_executor.shutdown(wait=False)
+    live_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    print("\n🎵 WhiteNoise 白噪音混合播放器 (ASGI)")
+    print("=" * 40)
+    print("主页:     http://localhost:5000")
+    print("AI作曲:   http://localhost:5000/ai")
+    print("组合器:   http://localhost:5000/composer")
+    print("按 Ctrl+C 停止服务\n")
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Similarity Index - 基于频谱嵌入的相似音效检索
+
+用特征库中每个音效的频谱嵌入向量（audio_features 计算）组成一个 NumPy 矩阵：
+
+- 按维度标准化后 L2 归一化，余弦相似度就是矩阵乘法，一次查询对所有音效向量化计算
+- 「更多类似的声音」：/api/sounds/<文件名>/similar
+- 入库时的疑似重复报告：相似度超过 DUPLICATE_THRESHOLD 的音效对，按块计算，几千个文件也很快
+
+只读取特征库，不解码音频；尚未分析的文件不在索引中。
+
+用法:
+    python similarity_index.py library-ambiance-60000.mp3
+    python similarity_index.py --duplicates [--threshold 0.97]
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import load_catalog_cached, iter_files
+from feature_store import get_feature_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+
+# 疑似重复的相似度阈值
+DUPLICATE_THRESHOLD = float(os.environ.get('SIMILARITY_DUPLICATE_THRESHOLD', '0.97'))
+# 计算两两相似度时每块的行数，限制临时矩阵大小
+BLOCK_ROWS = 1024
+
+
+class SimilarityIndex:
+    """嵌入向量矩阵，行与 names 同序"""
+
+    def __init__(self, names: List[str], vectors):
+        self.names = list(names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+
+        # 空索引无法推断维度
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(self.names), -1 if self.names else 0)
+        if len(matrix):
+            # 按维度标准化，避免少数数值范围大的维度主导相似度
+            matrix = (matrix - matrix.mean(axis=0)) / (matrix.std(axis=0) + 1e-6)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.matrix = matrix
+
+    @classmethod
+    def from_features(cls, features: Dict[str, Dict]) -> 'SimilarityIndex':
+        """由 {文件名: 特征} 构建，没有嵌入向量的文件跳过"""
+        items = [(name, f['embedding']) for name, f in features.items() if f and f.get('embedding')]
+        return cls([name for name, _ in items], [vector for _, vector in items])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.positions
+
+    def similar(self, name: str, k: int = 10) -> List[Tuple[str, float]]:
+        """与 name 最相似的 k 个音效: [(文件名, 余弦相似度), ...]"""
+        i = self.positions[name]
+        scores = self.matrix @ self.matrix[i]
+        scores[i] = -np.inf
+        k = min(k, len(self.names) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.names[j], round(float(scores[j]), 4)) for j in top]
+
+    def duplicates(self, threshold: float = DUPLICATE_THRESHOLD) -> List[Tuple[str, str, float]]:
+        """相似度不低于 threshold 的音效对，按相似度从高到低排列"""
+        pairs = []
+        n = len(self.names)
+        for start in range(0, n, BLOCK_ROWS):
+            stop = min(n, start + BLOCK_ROWS)
+            block = self.matrix[start:stop] @ self.matrix.T
+            rows, cols = np.nonzero(block >= threshold)
+            for r, j in zip(rows, cols):
+                i = start + r
+                if j > i:
+                    pairs.append((self.names[i], self.names[j], round(float(block[r, j]), 4)))
+        pairs.sort(key=lambda pair: -pair[2])
+        return pairs
+
+
+def library_features(data: Dict, audio_dir: str = AUDIO_DIR) -> Dict[str, Dict]:
+    """从特征库读取音效库中各文件的特征（完整分析优先），尚未分析的文件不包含在内"""
+    store = get_feature_store()
+    features = {}
+    for _, file_info in iter_files(data):
+        filename = file_info['filename']
+        path = os.path.join(audio_dir, filename)
+        if filename in features or not os.path.exists(path):
+            continue
+        found = store.get_any(store.content_hash(path))
+        if found is not None:
+            features[filename] = found
+    return features
+
+
+# (音效库版本, 特征库版本) -> 索引
+_index_cache: Tuple[Optional[Tuple[str, int]], Optional[SimilarityIndex]] = (None, None)
+_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """当前音效库的相似度索引，音效库变化或特征库中有新特征时重建"""
+    global _index_cache
+    catalog_version, data = load_catalog_cached()
+    version = (catalog_version, get_feature_store().version())
+    with _index_lock:
+        if _index_cache[0] != version:
+            _index_cache = (version, SimilarityIndex.from_features(library_features(data)))
+        return _index_cache[1]
+
+
+def similar_sounds(filename: str, k: int = 10) -> Optional[List[Dict]]:
+    """
+    与 filename 最相似的音效，附带分类和描述
+
+    Returns:
+        [{filename, score, category, description_zh}, ...]，文件不在索引中时返回 None
+    """
+    index = get_similarity_index()
+    if filename not in index:
+        return None
+
+    data = load_catalog_cached()[1]
+    info = {f['filename']: (category_id, f) for category_id, f in iter_files(data)}
+    results = []
+    for name, score in index.similar(filename, k):
+        category_id, file_info = info.get(name, (None, {}))
+        results.append({
+            'filename': name,
+            'score': score,
+            'category': category_id,
+            'description_zh': file_info.get('description_zh', ''),
+        })
+    return results
+
+
+def print_duplicates(pairs: List[Tuple[str, str, float]], threshold: float):
+    if not pairs:
+        print(f"✅ 没有相似度 ≥ {threshold} 的音效")
+        return
+    print(f"🔁 疑似重复（相似度 ≥ {threshold}）:")
+    for a, b, score in pairs:
+        print(f"   {score:.3f}  {a}  ↔  {b}")
+
+
+if __name__ == '__main__':
+    import sys
+
+    threshold = DUPLICATE_THRESHOLD
+    if '--threshold' in sys.argv:
+        threshold = float(sys.argv[sys.argv.index('--threshold') + 1])
+
+    index = get_similarity_index()
+    print(f"🧭 索引中共 {len(index)} 个音效")
+    if '--duplicates' in sys.argv:
+        print_duplicates(index.duplicates(threshold), threshold)
+    else:
+        for filename in [arg for arg in sys.argv[1:] if not arg.startswith('--')]:
+            results = similar_sounds(filename)
+            if results is None:
+                print(f"❌ {filename} 不在索引中（文件不存在或尚未分析）")
+                continue
+            print(f"🔍 {filename}")
+            for item in results:
+                print(f"   {item['score']:.3f}  [{item['category']}] {item['filename']} - {item['description_zh']}")
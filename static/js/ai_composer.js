@@ -12,6 +12,9 @@ class AIComposer {
         this.compositionBuffers = new Map();
         this.isPlaying = false;
         this.soundsData = null;
+        this.playbackStartTime = 0;
+        this.stopTimer = null;
+        this.trackScheduler = new TrackScheduler({ leadTime: 20 });
         
         // 分类图标映射
         this.categoryIcons = {
@@ -84,7 +87,7 @@ class AIComposer {
         
         // 重新生成
         document.getElementById('btnRegenerate').addEventListener('click', () => {
-            this.generate();
+            this.generate({ fresh: true });
         });
         
         // 重试
@@ -120,7 +123,7 @@ class AIComposer {
         });
     }
     
-    async generate() {
+    async generate({ fresh = false } = {}) {
         const sceneInput = document.getElementById('sceneInput');
         const scene = sceneInput.value.trim();
         
@@ -143,11 +146,13 @@ class AIComposer {
                 },
                 body: JSON.stringify({
                     scene: scene,
-                    auto_save: true
+                    auto_save: true,
+                    fresh: fresh,
+                    stream: true
                 })
             });
             
-            const result = await response.json();
+            const result = await this.readComposeStream(response);
             
             if (result.success) {
                 this.currentComposition = {
@@ -165,6 +170,50 @@ class AIComposer {
         }
     }
     
+    // 读取流式生成结果（NDJSON），边生成边绘制时间轴，返回最终结果
+    async readComposeStream(response) {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('application/x-ndjson') || !response.body) {
+            return response.json();
+        }
+        
+        const partial = { tracks: [] };
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                
+                if (event.type === 'draft') {
+                    // 本地规则作曲的即时草稿，LLM 开始输出后被替换
+                    if (event.result.success) {
+                        this.showPartial(event.result.composition);
+                    }
+                } else if (event.type === 'meta') {
+                    Object.assign(partial, event.composition);
+                    this.showPartial(partial);
+                } else if (event.type === 'track') {
+                    partial.tracks.push(event.track);
+                    this.showPartial(partial);
+                } else if (event.type === 'done') {
+                    return event.result;
+                }
+            }
+        }
+        
+        return { success: false, error: '生成中断，请重试' };
+    }
+    
     showLoading() {
         document.getElementById('loadingSection').style.display = 'block';
         document.getElementById('resultSection').style.display = 'none';
@@ -177,14 +226,44 @@ class AIComposer {
         document.getElementById('btnGenerate').disabled = false;
     }
     
+    // 生成过程中显示已完成的部分
+    showPartial(comp) {
+        document.getElementById('resultTitle').textContent = comp.name || 'AI 创作中...';
+        document.getElementById('resultDesc').textContent = comp.description || '';
+        
+        if (comp.duration) {
+            const durationMin = Math.floor(comp.duration / 60);
+            document.getElementById('resultDuration').textContent = `${durationMin}分钟`;
+            this.renderTimeline(comp);
+        }
+        document.getElementById('resultTracks').textContent = `${comp.tracks.length}个音轨`;
+        this.renderTracks(comp);
+        
+        // 生成完成前不能试听和保存
+        document.querySelector('.result-controls').style.visibility = 'hidden';
+        document.getElementById('resultSection').style.display = 'block';
+    }
+    
     showResult(result) {
         this.hideLoading();
+        document.querySelector('.result-controls').style.visibility = '';
         
         const comp = result.composition;
         
         // 更新标题和描述
         document.getElementById('resultTitle').textContent = comp.name || 'AI 创作';
-        document.getElementById('resultDesc').textContent = comp.description || '';
+        document.getElementById('resultDesc').textContent = result.fallback
+            ? `AI 暂时不可用，已使用本地规则生成：${comp.description || ''}`
+            : (comp.description || '');
+        
+        // 混音预测的警告（削波、过响、发闷、频带掩蔽等）
+        const warningList = document.getElementById('resultWarnings');
+        warningList.innerHTML = '';
+        (result.mix_warnings || []).forEach(warning => {
+            const item = document.createElement('li');
+            item.textContent = warning.message;
+            warningList.appendChild(item);
+        });
         
         // 更新元信息
         const durationMin = Math.floor(comp.duration / 60);
@@ -314,16 +393,14 @@ class AIComposer {
     // ============ 播放功能 ============
     
     initAudioContext() {
-        if (!this.audioContext) {
-            this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        // 使用共享加载模块的 AudioContext，解码结果可直接复用
+        this.audioContext = window.audioLoader.getContext();
+        
+        if (!this.masterGain) {
             this.masterGain = this.audioContext.createGain();
             this.masterGain.connect(this.audioContext.destination);
             this.masterGain.gain.value = 0.8;
         }
-        
-        if (this.audioContext.state === 'suspended') {
-            this.audioContext.resume();
-        }
     }
     
     async togglePlay() {
@@ -339,96 +416,76 @@ class AIComposer {
         
         this.initAudioContext();
         
-        // 预加载所有音频
-        await this.preloadAudio();
+        const comp = this.currentComposition;
         
-        // 开始播放
-        this.playComposition();
-    }
-    
-    async preloadAudio() {
-        const tracks = this.currentComposition.tracks;
-        const loadPromises = [];
+        // 开场音轨就绪即开始播放，其余音轨按开始时间提前预取
+        const started = await this.trackScheduler.start(comp.tracks, 0, {
+            load: (track) => this.loadTrackClip(track),
+            begin: () => {
+                this.playbackStartTime = this.audioContext.currentTime;
+            },
+            start: (track, buffer) => this.startTrack(track, buffer)
+        });
         
-        for (const track of tracks) {
-            if (!this.compositionBuffers.has(track.audio)) {
-                loadPromises.push(this.loadAudio(track.audio));
-            }
-        }
+        if (!started || this.currentComposition !== comp) return;
+        
+        this.isPlaying = true;
+        this.updatePlayButton();
         
-        await Promise.all(loadPromises);
+        // 设置自动停止
+        const duration = comp.duration * 1000;
+        this.stopTimer = setTimeout(() => {
+            if (this.isPlaying) {
+                this.stopPlayback();
+            }
+        }, duration);
     }
     
-    async loadAudio(filename) {
+    async loadTrackClip(track) {
+        const url = window.audioLoader.trackClipUrl(track, {
+            end: this.currentComposition.duration,
+            volume: 0.5
+        });
+        if (this.compositionBuffers.has(url)) {
+            return this.compositionBuffers.get(url);
+        }
+        
         try {
-            const response = await fetch(`/audio/${filename}`);
-            const arrayBuffer = await response.arrayBuffer();
-            const audioBuffer = await this.audioContext.decodeAudioData(arrayBuffer);
-            this.compositionBuffers.set(filename, audioBuffer);
+            const audioBuffer = await window.audioLoader.load(url);
+            this.compositionBuffers.set(url, audioBuffer);
             return audioBuffer;
         } catch (error) {
-            console.error(`加载音频失败: ${filename}`, error);
+            console.error(`加载音频失败: ${track.audio}`, error);
             return null;
         }
     }
     
-    playComposition() {
-        const comp = this.currentComposition;
+    startTrack(track, buffer) {
         const currentTime = this.audioContext.currentTime;
         
-        for (const track of comp.tracks) {
-            const buffer = this.compositionBuffers.get(track.audio);
-            if (!buffer) continue;
-            
-            const source = this.audioContext.createBufferSource();
-            const gainNode = this.audioContext.createGain();
-            
-            source.buffer = buffer;
-            source.loop = track.loop !== false;
-            
-            gainNode.gain.value = track.volume || 0.5;
-            
-            source.connect(gainNode);
-            gainNode.connect(this.masterGain);
-            
-            // 计算播放时间
-            const trackStart = track.start || 0;
-            const trackEnd = track.end || comp.duration;
-            const trackDuration = trackEnd - trackStart;
-            
-            const when = currentTime + trackStart;
-            
-            // 淡入
-            if (track.fade_in > 0) {
-                gainNode.gain.setValueAtTime(0, when);
-                gainNode.gain.linearRampToValueAtTime(track.volume || 0.5, when + track.fade_in);
-            }
-            
-            // 淡出
-            if (track.fade_out > 0) {
-                const fadeOutStart = when + trackDuration - track.fade_out;
-                gainNode.gain.setValueAtTime(track.volume || 0.5, fadeOutStart);
-                gainNode.gain.linearRampToValueAtTime(0, when + trackDuration);
-            }
-            
-            this.compositionSources.push({ source, gainNode });
-            
-            source.start(when, 0, trackDuration);
-        }
+        // 计算播放时间（后续音轨加载完成时可能已越过其开始时间）
+        const scheduledStart = this.playbackStartTime + (track.start || 0);
+        const when = Math.max(currentTime, scheduledStart);
+        const elapsed = when - scheduledStart;
+        if (elapsed >= buffer.duration) return;
         
-        this.isPlaying = true;
-        this.updatePlayButton();
+        // 片段已按音轨参数循环/裁剪并应用了淡入淡出和音量
+        const source = this.audioContext.createBufferSource();
+        const gainNode = this.audioContext.createGain();
         
-        // 设置自动停止
-        const duration = comp.duration * 1000;
-        setTimeout(() => {
-            if (this.isPlaying) {
-                this.stopPlayback();
-            }
-        }, duration);
+        source.buffer = buffer;
+        source.connect(gainNode);
+        gainNode.connect(this.masterGain);
+        
+        this.compositionSources.push({ source, gainNode });
+        
+        source.start(when, elapsed, buffer.duration - elapsed);
     }
     
     stopPlayback() {
+        this.trackScheduler.cancel();
+        clearTimeout(this.stopTimer);
+        
         for (const item of this.compositionSources) {
             try {
                 item.source.stop();
@@ -12,6 +12,13 @@ class WhiteNoiseMixer {
         this.isPlaying = false;
         this.soundsData = null;
         
+        // 服务端混音模式：低端设备不在浏览器解码，改为播放服务端混好的音频流
+        this.serverMix = this.shouldUseServerMix();
+        this.liveSessionId = null;
+        this.liveAudio = null;
+        this.liveSyncTimer = null;
+        this.masterVolume = 0.8;
+        
         // 组合播放相关
         this.compositions = [];
         this.currentComposition = null;
@@ -21,6 +28,7 @@ class WhiteNoiseMixer {
         this.compositionStartTime = 0;
         this.compositionPauseTime = 0;
         this.compositionUpdateInterval = null;
+        this.trackScheduler = new TrackScheduler({ leadTime: 20 });
         
         // 分类图标映射
         this.categoryIcons = {
@@ -243,37 +251,50 @@ class WhiteNoiseMixer {
         }
     }
     
+    shouldUseServerMix() {
+        // 可通过 ?mix=server / ?mix=client 强制指定
+        const mode = new URLSearchParams(window.location.search).get('mix');
+        if (mode) return mode === 'server';
+        
+        // 内存较小的设备默认使用服务端混音
+        return typeof navigator.deviceMemory === 'number' && navigator.deviceMemory <= 2;
+    }
+    
     initAudioContext() {
-        if (!this.audioContext) {
-            this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        // 使用共享加载模块的 AudioContext，解码结果可直接复用
+        this.audioContext = window.audioLoader.getContext();
+        
+        if (!this.masterGain) {
             this.masterGain = this.audioContext.createGain();
             this.masterGain.connect(this.audioContext.destination);
             this.masterGain.gain.value = 0.8;
         }
-        
-        if (this.audioContext.state === 'suspended') {
-            this.audioContext.resume();
-        }
     }
     
     async addTrack(filename) {
-        this.initAudioContext();
-        
         const soundInfo = this.sounds.get(filename);
         if (!soundInfo) return;
         
+        if (this.serverMix) {
+            this.activeTracks.set(filename, { info: soundInfo, volume: 0.7 });
+            this.updateMixerPanel();
+            this.updateCardState(filename, true);
+            this.syncLiveSession();
+            return;
+        }
+        
+        this.initAudioContext();
+        
         try {
-            // 加载音频
-            const response = await fetch(`/audio/${filename}`);
-            const arrayBuffer = await response.arrayBuffer();
-            const audioBuffer = await this.audioContext.decodeAudioData(arrayBuffer);
+            // 加载音频（长音频优先使用无缝循环片段）
+            const audioBuffer = await window.audioLoader.load(this.getMixerAudioUrl(soundInfo));
             
             // 创建音频节点
             const source = this.audioContext.createBufferSource();
             const gainNode = this.audioContext.createGain();
             
             source.buffer = audioBuffer;
-            source.loop = true;
+            this.setMixerLoop(source, soundInfo);
             gainNode.gain.value = 0.7;
             
             source.connect(gainNode);
@@ -301,9 +322,29 @@ class WhiteNoiseMixer {
         }
     }
     
+    getMixerAudioUrl(soundInfo) {
+        if (soundInfo.loop_clip) {
+            return `/loops/${soundInfo.loop_clip}`;
+        }
+        return `/audio/${soundInfo.filename}`;
+    }
+    
+    setMixerLoop(source, soundInfo) {
+        source.loop = true;
+        // 循环片段以元数据中的精确时长为循环终点，避开编码器末尾填充
+        if (soundInfo.loop_clip && soundInfo.loop_clip_seconds) {
+            source.loopStart = 0;
+            source.loopEnd = Math.min(soundInfo.loop_clip_seconds, source.buffer.duration);
+        }
+    }
+    
     removeTrack(filename) {
         const track = this.activeTracks.get(filename);
-        if (track) {
+        if (track && this.serverMix) {
+            this.activeTracks.delete(filename);
+            this.syncLiveSession();
+            if (this.activeTracks.size === 0) this.pause();
+        } else if (track) {
             try {
                 track.source.stop();
             } catch (e) {}
@@ -367,14 +408,22 @@ class WhiteNoiseMixer {
     
     setTrackVolume(filename, volume) {
         const track = this.activeTracks.get(filename);
-        if (track) {
-            track.volume = volume;
+        if (!track) return;
+        
+        track.volume = volume;
+        if (this.serverMix) {
+            this.syncLiveSession();
+        } else {
             track.gainNode.gain.setValueAtTime(volume, this.audioContext.currentTime);
         }
     }
     
     setMasterVolume(volume) {
-        if (this.masterGain) {
+        this.masterVolume = volume;
+        if (this.serverMix) {
+            // 主音量在本地 <audio> 上调节，无需往返服务端
+            if (this.liveAudio) this.liveAudio.volume = volume;
+        } else if (this.masterGain) {
             this.masterGain.gain.setValueAtTime(volume, this.audioContext.currentTime);
         }
     }
@@ -382,7 +431,7 @@ class WhiteNoiseMixer {
     togglePlay() {
         if (this.activeTracks.size === 0) return;
         
-        this.initAudioContext();
+        if (!this.serverMix) this.initAudioContext();
         
         if (this.isPlaying) {
             this.pause();
@@ -394,11 +443,16 @@ class WhiteNoiseMixer {
     play() {
         if (this.activeTracks.size === 0) return;
         
+        if (this.serverMix) {
+            this.playLiveStream();
+            return;
+        }
+        
         // 重新创建并启动所有音源
         for (const [filename, track] of this.activeTracks) {
             const newSource = this.audioContext.createBufferSource();
             newSource.buffer = track.buffer;
-            newSource.loop = true;
+            this.setMixerLoop(newSource, track.info);
             newSource.connect(track.gainNode);
             newSource.start();
             track.source = newSource;
@@ -409,10 +463,14 @@ class WhiteNoiseMixer {
     }
     
     pause() {
-        for (const [filename, track] of this.activeTracks) {
-            try {
-                track.source.stop();
-            } catch (e) {}
+        if (this.serverMix) {
+            this.stopLiveStream();
+        } else {
+            for (const [filename, track] of this.activeTracks) {
+                try {
+                    track.source.stop();
+                } catch (e) {}
+            }
         }
         
         this.isPlaying = false;
@@ -439,6 +497,82 @@ class WhiteNoiseMixer {
         }
     }
     
+    // =============== 服务端混音 ===============
+    
+    getLiveMixState() {
+        const tracks = [];
+        for (const [filename, track] of this.activeTracks) {
+            tracks.push({ audio: filename, volume: track.volume });
+        }
+        return { tracks };
+    }
+    
+    async ensureLiveSession() {
+        if (this.liveSessionId) return this.liveSessionId;
+        
+        const response = await fetch('/api/live', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(this.getLiveMixState())
+        });
+        const result = await response.json();
+        if (!result.success) throw new Error(result.error);
+        
+        this.liveSessionId = result.id;
+        return this.liveSessionId;
+    }
+    
+    syncLiveSession() {
+        if (!this.liveSessionId) return;
+        
+        // 拖动滑块时合并频繁的更新
+        clearTimeout(this.liveSyncTimer);
+        this.liveSyncTimer = setTimeout(async () => {
+            try {
+                const response = await fetch(`/api/live/${this.liveSessionId}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(this.getLiveMixState())
+                });
+                if (response.status === 404) {
+                    // 会话已过期，下次播放时重新创建
+                    this.liveSessionId = null;
+                }
+            } catch (error) {
+                console.error('同步混音状态失败:', error);
+            }
+        }, 50);
+    }
+    
+    async playLiveStream() {
+        try {
+            const sessionId = await this.ensureLiveSession();
+            
+            if (!this.liveAudio) {
+                this.liveAudio = new Audio();
+                this.liveAudio.preload = 'none';
+            }
+            this.liveAudio.volume = this.masterVolume;
+            this.liveAudio.src = `/api/live/${sessionId}/stream?t=${Date.now()}`;
+            await this.liveAudio.play();
+            
+            this.isPlaying = true;
+            this.updatePlayButton();
+        } catch (error) {
+            console.error('播放实时混音失败:', error);
+            this.liveSessionId = null;
+        }
+    }
+    
+    stopLiveStream() {
+        if (this.liveAudio) {
+            // 移除 src 以断开连接，服务端随之停止混音
+            this.liveAudio.pause();
+            this.liveAudio.removeAttribute('src');
+            this.liveAudio.load();
+        }
+    }
+    
     // =============== 组合播放功能 ===============
     
     async toggleComposition(compId) {
@@ -472,41 +606,26 @@ class WhiteNoiseMixer {
             // 显示迷你播放器
             this.showCompositionPlayer();
             
-            // 预加载音频
-            await this.preloadCompositionAudio();
-            
-            // 开始播放
-            this.playComposition();
+            // 开场音轨就绪即开始播放，其余音轨按需预取
+            await this.playComposition();
             
         } catch (error) {
             console.error('加载组合失败:', error);
         }
     }
     
-    async preloadCompositionAudio() {
-        this.initAudioContext();
-        
-        const tracks = this.currentComposition.tracks;
-        const loadPromises = [];
-        
-        for (const track of tracks) {
-            if (!this.compositionBuffers.has(track.audio)) {
-                loadPromises.push(this.loadCompositionAudio(track.audio));
-            }
+    async loadCompositionClip(track) {
+        const url = window.audioLoader.trackClipUrl(track, { end: this.currentComposition.duration });
+        if (this.compositionBuffers.has(url)) {
+            return this.compositionBuffers.get(url);
         }
         
-        await Promise.all(loadPromises);
-    }
-    
-    async loadCompositionAudio(filename) {
         try {
-            const response = await fetch(`/audio/${filename}`);
-            const arrayBuffer = await response.arrayBuffer();
-            const audioBuffer = await this.audioContext.decodeAudioData(arrayBuffer);
-            this.compositionBuffers.set(filename, audioBuffer);
+            const audioBuffer = await window.audioLoader.load(url);
+            this.compositionBuffers.set(url, audioBuffer);
             return audioBuffer;
         } catch (error) {
-            console.error(`加载音频失败: ${filename}`, error);
+            console.error(`加载音频失败: ${track.audio}`, error);
             return null;
         }
     }
@@ -542,79 +661,25 @@ class WhiteNoiseMixer {
         container.innerHTML = html;
     }
     
-    playComposition() {
+    async playComposition() {
         if (!this.currentComposition) return;
         
         this.initAudioContext();
         this.stopCompositionSources();
         
         const comp = this.currentComposition;
-        const currentTime = this.audioContext.currentTime;
         const offset = this.compositionPauseTime;
         
-        this.compositionStartTime = currentTime - offset;
+        const started = await this.trackScheduler.start(comp.tracks, offset, {
+            load: (track) => this.loadCompositionClip(track),
+            begin: () => {
+                this.compositionStartTime = this.audioContext.currentTime - offset;
+            },
+            start: (track, buffer) => this.startCompositionTrack(track, buffer)
+        });
         
-        // 为每个音轨创建音源
-        for (const track of comp.tracks) {
-            const buffer = this.compositionBuffers.get(track.audio);
-            if (!buffer) continue;
-            
-            const trackStart = track.start;
-            const trackEnd = track.end;
-            const trackDuration = trackEnd - trackStart;
-            
-            if (offset >= trackEnd) continue;
-            
-            const source = this.audioContext.createBufferSource();
-            const gainNode = this.audioContext.createGain();
-            
-            source.buffer = buffer;
-            source.loop = track.loop !== false;
-            
-            gainNode.gain.value = track.volume || 1;
-            
-            source.connect(gainNode);
-            gainNode.connect(this.masterGain);
-            
-            let when = currentTime;
-            let startOffset = 0;
-            let duration = trackDuration;
-            
-            if (offset < trackStart) {
-                when = currentTime + (trackStart - offset);
-            } else if (offset < trackEnd) {
-                const elapsed = offset - trackStart;
-                if (track.loop !== false) {
-                    startOffset = elapsed % buffer.duration;
-                } else {
-                    startOffset = Math.min(elapsed, buffer.duration);
-                }
-                duration = trackEnd - offset;
-            }
-            
-            // 淡入淡出
-            if (track.fade_in > 0 && offset <= trackStart) {
-                gainNode.gain.setValueAtTime(0, when);
-                gainNode.gain.linearRampToValueAtTime(track.volume || 1, when + track.fade_in);
-            }
-            
-            if (track.fade_out > 0) {
-                const fadeOutStart = when + duration - track.fade_out;
-                if (fadeOutStart > currentTime) {
-                    gainNode.gain.setValueAtTime(track.volume || 1, fadeOutStart);
-                    gainNode.gain.linearRampToValueAtTime(0, when + duration);
-                }
-            }
-            
-            this.compositionSources.push({ source, gainNode, track, when, duration });
-            
-            if (track.loop !== false && duration > buffer.duration) {
-                source.start(when, startOffset);
-                source.stop(when + duration);
-            } else {
-                source.start(when, startOffset, duration);
-            }
-        }
+        // 加载期间被暂停、停止或切换了组合
+        if (!started || this.currentComposition !== comp) return;
         
         this.compositionPlaying = true;
         this.updateCompositionPlayButton();
@@ -622,6 +687,30 @@ class WhiteNoiseMixer {
         this.renderCompositionsShowcase();
     }
     
+    startCompositionTrack(track, buffer) {
+        const currentTime = this.audioContext.currentTime;
+        // 当前时间轴位置（后续音轨加载完成时可能已经越过其开始时间）
+        const offset = currentTime - this.compositionStartTime;
+        
+        // 片段已按音轨参数循环/裁剪并应用了淡入淡出和音量，只需在时间轴上定位
+        const elapsed = Math.max(0, offset - track.start);
+        if (offset >= track.end || elapsed >= buffer.duration) return;
+        
+        const when = currentTime + Math.max(0, track.start - offset);
+        const duration = buffer.duration - elapsed;
+        
+        const source = this.audioContext.createBufferSource();
+        const gainNode = this.audioContext.createGain();
+        
+        source.buffer = buffer;
+        source.connect(gainNode);
+        gainNode.connect(this.masterGain);
+        
+        this.compositionSources.push({ source, gainNode, track, when, duration });
+        
+        source.start(when, elapsed, duration);
+    }
+    
     pauseComposition() {
         if (!this.compositionPlaying) return;
         
@@ -670,6 +759,7 @@ class WhiteNoiseMixer {
     }
     
     stopCompositionSources() {
+        this.trackScheduler.cancel();
         for (const item of this.compositionSources) {
             try {
                 item.source.stop();
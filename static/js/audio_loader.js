@@ -0,0 +1,171 @@
+/**
+ * WhiteNoise Audio Loader - 跨页面共享的音频加载模块
+ *
+ * - 编码后的音频保存在 Cache API 中，在 /、/composer、/ai 之间切换或刷新页面时不再重复下载
+ * - 缓存按总字节数做 LRU 淘汰，索引保存在 localStorage
+ * - 带 ETag 的缓存条目（如音轨片段）使用前向服务端重新验证，源文件替换后不会读到旧内容
+ * - 同一地址的并发加载只发起一次请求，每个页面最多解码一次
+ */
+
+class AudioLoader {
+    constructor(options = {}) {
+        this.cacheName = options.cacheName || 'whitenoise-audio-v1';
+        this.maxBytes = options.maxBytes || 300 * 1024 * 1024;
+        this.indexKey = `${this.cacheName}:index`;
+
+        this.audioContext = null;
+        this.decoded = new Map();   // url -> Promise<AudioBuffer>
+        this.fetching = new Map();  // url -> Promise<ArrayBuffer>
+        this.cacheAvailable = typeof caches !== 'undefined';
+    }
+
+    // 页面内共享的 AudioContext
+    getContext() {
+        if (!this.audioContext) {
+            this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        }
+
+        if (this.audioContext.state === 'suspended') {
+            this.audioContext.resume();
+        }
+
+        return this.audioContext;
+    }
+
+    // 加载并解码音频，返回 AudioBuffer
+    load(url) {
+        if (!this.decoded.has(url)) {
+            const promise = this.fetchBytes(url)
+                .then(bytes => this.getContext().decodeAudioData(bytes))
+                .catch(error => {
+                    // 失败的加载不缓存，允许重试
+                    this.decoded.delete(url);
+                    throw error;
+                });
+            this.decoded.set(url, promise);
+        }
+        return this.decoded.get(url);
+    }
+
+    // 音轨实际发声片段的地址：服务端已循环/裁剪到 end - start，并应用淡入淡出和音量
+    trackClipUrl(track, defaults = {}) {
+        const params = new URLSearchParams({
+            start: track.start ?? 0,
+            end: track.end ?? defaults.end,
+            volume: track.volume ?? defaults.volume ?? 1,
+            fade_in: track.fade_in ?? 0,
+            fade_out: track.fade_out ?? 0,
+            loop: track.loop !== false
+        });
+        return `/api/clip/${encodeURIComponent(track.audio)}?${params}`;
+    }
+
+    // 释放已解码的音频（不影响持久缓存）
+    release(url) {
+        this.decoded.delete(url);
+    }
+
+    // 获取编码后的音频数据，优先读取持久缓存
+    fetchBytes(url) {
+        if (!this.fetching.has(url)) {
+            const promise = this.fetchBytesUncached(url).finally(() => {
+                this.fetching.delete(url);
+            });
+            this.fetching.set(url, promise);
+        }
+        return this.fetching.get(url);
+    }
+
+    async fetchBytesUncached(url) {
+        if (!this.cacheAvailable) {
+            return this.download(url);
+        }
+
+        try {
+            const cache = await caches.open(this.cacheName);
+            const cached = await cache.match(url);
+            const etag = cached && cached.headers.get('ETag');
+            if (cached && !etag) {
+                this.touch(url);
+                return await cached.arrayBuffer();
+            }
+
+            let response = null;
+            try {
+                response = await fetch(url, etag ? { headers: { 'If-None-Match': etag } } : {});
+            } catch (error) {
+                // 服务端不可达时使用已缓存的内容
+                if (!cached) throw error;
+            }
+            if (cached && (!response || response.status === 304)) {
+                this.touch(url);
+                return await cached.arrayBuffer();
+            }
+            if (!response.ok) {
+                throw new Error(`${response.status} ${response.statusText}`);
+            }
+
+            const bytes = await response.clone().arrayBuffer();
+            await cache.put(url, response);
+            this.touch(url, bytes.byteLength);
+            await this.evict(cache);
+            return bytes;
+        } catch (error) {
+            // Cache API 不可用（如非安全上下文、存储已满）时直接下载
+            if (error instanceof TypeError || error.name === 'QuotaExceededError' || error.name === 'SecurityError') {
+                return this.download(url);
+            }
+            throw error;
+        }
+    }
+
+    async download(url) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`${response.status} ${response.statusText}`);
+        }
+        return response.arrayBuffer();
+    }
+
+    // ============ LRU 索引 ============
+
+    readIndex() {
+        try {
+            return JSON.parse(localStorage.getItem(this.indexKey) || '{}');
+        } catch {
+            return {};
+        }
+    }
+
+    writeIndex(index) {
+        try {
+            localStorage.setItem(this.indexKey, JSON.stringify(index));
+        } catch (e) {}
+    }
+
+    touch(url, size) {
+        const index = this.readIndex();
+        const entry = index[url] || { size: 0 };
+        if (size !== undefined) entry.size = size;
+        entry.used = Date.now();
+        index[url] = entry;
+        this.writeIndex(index);
+    }
+
+    async evict(cache) {
+        const index = this.readIndex();
+        const entries = Object.entries(index).sort((a, b) => a[1].used - b[1].used);
+        let total = entries.reduce((sum, [, entry]) => sum + entry.size, 0);
+
+        for (const [url, entry] of entries) {
+            if (total <= this.maxBytes) break;
+            await cache.delete(url);
+            delete index[url];
+            total -= entry.size;
+        }
+
+        this.writeIndex(index);
+    }
+}
+
+window.audioLoader = new AudioLoader();
@@ -191,16 +191,14 @@ class CompositionPlayer {
     }
     
     initAudioContext() {
-        if (!this.audioContext) {
-            this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        // 使用共享加载模块的 AudioContext，解码结果可直接复用
+        this.audioContext = window.audioLoader.getContext();
+        
+        if (!this.masterGain) {
             this.masterGain = this.audioContext.createGain();
             this.masterGain.connect(this.audioContext.destination);
             this.masterGain.gain.value = 0.8;
         }
-        
-        if (this.audioContext.state === 'suspended') {
-            this.audioContext.resume();
-        }
     }
     
     async loadAndPlay(id) {
@@ -235,27 +233,28 @@ class CompositionPlayer {
     async preloadAudio() {
         this.initAudioContext();
         
-        const tracks = this.currentComposition.tracks;
-        const loadPromises = [];
-        
-        for (const track of tracks) {
-            if (!this.audioBuffers.has(track.audio)) {
-                loadPromises.push(this.loadAudio(track.audio));
-            }
-        }
+        // 只下载每个音轨实际发声的片段
+        const loadPromises = this.currentComposition.tracks.map(track => this.loadTrackClip(track));
         
         await Promise.all(loadPromises);
     }
     
-    async loadAudio(filename) {
+    clipUrl(track) {
+        return window.audioLoader.trackClipUrl(track, { end: this.currentComposition.duration });
+    }
+    
+    async loadTrackClip(track) {
+        const url = this.clipUrl(track);
+        if (this.audioBuffers.has(url)) {
+            return this.audioBuffers.get(url);
+        }
+        
         try {
-            const response = await fetch(`/audio/${filename}`);
-            const arrayBuffer = await response.arrayBuffer();
-            const audioBuffer = await this.audioContext.decodeAudioData(arrayBuffer);
-            this.audioBuffers.set(filename, audioBuffer);
+            const audioBuffer = await window.audioLoader.load(url);
+            this.audioBuffers.set(url, audioBuffer);
             return audioBuffer;
         } catch (error) {
-            console.error(`加载音频失败: ${filename}`, error);
+            console.error(`加载音频失败: ${track.audio}`, error);
             return null;
         }
     }
@@ -379,63 +378,26 @@ class CompositionPlayer {
         
         // 为每个音轨创建音源
         for (const track of comp.tracks) {
-            const buffer = this.audioBuffers.get(track.audio);
+            const buffer = this.audioBuffers.get(this.clipUrl(track));
             if (!buffer) continue;
             
-            // 计算音轨时间范围
-            const trackStart = track.start;
-            const trackEnd = track.end;
-            const trackDuration = trackEnd - trackStart;
+            // 片段已按音轨参数循环/裁剪并应用了淡入淡出和音量，只需在时间轴上定位
+            const elapsed = Math.max(0, offset - track.start);
             
             // 如果当前播放位置已经超过这个音轨的结束时间，跳过
-            if (offset >= trackEnd) continue;
+            if (offset >= track.end || elapsed >= buffer.duration) continue;
+            
+            const when = currentTime + Math.max(0, track.start - offset);  // 什么时候开始播放
+            const duration = buffer.duration - elapsed;                     // 播放多长时间
             
             // 创建音源
             const source = this.audioContext.createBufferSource();
             const gainNode = this.audioContext.createGain();
             
             source.buffer = buffer;
-            source.loop = track.loop !== false;
-            
-            // 设置音量
-            gainNode.gain.value = track.volume;
-            
             source.connect(gainNode);
             gainNode.connect(this.masterGain);
             
-            // 计算播放参数
-            let when = currentTime;  // 什么时候开始播放
-            let startOffset = 0;     // 从音频的什么位置开始
-            let duration = trackDuration;  // 播放多长时间
-            
-            if (offset < trackStart) {
-                // 还没到这个音轨的开始时间
-                when = currentTime + (trackStart - offset);
-            } else if (offset < trackEnd) {
-                // 已经在这个音轨的播放范围内
-                const elapsed = offset - trackStart;
-                if (track.loop !== false) {
-                    startOffset = elapsed % buffer.duration;
-                } else {
-                    startOffset = Math.min(elapsed, buffer.duration);
-                }
-                duration = trackEnd - offset;
-            }
-            
-            // 应用淡入淡出
-            if (track.fade_in > 0 && offset <= trackStart) {
-                gainNode.gain.setValueAtTime(0, when);
-                gainNode.gain.linearRampToValueAtTime(track.volume, when + track.fade_in);
-            }
-            
-            if (track.fade_out > 0) {
-                const fadeOutStart = when + duration - track.fade_out;
-                if (fadeOutStart > currentTime) {
-                    gainNode.gain.setValueAtTime(track.volume, fadeOutStart);
-                    gainNode.gain.linearRampToValueAtTime(0, when + duration);
-                }
-            }
-            
             // 存储音源信息
             this.activeSources.push({
                 source,
@@ -446,12 +408,7 @@ class CompositionPlayer {
             });
             
             // 开始播放
-            if (track.loop !== false && duration > buffer.duration) {
-                source.start(when, startOffset);
-                source.stop(when + duration);
-            } else {
-                source.start(when, startOffset, duration);
-            }
+            source.start(when, elapsed, duration);
         }
         
         this.isPlaying = true;
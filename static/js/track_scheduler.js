@@ -0,0 +1,68 @@
+/**
+ * WhiteNoise Track Scheduler - 组合播放的按需加载调度
+ *
+ * 只等待播放位置处已在发声的音轨加载完成就开始播放，
+ * 其余音轨按开始时间排序，在需要之前 leadTime 秒才开始下载和解码。
+ * 首次出声时间只取决于开场的音轨，而不是整个组合。
+ */
+
+class TrackScheduler {
+    constructor(options = {}) {
+        this.leadTime = options.leadTime ?? 20;  // 预取提前量（秒）
+        this.timers = [];
+        this.generation = 0;
+    }
+
+    /**
+     * 从时间轴 offset 处开始调度
+     *
+     * @param {Array} tracks 音轨列表（含 start / end）
+     * @param {number} offset 起始播放位置（秒）
+     * @param {Object} callbacks
+     *   load(track)          -> Promise<AudioBuffer|null>
+     *   begin()              开场音轨就绪、即将开始播放时调用，用于设定时钟
+     *   start(track, buffer) 启动单个音轨
+     * @returns {Promise<boolean>} 调度期间被取消时返回 false
+     */
+    async start(tracks, offset, { load, begin, start }) {
+        this.cancel();
+        const generation = this.generation;
+
+        const pending = tracks
+            .filter(track => (track.end ?? Infinity) > offset)
+            .sort((a, b) => (a.start || 0) - (b.start || 0));
+        const opening = pending.filter(track => (track.start || 0) <= offset);
+        const later = pending.filter(track => (track.start || 0) > offset);
+
+        // 等待开场音轨
+        const loaded = await Promise.all(opening.map(async track => [track, await load(track)]));
+        if (generation !== this.generation) return false;
+
+        begin();
+        for (const [track, buffer] of loaded) {
+            if (buffer) start(track, buffer);
+        }
+
+        // 后续音轨按开始时间提前预取，加载完成后立即排入播放
+        for (const track of later) {
+            const delay = Math.max(0, track.start - offset - this.leadTime) * 1000;
+            const timer = setTimeout(async () => {
+                const buffer = await load(track);
+                if (generation !== this.generation || !buffer) return;
+                start(track, buffer);
+            }, delay);
+            this.timers.push(timer);
+        }
+
+        return true;
+    }
+
+    // 取消尚未触发的预取，并让进行中的加载结果失效
+    cancel() {
+        this.generation++;
+        for (const timer of this.timers) {
+            clearTimeout(timer);
+        }
+        this.timers = [];
+    }
+}
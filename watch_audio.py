@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Watch Audio - 监视音效目录，增量更新音效库
+
+定时轮询 pixabay/ 目录，只处理有变化的文件：
+
+- 新增文件：分析后加入 audio_descriptions.yaml。analyze_audio.py 中有描述的按其分类和描述加入，
+  其余按文件名检索（catalog_index）或频谱最相似的音效（similarity_index）推测分类，描述待补充
+- 修改的文件：重新读取特征并更新时长、音量和响度
+- 删除的文件：从音效库中移除（监视期间消失的文件；--prune 时启动时也移除文件已不存在的条目）
+
+特征从 feature_store 读取，内容未变的文件不会重新解码；YAML 原子写回。
+首次轮询前从特征库恢复已处理的文件状态，重启后音效库中已有、且自上次分析后未变化的文件
+不会逐个重新哈希和分析。
+服务端按元数据文件的版本重新加载音效库，检索索引、提示词和相似度索引随之重建，无需重启。
+
+用法:
+    python watch_audio.py                 # 持续监视
+    python watch_audio.py --once          # 只同步一次
+    python watch_audio.py --interval 10 --fast --prune
+
+设置 AUDIO_WATCH=1 时，server.py / server_asgi.py 在后台线程中运行监视。
+"""
+
+import os
+import re
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from analyze_audio import AUDIO_DESCRIPTIONS, CATEGORIES
+from catalog import AUDIO_DESC_PATH, load_catalog, save_catalog, iter_files
+from catalog_index import CatalogIndex
+from feature_store import get_feature_store
+from rescan_audio import get_audio_info, header_info, apply_info
+from similarity_index import SimilarityIndex, library_features
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_DIR = os.path.join(BASE_DIR, 'pixabay')
+
+# 服务端是否在后台线程中监视音效目录
+WATCH_ENABLED = os.environ.get('AUDIO_WATCH', '0') == '1'
+# 轮询间隔（秒）
+WATCH_INTERVAL = float(os.environ.get('AUDIO_WATCH_INTERVAL', '5'))
+# 修改时间距今不足此秒数的文件视为仍在写入，下次轮询再处理
+SETTLE_SECONDS = 2.0
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.ogg', '.m4a')
+
+# 推测分类：参与投票的最相关音效数，文件名检索的得分达到 TEXT_MATCH_SCORE 才采用
+CATEGORY_VOTES = 5
+TEXT_MATCH_SCORE = 0.2
+FALLBACK_CATEGORY = 'miscellaneous'
+
+# 同一目录下多个监视进程（多 worker 部署）之间互斥写入音效库
+LOCK_NAME = '.catalog.lock'
+
+
+def scan_audio_dir(audio_dir: str) -> Dict[str, Tuple[int, int]]:
+    """目录中的音频文件: 文件名 -> (大小, 修改时间 ns)"""
+    files = {}
+    with os.scandir(audio_dir) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def describe_filename(filename: str) -> str:
+    """由文件名生成英文描述，如 forest-ambience-296528.mp3 -> Forest ambience"""
+    stem = os.path.splitext(filename)[0]
+    words = [w for w in re.split(r'[-_\s]+', stem) if w and not w.isdigit()]
+    return ' '.join(words).capitalize() or stem
+
+
+def guess_category(data: Dict, filename: str, features: Optional[Dict]) -> str:
+    """推测新文件的分类：文件名与已有音效的文本相关度，其次是频谱相似度"""
+    votes = Counter()
+    index = CatalogIndex(data)
+    for score, category_id, _ in index.search(describe_filename(filename), CATEGORY_VOTES):
+        votes[category_id] += score
+    if votes and max(votes.values()) >= TEXT_MATCH_SCORE:
+        return votes.most_common(1)[0][0]
+
+    if features and features.get('embedding'):
+        library = library_features(data)
+        library[filename] = features
+        similarity = SimilarityIndex.from_features(library)
+        category_of = {f['filename']: c for c, f in iter_files(data)}
+        votes = Counter()
+        for name, score in similarity.similar(filename, CATEGORY_VOTES):
+            if name in category_of:
+                votes[category_of[name]] += max(score, 0.0)
+        if votes and max(votes.values()) > 0:
+            return votes.most_common(1)[0][0]
+
+    return FALLBACK_CATEGORY
+
+
+def new_entry(filename: str, info: Dict) -> Dict:
+    """新文件的音效库条目"""
+    known = AUDIO_DESCRIPTIONS.get(filename)
+    entry = {
+        'filename': filename,
+        'description_zh': known['zh'] if known else '待补充描述',
+        'description_en': known['en'] if known else describe_filename(filename),
+        'scene': known['scene'] if known else '待确定',
+    }
+    apply_info(entry, info)
+    return entry
+
+
+@contextmanager
+def _catalog_lock(catalog_path: str):
+    if fcntl is None:
+        yield
+        return
+    lock_path = os.path.join(os.path.dirname(os.path.abspath(catalog_path)), LOCK_NAME)
+    with open(lock_path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def update_catalog(infos: Dict[str, Tuple[Dict, Optional[Dict]]], removed: List[str],
+                   catalog_path: str = AUDIO_DESC_PATH,
+                   present: Optional[set] = None) -> Dict[str, int]:
+    """
+    把变化写入音效库
+
+    Args:
+        infos: 文件名 -> (get_audio_info 的结果, 特征)
+        removed: 要移除的文件名
+        present: 目录中现有的文件名；给出时同时移除文件已不存在的条目
+
+    Returns:
+        {'added': n, 'updated': n, 'removed': n}
+    """
+    stats = {'added': 0, 'updated': 0, 'removed': 0}
+    with _catalog_lock(catalog_path):
+        # 写入前重新读取，不覆盖其他工具在此期间的修改
+        data = load_catalog(catalog_path)
+        categories = data.setdefault('categories', {})
+
+        removed = set(removed)
+        for category_id in list(categories):
+            files = categories[category_id].get('files', [])
+            kept = [f for f in files if f.get('filename') not in removed
+                    and (present is None or f.get('filename') in present)]
+            if len(kept) != len(files):
+                stats['removed'] += len(files) - len(kept)
+                categories[category_id]['files'] = kept
+                if not kept:
+                    del categories[category_id]
+
+        entries: Dict[str, List[Dict]] = {}
+        for _, file_info in iter_files(data):
+            entries.setdefault(file_info['filename'], []).append(file_info)
+
+        for filename, (info, features) in infos.items():
+            if filename in entries:
+                # 同一文件可能出现在多个分类中
+                if any([apply_info(entry, info) for entry in entries[filename]]):
+                    stats['updated'] += 1
+                continue
+
+            known = AUDIO_DESCRIPTIONS.get(filename)
+            category_id = known['category'] if known else guess_category(data, filename, features)
+            if category_id not in categories:
+                names = CATEGORIES.get(category_id, {'zh': category_id, 'en': category_id})
+                categories[category_id] = {'name_zh': names['zh'], 'name_en': names['en'], 'files': []}
+            categories[category_id]['files'].append(new_entry(filename, info))
+            stats['added'] += 1
+            print(f"  ➕ {filename} -> {category_id}")
+
+        if any(stats.values()):
+            if 'metadata' in data:
+                data['metadata']['total_files'] = len({f['filename'] for _, f in iter_files(data)})
+            save_catalog(data, catalog_path)
+    return stats
+
+
+class AudioWatcher:
+    """轮询音效目录，把新增、修改和删除的文件同步到音效库"""
+
+    def __init__(self, audio_dir: str = AUDIO_DIR, catalog_path: str = AUDIO_DESC_PATH,
+                 interval: float = WATCH_INTERVAL, fast: bool = False, prune: bool = False):
+        self.audio_dir = audio_dir
+        self.catalog_path = catalog_path
+        self.interval = interval
+        self.analyzer = 'fast' if fast else 'full'
+        # 已有完整分析结果时，抽样模式也优先使用
+        self.analyzers = ('full', 'fast') if fast else ('full',)
+        self.prune = prune
+        # 已处理的文件状态: 文件名 -> (大小, 修改时间 ns)
+        self.known: Dict[str, Tuple[int, int]] = {}
+        self._first = True
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _features(self, path: str) -> Optional[Dict]:
+        store = get_feature_store()
+        try:
+            found = store.get_any(store.content_hash(path), self.analyzers)
+            return found if found is not None else store.features(path, self.analyzer)
+        except Exception as e:
+            print(f"  ⚠️  {os.path.basename(path)} - 解码失败: {e}")
+            return None
+
+    def _seed_known(self, current: Dict[str, Tuple[int, int]]):
+        """
+        首次轮询前恢复已处理的文件状态：音效库中已有条目、已有特征，且大小和修改时间
+        与特征库记忆的一致的文件视为已处理；其余文件（包括音效库中缺失的）照常处理
+        """
+        try:
+            listed = {f['filename'] for _, f in iter_files(load_catalog(self.catalog_path))}
+        except OSError:
+            return
+        analyzed = get_feature_store().analyzed_files(self.analyzers)
+        for name, stat in current.items():
+            path = os.path.realpath(os.path.join(self.audio_dir, name))
+            if name in listed and analyzed.get(path) == stat:
+                self.known[name] = stat
+
+    def poll(self) -> Dict[str, int]:
+        """检查一次目录并同步，返回 {'added', 'updated', 'removed'}"""
+        current = scan_audio_dir(self.audio_dir)
+        if self._first:
+            self._seed_known(current)
+        now_ns = time.time_ns()
+        settled = [
+            name for name, stat in current.items()
+            if self.known.get(name) != stat and now_ns - stat[1] >= SETTLE_SECONDS * 1e9
+        ]
+        removed = [name for name in self.known if name not in current]
+        prune = self.prune and self._first
+        self._first = False
+        if not settled and not removed and not prune:
+            return {'added': 0, 'updated': 0, 'removed': 0}
+
+        infos = {}
+        for name in settled:
+            path = os.path.join(self.audio_dir, name)
+            features = self._features(path)
+            # 解码失败时只用文件头的信息，文件再次变化前不重试
+            info = get_audio_info(path, features) if features is not None else header_info(path)
+            if info['duration_seconds'] is not None:
+                infos[name] = (info, features)
+            self.known[name] = current[name]
+        for name in removed:
+            del self.known[name]
+
+        stats = update_catalog(infos, removed, self.catalog_path, set(current) if prune else None)
+        if any(stats.values()):
+            print(f"🔄 音效库已更新: 新增 {stats['added']}，更新 {stats['updated']}，移除 {stats['removed']}")
+        return stats
+
+    def run(self):
+        """持续轮询，直到 stop()"""
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️  音效目录监视出错: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> 'AudioWatcher':
+        self._thread = threading.Thread(target=self.run, name='audio-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+
+_watcher: Optional[AudioWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def start_watcher() -> AudioWatcher:
+    """在后台线程中监视音效目录（进程内只启动一个）"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = AudioWatcher().start()
+            print(f"👀 监视音效目录: {_watcher.audio_dir}（每 {_watcher.interval:g} 秒）")
+        return _watcher
+
+
+def stop_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+if __name__ == '__main__':
+    import sys
+
+    interval = WATCH_INTERVAL
+    if '--interval' in sys.argv:
+        interval = float(sys.argv[sys.argv.index('--interval') + 1])
+
+    watcher = AudioWatcher(interval=interval, fast='--fast' in sys.argv, prune='--prune' in sys.argv)
+    print("👀 音效目录监视")
+    print(f"   YAML: {watcher.catalog_path}")
+    print(f"   音频目录: {watcher.audio_dir}")
+
+    if '--once' in sys.argv:
+        stats = watcher.poll()
+        print(f"✅ 同步完成: 新增 {stats['added']}，更新 {stats['updated']}，移除 {stats['removed']}")
+    else:
+        print(f"   每 {interval:g} 秒检查一次，按 Ctrl+C 停止\n")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass